@@ -2,11 +2,18 @@
 
 Markdown to HTML CLI using bundled Pandoc (pypandoc-binary) with CSS style management via from2to.
 """
-from importlib.metadata import version, PackageNotFoundError
 
-try:
-    __version__ = version("2html")
-except PackageNotFoundError:  # pragma: no cover
-    __version__ = "0.0.0"
+
+def __getattr__(name: str):
+    # importlib.metadata is slow to import, so resolve the version on first access
+    if name == "__version__":
+        from importlib.metadata import version, PackageNotFoundError
+
+        try:
+            return version("2html")
+        except PackageNotFoundError:  # pragma: no cover
+            return "0.0.0"
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = ["__version__"]
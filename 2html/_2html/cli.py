@@ -3,78 +3,122 @@ import sys
 from pathlib import Path
 from typing import Iterable, Optional
 
-from rich_argparse import RichHelpFormatter
-
-from from2to import style_utils as su
-from from2to import convert as conv
+# the rest is imported where needed, so --help and --list-styles stay fast
+# (see 2to/scripts/bench_startup.py)
 from from2to import cli_common as cc
-
-
-def compute_output_path(input_md: Path, output: Optional[str]) -> Path:
-    if output:
-        return Path(output)
-    return input_md.with_suffix(".html")
+from from2to import constants
+from from2to import style_utils as su
 
 
 def parse_args(argv: Optional[Iterable[str]] = None) -> argparse.Namespace:
+    from rich_argparse import RichHelpFormatter
+
     p = argparse.ArgumentParser(
         prog="2html",
-        description="Convert Markdown to HTML using bundled pandoc, with CSS style management.",
+        description="Convert Markdown to HTML using bundled pandoc, with CSS style management. Run '2html --site SRC DST' to build a site incrementally.",
         formatter_class=RichHelpFormatter,
     )
-    p.add_argument("input", help="Path to input Markdown file")
-    p.add_argument("-o", "--output", help="Output HTML path (default: input, but with .html extension)")
+    p.add_argument("input", nargs="*", help="Input Markdown file(s), directories or glob patterns ('-' reads stdin)")
+    p.add_argument("-o", "--output", help="Output HTML path, or output directory for multiple inputs or with a trailing / (default: input, but with .html extension)")
     p.add_argument("-b", "--browse", action="store_true", help="Open the HTML file in a browser after conversion")
+    p.add_argument(
+        "--css-mode",
+        choices=("inline", "link"),
+        default="inline",
+        help="Embed the style in every page, or write one content-hashed stylesheet next to the outputs and link it (default: %(default)s)",
+    )
+    p.add_argument("--site", action="store_true", help="Build a site incrementally: 2html --site SRC DST (see 2html --site --help)")
     cc.add_common_args(p)
     args = p.parse_args(argv)
     args = cc.post_parse_args(args)
     return args
 
 
-def main(argv: Optional[Iterable[str]] = None) -> int:
-    args = parse_args(argv)
+def parse_build_args(argv: Iterable[str]) -> argparse.Namespace:
+    from rich_argparse import RichHelpFormatter
 
-    if args.list_styles:
-        return cc.list_styles_command(args)
+    from from2to import site
 
-    input_md = Path(args.input)
-    if not input_md.is_file():
-        print(f"Input file not found: {input_md}", file=sys.stderr)
-        return 2
-
-    cache_dir = Path(args.cache_dir) if args.cache_dir else None
-
-    try:
-        css_text, css_path = su.resolve_style(args.style, cache_dir=cache_dir, no_cache=args.no_cache)
-    except Exception as e:
-        print(str(e), file=sys.stderr)
-        return 2
-
-    # Convert MD -> HTML
-    html = conv.convert_markdown_to_html(
-        input_md,
-        pandoc_args=args.pandoc_arg,
-        title=args.title or input_md.stem,
-        toc=args.toc,
+    p = argparse.ArgumentParser(
+        prog="2html --site",
+        description="Convert a directory tree of Markdown into a site, rebuilding only the pages whose Markdown, images, pandoc includes or style changed.",
+        formatter_class=RichHelpFormatter,
     )
-
-    # Inject CSS inline
-    html = su.inject_css(html, css_text)
-
-    if args.stdout:
-        sys.stdout.write(html)
-        return 0
-
-    out_path = compute_output_path(input_md, args.output)
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_text(html, encoding="utf-8")
-    print(f"Wrote: {out_path}")
+    p.add_argument("src", help="Source directory")
+    p.add_argument("dst", help=f"Output directory; the build database is kept in it as {site.DB_NAME}")
+    p.add_argument("-s", "--style", default=None, help=f"CSS style name, path, or URL (default: {su.DEFAULT_STYLE})")
+    p.add_argument(
+        "--css-mode",
+        choices=("inline", "link"),
+        default="link",
+        help="Embed the style in every page, or write one content-hashed stylesheet into the output directory and link it (default: %(default)s)",
+    )
+    p.add_argument("--compile-css", action="store_true", help="Minify the style (cached per style)")
+    p.add_argument("--prune-css", action="store_true", help="Inline only the rules each page can use (needs --css-mode inline)")
+    p.add_argument("--toc", action="store_true", help="Enable table of contents via pandoc")
+    p.add_argument("--pandoc-arg", action="append", nargs="+", default=[], help="Extra pandoc arg(s) (repeatable); files they name are tracked")
+    p.add_argument("--pandoc-backend", choices=constants.PANDOC_BACKENDS, default=None, help="Run pandoc once per file or keep a warm pandoc worker process")
+    p.add_argument("-j", "--jobs", type=int, default=1, help="Number of worker processes (0: one per CPU, default: 1)")
+    p.add_argument("--force", action="store_true", help="Rebuild every page")
+    p.add_argument("--cache-dir", help="Override cache directory")
+    p.add_argument("--no-cache", action="store_true", help="Do not cache downloaded URL styles; keep them in memory only")
+    p.add_argument("--style-ttl", type=float, default=None, metavar="SECONDS", help="Revalidate cached URL styles older than this")
+    # what convert_one and the shared helpers read
+    p.set_defaults(title=None, to=None, stdout=False, browse=False, watch=False, conversion_cache=False, timings=None, profile=None)
+    return cc.post_parse_args(p.parse_args(list(argv)))
+
+
+def convert_one(input_md: Path, out_path: Optional[Path], args: argparse.Namespace, css_text: str) -> None:
+    from from2to import batch
+    from from2to import convert as conv
+    from from2to import targets
+    from from2to import timings
+
+    title = cc.default_title(args, input_md)
+    head = targets.html_head(args, css_text, out_path)
+
+    if head is not None and out_path is not None and not batch.is_stdin(input_md) and args.pandoc_backend != "worker":
+        # Stream MD -> HTML into the file, splicing the style in at </head>
+        # (one stage: pandoc's output is written as it arrives)
+        with timings.stage("pandoc"):
+            conv.stream_markdown_to_html(input_md, out_path, pandoc_args=args.pandoc_arg, title=title, toc=args.toc, head=head)
+    else:
+        # Convert MD -> HTML
+        with timings.stage("pandoc"):
+            html = conv.convert_markdown_to_html(
+                input_md,
+                pandoc_args=args.pandoc_arg,
+                title=title,
+                toc=args.toc,
+                backend=args.pandoc_backend,
+                text=cc.read_markdown(input_md),
+            )
+        # Add the style to the head and write
+        targets.write_html(html, input_md, out_path, args, css_text)
+        if out_path is None:
+            return
 
     if args.browse:
         import webbrowser
         webbrowser.open(out_path.absolute().as_uri())
 
-    return 0
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    argv = list(argv) if argv is not None else sys.argv[1:]
+    options = argv[: argv.index("--")] if "--" in argv else argv
+    if "--site" in options:
+        # 2html --site SRC DST: incremental site build
+        from from2to import site
+
+        argv.remove("--site")
+        return site.build(parse_build_args(argv), convert_one)
+
+    args = parse_args(argv)
+
+    if args.list_styles:
+        return cc.list_styles_command(args)
+
+    return cc.run_conversions(args, convert_one, ".html", css_target="html")
 
 
 if __name__ == "__main__":
@@ -3,11 +3,18 @@
 Markdown to PDF CLI using Pandoc (bundled via pypandoc-binary) and xhtml2pdf,
 with CSS style management and download caching.
 """
-from importlib.metadata import version, PackageNotFoundError
 
-try:
-    __version__ = version("2pdf")
-except PackageNotFoundError:  # pragma: no cover - during local dev without install
-    __version__ = "0.0.0"
+
+def __getattr__(name: str):
+    # importlib.metadata is slow to import, so resolve the version on first access
+    if name == "__version__":
+        from importlib.metadata import version, PackageNotFoundError
+
+        try:
+            return version("2pdf")
+        except PackageNotFoundError:  # pragma: no cover - during local dev without install
+            return "0.0.0"
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = ["__version__"]
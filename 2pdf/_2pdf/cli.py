@@ -1,119 +1,110 @@
 import argparse
-import io
 import sys
 from pathlib import Path
 from typing import Iterable, Optional
 
-
-from rich_argparse import RichHelpFormatter
-from xhtml2pdf import pisa
-
-from from2to import style_utils as su
-from from2to import convert as conv
+# the rest is imported where needed, so --help and --list-styles stay fast
+# (see 2to/scripts/bench_startup.py)
 from from2to import cli_common as cc
-
-
-def link_callback(uri: str, rel: str) -> str:
-    """Convert HTML URIs to absolute file paths for xhtml2pdf."""
-    # If already absolute file path
-    p = Path(uri)
-    if p.exists():
-        return str(p)
-
-    # file:// URI
-    if uri.startswith("file://"):
-        return uri[7:]
-
-    # Relative resource path to current working directory
-    rp = Path(rel).parent / uri
-    if rp.exists():
-        return str(rp)
-
-    # Last resort: return original
-    return uri
-
-
-def html_to_pdf_bytes(html: str, base_path: Path) -> bytes:
-    # Ensure that relative resources resolve relative to base_path
-    # xhtml2pdf uses pisa.CreatePDF; provide link_callback for images/fonts
-    result = io.BytesIO()
-    pisa_status = pisa.CreatePDF(  # type: ignore
-        src=html,
-        dest=result,
-        link_callback=lambda uri, rel: link_callback(uri, str(base_path)),
-        encoding="utf-8",
-    )
-    if pisa_status.err:
-        raise RuntimeError("PDF generation failed")
-    return result.getvalue()
-
-
-def compute_output_path(input_md: Path, output: Optional[str]) -> Path:
-    if output:
-        return Path(output)
-    return input_md.with_suffix(".pdf")
+from from2to import constants
 
 
 def parse_args(argv: Optional[Iterable[str]] = None) -> argparse.Namespace:
+    from rich_argparse import RichHelpFormatter
+
     p = argparse.ArgumentParser(
         prog="2pdf",
         description="Convert Markdown to PDF using bundled pandoc and xhtml2pdf, with CSS style management.",
         formatter_class=RichHelpFormatter,
     )
-    p.add_argument("input", help="Path to input Markdown file")
-    p.add_argument("-o", "--output", help="Output PDF path (default: same as input with .pdf)")
+    p.add_argument("input", nargs="*", help="Input Markdown file(s), directories or glob patterns ('-' reads stdin)")
+    p.add_argument("-o", "--output", help="Output PDF path, or output directory for multiple inputs or with a trailing / (default: same as input with .pdf)")
+    p.add_argument(
+        "--engine",
+        choices=constants.PDF_ENGINES,
+        default=constants.DEFAULT_PDF_ENGINE,
+        help="PDF renderer: xhtml2pdf renders the styled HTML in-process; pandoc needs an external pdf engine (e.g. LaTeX) and ignores the style (default: %(default)s)",
+    )
+    p.add_argument(
+        "--image-dpi",
+        type=int,
+        default=None,
+        metavar="DPI",
+        help="Downscale raster images wider than the page at this resolution before embedding them (xhtml2pdf engine; e.g. 150)",
+    )
+    p.add_argument(
+        "--subset-fonts",
+        action="store_true",
+        help="Embed only the glyphs each document uses from the style's TrueType fonts; subsets are cached (xhtml2pdf engine; needs fontTools)",
+    )
+    p.add_argument(
+        "--render-jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Render long documents in N processes, split at top-level sections that each start a new page (xhtml2pdf engine; 0 = one per CPU; default: %(default)s)",
+    )
     cc.add_common_args(p)
     args = p.parse_args(argv)
     args = cc.post_parse_args(args)
     return args
 
 
+def convert_one(input_md: Path, out_path: Optional[Path], args: argparse.Namespace, css_text: str) -> None:
+    from from2to import convert as conv
+    from from2to import targets
+    from from2to import timings
+
+    text = cc.read_markdown(input_md)
+    title = cc.default_title(args, input_md)
+
+    if args.engine == "pandoc":
+        assert out_path is not None, "the pandoc engine cannot write to stdout"
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        with timings.stage("pandoc"):
+            conv.convert_markdown_to_pdf(
+                input_md,
+                pandoc_args=args.pandoc_arg,
+                title=title,
+                toc=args.toc,
+                text=text,
+                outputfile=str(out_path),
+            )
+        return
+
+    # Convert MD -> HTML
+    with timings.stage("pandoc"):
+        html = conv.convert_markdown_to_html(
+            input_md,
+            pandoc_args=args.pandoc_arg,
+            title=title,
+            toc=args.toc,
+            backend=args.pandoc_backend,
+            text=text,
+        )
+
+    # Add the style, render and write
+    targets.write_pdf(html, input_md, out_path, args, css_text)
+
+
 def main(argv: Optional[Iterable[str]] = None) -> int:
     args = parse_args(argv)
 
     if args.list_styles:
         return cc.list_styles_command(args)
 
-    input_md = Path(args.input)
-    if not input_md.is_file():
-        print(f"Input file not found: {input_md}", file=sys.stderr)
+    if args.engine == "pandoc" and (args.stdout or (args.input == ["-"] and not args.output)):
+        print("Writing to stdout requires the xhtml2pdf engine", file=sys.stderr)
         return 2
 
-    cache_dir = Path(args.cache_dir) if args.cache_dir else None
-
-    try:
-        css_text, css_path = su.resolve_style(args.style, cache_dir=cache_dir, no_cache=args.no_cache)
-    except Exception as e:
-        print(str(e), file=sys.stderr)
-        return 2
-
-    # Convert MD -> HTML
-    html = conv.convert_markdown_to_html(
-        input_md,
-        pandoc_args=args.pandoc_arg,
-        title=args.title or input_md.stem,
-        toc=args.toc,
-    )
-
-    # Inject CSS inline
-    html = su.inject_css(html, css_text)
-
-    # Produce PDF
-    if args.stdout:
-        raise NotImplementedError("stdout output not yet implemented")
-
-    out_path = compute_output_path(input_md, args.output)
-    out_path.parent.mkdir(parents=True, exist_ok=True)
+    if args.subset_fonts:
+        from from2to import fonts
 
-    try:
-        #pdf_bytes = html_to_pdf_bytes(html, base_path=input_md.resolve())
-        conv.convert_markdown_to_pdf(input_md, outputfile=str(out_path))
-    except Exception as e:
-        print(f"Error during PDF generation: {e}", file=sys.stderr)
-        return 1
+        if not fonts.available():
+            print("--subset-fonts needs fontTools (pip install fonttools); fonts are embedded whole", file=sys.stderr)
 
-    print(f"Wrote: {out_path}")
-    return 0
+    # the pandoc engine ignores the style
+    return cc.run_conversions(args, convert_one, ".pdf", css_target=None if args.engine == "pandoc" else "pdf")
 
 
 if __name__ == "__main__":
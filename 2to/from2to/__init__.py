@@ -2,11 +2,23 @@
 
 Shared utilities for style management, caching, and common CLI helpers.
 """
-from importlib.metadata import version, PackageNotFoundError
 
-try:
-    __version__ = version("from2to")
-except PackageNotFoundError:  # pragma: no cover
-    __version__ = "0.0.0"
 
-__all__ = ["__version__"]
+def __getattr__(name: str):
+    # importlib.metadata is slow to import, so resolve the version on first access
+    if name == "__version__":
+        from importlib.metadata import version, PackageNotFoundError
+
+        try:
+            return version("from2to")
+        except PackageNotFoundError:  # pragma: no cover
+            return "0.0.0"
+    if name == "Converter":
+        # keep ``import from2to`` light for the CLIs
+        from .converter import Converter
+
+        return Converter
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ["Converter", "__version__"]
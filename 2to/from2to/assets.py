@@ -0,0 +1,212 @@
+"""Asset stage for PDF rendering.
+
+xhtml2pdf asks its link callback for every image and font reference while it
+lays the document out, and fetches remote URLs itself, one at a time.
+``AssetResolver`` resolves each distinct reference once, downloads remote
+assets concurrently into the cache directory before rendering and can
+downscale large raster images to the resolution they are printed at.
+"""
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import io
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Optional
+from urllib.parse import urlparse
+
+from . import fonts
+from . import url_cache
+from . import constants
+from .style_utils import is_url
+
+CACHE_SUBDIR = constants.ASSET_SUBDIR
+SCALED_SUBDIR = constants.SCALED_SUBDIR
+# Concurrent downloads / image resizes
+DEFAULT_JOBS = 8
+# Widest supported page (US Letter, 8.5in); A4 is 8.27in
+PAGE_WIDTH_IN = 8.5
+# Lower resolutions could make an image narrower than the text column
+MIN_IMAGE_DPI = 96
+RASTER_SUFFIXES = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tif", ".tiff", ".webp")
+# What refused references resolve to: xhtml2pdf skips the empty image or font
+BLOCKED = "data:,"
+
+_SRC_RE = re.compile(r"""\bsrc\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+_URL_RE = re.compile(r"""\burl\(\s*(?:"([^"]*)"|'([^']*)'|([^)\s]*))\s*\)""", re.IGNORECASE)
+
+
+def references(html: str) -> List[str]:
+    """Image and font references of ``html`` (``src`` attributes and CSS ``url()``), de-duplicated."""
+    found = [m.group(1) for m in _SRC_RE.finditer(html)]
+    found += [next(g for g in m.groups() if g is not None) for m in _URL_RE.finditer(html)]
+    return [ref for ref in dict.fromkeys(r.strip() for r in found) if ref]
+
+
+class AssetResolver:
+    """Resolve references for xhtml2pdf's ``link_callback``, once per distinct URI.
+
+    Local references are looked up like ``pdf.link_callback`` does. Remote ones
+    are downloaded into ``<cache_dir>/assets`` (revalidated after ``ttl``), and
+    with ``image_dpi`` raster images wider than a page at that resolution are
+    replaced by scaled copies. With ``font_chars`` TrueType fonts are replaced
+    by subsets with the glyphs of those characters. Without a cache directory
+    remote assets are left to xhtml2pdf and images and fonts are used as they are.
+
+    ``roots`` is for untrusted documents: nothing is downloaded, only files
+    below those directories are read and every other reference resolves to
+    ``BLOCKED``.
+    """
+
+    def __init__(
+        self,
+        base_dir: Path,
+        cache_dir: Optional[Path] = None,
+        *,
+        ttl: Optional[float] = None,
+        image_dpi: Optional[int] = None,
+        font_chars: Optional[FrozenSet[str]] = None,
+        roots: Optional[Iterable[Path]] = None,
+        jobs: int = DEFAULT_JOBS,
+    ) -> None:
+        self.base_dir = Path(base_dir)
+        self.cache_dir = Path(cache_dir) / CACHE_SUBDIR if cache_dir is not None else None
+        self.ttl = url_cache.DEFAULT_TTL if ttl is None else ttl
+        self.image_dpi = max(image_dpi, MIN_IMAGE_DPI) if image_dpi else None
+        self.font_chars = font_chars
+        self.roots = tuple(Path(r).resolve() for r in roots) if roots is not None else None
+        self.jobs = jobs
+        self._resolved: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # picklable for parallel rendering; resolved references come along
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def prefetch(self, uris: Iterable[str]) -> None:
+        """Resolve ``uris`` concurrently, downloading and scaling as needed."""
+        with self._lock:
+            todo = [u for u in dict.fromkeys(uris) if u not in self._resolved]
+        if not todo:
+            return
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=min(self.jobs, len(todo))) as pool:
+            resolved = list(pool.map(self._resolve, todo))
+        with self._lock:
+            self._resolved.update(zip(todo, resolved))
+
+    def resolve(self, uri: str) -> str:
+        with self._lock:
+            hit = self._resolved.get(uri)
+        if hit is None:
+            hit = self._resolve(uri)
+            with self._lock:
+                self._resolved[uri] = hit
+        return hit
+
+    def link_callback(self, uri: str, rel: str) -> str:
+        return self.resolve(uri)
+
+    def _resolve(self, uri: str) -> str:
+        path = self._locate(uri)
+        if self.roots is not None and not uri.startswith("data:"):
+            if path is None or not any(_is_within(path.resolve(), root) for root in self.roots):
+                return BLOCKED
+        if path is None:
+            return uri
+        if self.image_dpi and path.suffix.lower() in RASTER_SUFFIXES:
+            path = self._scaled(path)
+        elif self.font_chars is not None and path.suffix.lower() in fonts.SUBSET_SUFFIXES:
+            path = self._subset(path)
+        return str(path)
+
+    def _locate(self, uri: str) -> Optional[Path]:
+        if uri.startswith("data:"):
+            return None
+        if is_url(uri):
+            if self.cache_dir is None or self.roots is not None:
+                return None
+            try:
+                return url_cache.fetch(uri, self.cache_dir, ttl=self.ttl, suffix=Path(urlparse(uri).path).suffix.lower())
+            except Exception:
+                # let xhtml2pdf report the broken reference
+                return None
+        p = Path(uri)
+        if p.exists():
+            return p
+        if uri.startswith("file://"):
+            return Path(uri[7:])
+        rp = self.base_dir / uri
+        if rp.exists():
+            return rp
+        return None
+
+    def _scaled(self, path: Path) -> Path:
+        """A copy of the image at ``image_dpi`` across the page width, if that is smaller."""
+        if self.cache_dir is None or self.image_dpi is None:
+            return path
+        max_px = int(PAGE_WIDTH_IN * self.image_dpi)
+        try:
+            st = path.stat()
+        except OSError:
+            return path
+        key = hashlib.sha256(f"{path.resolve()}\0{st.st_mtime_ns}\0{st.st_size}\0{max_px}".encode("utf-8")).hexdigest()[:24]
+        out = self.cache_dir / SCALED_SUBDIR / f"{key}{path.suffix.lower()}"
+        if not out.is_file():
+            try:
+                data = _downscale(path, max_px)
+            except Exception:
+                # unreadable images are left to xhtml2pdf
+                return path
+            # an empty entry remembers that the original is small enough
+            out.parent.mkdir(parents=True, exist_ok=True)
+            url_cache.atomic_write(out, data if data is not None and len(data) < st.st_size else b"")
+        else:
+            # the mtime records the last access for cache eviction
+            with contextlib.suppress(OSError):
+                os.utime(out)
+        return out if out.stat().st_size else path
+
+    def _subset(self, path: Path) -> Path:
+        """The font subset to ``font_chars``, for fonts xhtml2pdf may read (see ``pdf._resource_policy``)."""
+        if self.cache_dir is None or self.font_chars is None:
+            return path
+        resolved = path.resolve()
+        readable = self.roots if self.roots is not None else (Path.cwd().resolve(),)
+        if not any(_is_within(resolved, root) for root in (*readable, self.cache_dir.resolve())):
+            return path
+        return fonts.subset_font(path, self.font_chars, self.cache_dir)
+
+
+def _is_within(path: Path, root: Path) -> bool:
+    try:
+        path.relative_to(root)
+    except ValueError:
+        return False
+    return True
+
+
+def _downscale(path: Path, max_px: int) -> Optional[bytes]:
+    from PIL import Image  # installed with xhtml2pdf
+
+    with Image.open(path) as im:
+        if im.width <= max_px or getattr(im, "is_animated", False):
+            return None
+        fmt = im.format
+        small = im.resize((max_px, max(1, round(im.height * max_px / im.width))), Image.LANCZOS)
+        buf = io.BytesIO()
+        if fmt == "JPEG":
+            small.save(buf, format=fmt, quality=90, optimize=True)
+        else:
+            small.save(buf, format=fmt, optimize=True)
+        return buf.getvalue()
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import glob
+import os
+import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterable, List, Optional, Sequence, Tuple
+
+from . import timings
+
+if TYPE_CHECKING:
+    from .conversion_cache import ConversionCache
+
+MARKDOWN_SUFFIXES = (".md", ".markdown")
+GLOB_CHARS = "*?["
+# Input name that reads Markdown from stdin
+STDIN = "-"
+
+# (input path, base directory used to mirror the tree under an output directory)
+InputSpec = Tuple[Path, Path]
+# (input path, output path or None for stdout)
+Task = Tuple[Path, Optional[Path]]
+# worker(input_md, out_path, args, css_text) -> the files it wrote, or None for just out_path
+Worker = Callable[[Path, Optional[Path], argparse.Namespace, str], Optional[List[Path]]]
+
+
+def is_stdin(path: Path) -> bool:
+    return str(path) == STDIN
+
+
+def is_glob(spec: str) -> bool:
+    return any(c in spec for c in GLOB_CHARS) and not Path(spec).exists()
+
+
+def _glob_root(pattern: str) -> Path:
+    parts: List[str] = []
+    for part in Path(pattern).parts:
+        if any(c in part for c in GLOB_CHARS):
+            break
+        parts.append(part)
+    return Path(*parts) if parts else Path(".")
+
+
+def expand_inputs(specs: Iterable[str], suffixes: Sequence[str] = MARKDOWN_SUFFIXES) -> List[InputSpec]:
+    """Expand files, directories and glob patterns into a de-duplicated input list.
+
+    Directories are searched recursively for files with one of ``suffixes``.
+    Paths that do not exist are kept so that they get reported per file.
+    """
+    found: List[InputSpec] = []
+    seen = set()
+
+    def add(path: Path, base: Path) -> None:
+        key = os.path.normcase(os.path.abspath(path))
+        if key not in seen:
+            seen.add(key)
+            found.append((path, base))
+
+    for spec in specs:
+        p = Path(spec)
+        if p.is_dir():
+            for child in sorted(p.rglob("*")):
+                if child.is_file() and child.suffix.lower() in suffixes:
+                    add(child, p)
+        elif is_glob(spec):
+            root = _glob_root(spec)
+            for match in sorted(glob.glob(spec, recursive=True)):
+                mp = Path(match)
+                if mp.is_file():
+                    add(mp, root)
+        else:
+            add(p, p.parent)
+    return found
+
+
+def plan_tasks(
+    inputs: Sequence[InputSpec],
+    output: Optional[str],
+    suffix: str,
+    *,
+    force_dir: bool = False,
+) -> List[Task]:
+    """Map inputs to output paths.
+
+    A single input with ``output`` writes exactly there, unless ``output`` ends
+    with a path separator or is an existing directory. Otherwise ``output`` is
+    treated as a directory that mirrors each input relative to its base.
+    """
+    is_dir = output is not None and (output.endswith(("/", os.sep)) or Path(output).is_dir())
+    if output and len(inputs) == 1 and not force_dir and not is_dir:
+        return [(inputs[0][0], Path(output))]
+    tasks: List[Task] = []
+    for path, base in inputs:
+        if output:
+            try:
+                rel = path.relative_to(base)
+            except ValueError:
+                rel = Path(path.name)
+            tasks.append((path, Path(output) / rel.with_suffix(suffix)))
+        else:
+            tasks.append((path, path.with_suffix(suffix)))
+    return tasks
+
+
+# (exit status, error message, elapsed seconds, cache hit: True/False, None if not cached,
+#  the files written (none if a cached output was already in place), stage timings)
+Result = Tuple[int, str, float, Optional[bool], List[Path], List[timings.StageTiming]]
+
+
+def _written(outputs: Optional[List[Path]], out_path: Optional[Path]) -> List[Path]:
+    if outputs is not None:
+        return outputs
+    return [out_path] if out_path is not None else []
+
+
+def _convert_cached(
+    worker: Worker,
+    input_md: Path,
+    out_path: Path,
+    args: argparse.Namespace,
+    css_text: str,
+    cache: ConversionCache,
+) -> Tuple[bool, List[Path]]:
+    """Returns whether the cache had the output and the files written."""
+    suffix = out_path.suffix
+    key = cache.key(input_md, args, css_text, suffix, out_path)
+    entry = cache.lookup(key, suffix)
+    if entry is not None:
+        return True, [out_path] if cache.place(entry, out_path) else []
+    outputs = worker(input_md, out_path, args, css_text)
+    cache.store(key, suffix, out_path)
+    return False, _written(outputs, out_path)
+
+
+def _run_one(
+    worker: Worker,
+    task: Task,
+    args: argparse.Namespace,
+    css_text: str,
+    cache: Optional[ConversionCache] = None,
+    record: bool = False,
+) -> Result:
+    input_md, out_path = task
+    start = time.perf_counter()
+    if not is_stdin(input_md) and not input_md.is_file():
+        return (2, f"Input file not found: {input_md}", time.perf_counter() - start, None, [], [])
+    hit = None
+    written: List[Path] = []
+    # stages are handed back to the parent, which may be another process
+    with timings.collect() if record else contextlib.nullcontext([]) as stages:
+        try:
+            if cache is not None and out_path is not None and not is_stdin(input_md):
+                hit, written = _convert_cached(worker, input_md, out_path, args, css_text, cache)
+            else:
+                written = _written(worker(input_md, out_path, args, css_text), out_path)
+        except Exception as e:
+            return (1, f"Error converting {input_md}: {e}", time.perf_counter() - start, hit, written, stages)
+    return (0, "", time.perf_counter() - start, hit, written, stages)
+
+
+def resolve_jobs(jobs: Optional[int]) -> int:
+    if not jobs or jobs < 1:
+        return os.cpu_count() or 1
+    return jobs
+
+
+def run_batch(
+    tasks: Sequence[Task],
+    worker: Worker,
+    args: argparse.Namespace,
+    css_text: str,
+    *,
+    jobs: int = 1,
+    cache: Optional[ConversionCache] = None,
+    on_result: Optional[Callable[[Task, int], None]] = None,
+) -> int:
+    """Run ``worker`` over all tasks, reporting each file and a throughput summary.
+
+    With a ``cache``, unchanged documents are served from it and the cache is
+    pruned to its size limit at the end of the run. ``on_result`` is called
+    with every task and its exit status as it finishes.
+
+    Returns the highest per-file exit status (0 when every file succeeded).
+    """
+    start = time.perf_counter()
+    statuses: List[int] = []
+    hits: List[Optional[bool]] = []
+    # only time stages when someone listens (--timings)
+    record = timings.active()
+
+    def report(task: Task, result: Result) -> None:
+        status, message, _elapsed, hit, written, stages = result
+        statuses.append(status)
+        hits.append(hit)
+        if on_result is not None:
+            on_result(task, status)
+        for t in stages:
+            timings.emit(t._replace(file=str(task[0])))
+        if status:
+            print(message, file=sys.stderr)
+        elif written:
+            for path in written:
+                print(f"Wrote: {path}")
+        elif task[1] is not None:
+            print(f"Unchanged: {task[1]}")
+
+    if jobs > 1 and len(tasks) > 1:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as pool:
+            futures = {pool.submit(_run_one, worker, task, args, css_text, cache, record): task for task in tasks}
+            for fut in as_completed(futures):
+                report(futures[fut], fut.result())
+    else:
+        for task in tasks:
+            report(task, _run_one(worker, task, args, css_text, cache, record))
+
+    elapsed = time.perf_counter() - start
+    if len(tasks) > 1:
+        ok = statuses.count(0)
+        rate = len(tasks) / elapsed if elapsed > 0 else float("inf")
+        print(f"Converted {ok}/{len(tasks)} files in {elapsed:.2f}s ({rate:.1f} files/s)")
+    if cache is not None:
+        evicted = cache.prune()
+        print(
+            f"Conversion cache: {hits.count(True)} hits, {hits.count(False)} misses"
+            + (f", evicted {evicted} entries" if evicted else ""),
+            file=sys.stderr,
+        )
+    return max(statuses, default=0)
@@ -0,0 +1,253 @@
+"""Index and eviction for everything stored in the from2to cache directory.
+
+The cache holds downloaded URL styles (``*.css`` plus ``.json``/``.lock``
+sidecars), remote PDF assets, scaled images and font subsets (``assets/``),
+compiled stylesheets (``compiled-css/``), parsed documents (``ast/``) and
+conversion outputs (``conversions/``). An entry's last access is the newest
+mtime of its files: conversion, parsed document, compiled CSS, scaled image and
+font subset entries are touched on every hit and
+downloads touch their sidecar whenever they are resolved.
+"""
+from __future__ import annotations
+
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+
+from .constants import ASSET_SUBDIR as ASSET_CACHE_SUBDIR
+from .constants import AST_SUBDIR as AST_CACHE_SUBDIR
+from .constants import CONVERSION_SUBDIR as CACHE_SUBDIR
+from .constants import CSS_SUBDIR as CSS_CACHE_SUBDIR
+from .constants import FONT_SUBDIR, LOCK_SUFFIX, META_SUFFIX, SCALED_SUBDIR
+from .url_cache import remove_unused_lock
+
+# Automatic eviction budget, checked at the end of every conversion run
+MAX_SIZE_ENV = "FROM2TO_CACHE_MAX_SIZE"
+MAX_AGE_ENV = "FROM2TO_CACHE_MAX_AGE"
+
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}
+_SIZE_RE = re.compile(r"\s*(\d+(?:\.\d*)?|\.\d+)\s*(?:([KMG])I?)?B?\s*")
+_AGE_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+# "VARIABLE=value" settings already reported as invalid, so --watch warns once
+_warned: Set[str] = set()
+
+
+class CacheEntry(NamedTuple):
+    kind: str  # "style", "asset", "css", "ast" or "conversion"
+    files: List[Path]
+    size: int
+    last_access: float
+
+
+def parse_size(text: str) -> int:
+    """Parse sizes like ``500M``, ``500MiB``, ``2GB`` or ``1024`` (bytes); units are binary."""
+    m = _SIZE_RE.fullmatch(text.upper())
+    if m is None:
+        raise ValueError(f"invalid size: {text!r}")
+    return int(float(m.group(1)) * _SIZE_UNITS[m.group(2) or ""])
+
+
+def parse_age(text: str) -> float:
+    """Parse ages like ``7d``, ``12h``, ``30m`` or ``3600`` (seconds)."""
+    t = text.strip()
+    unit = t[-1] if t and t[-1] in _AGE_UNITS else ""
+    return float(t[: len(t) - len(unit)]) * _AGE_UNITS[unit]
+
+
+def format_size(n: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GiB"
+
+
+def _entry(kind: str, files: List[Path]) -> Optional[CacheEntry]:
+    size = 0
+    last = 0.0
+    existing = []
+    for f in files:
+        try:
+            st = f.stat()
+        except OSError:
+            continue
+        existing.append(f)
+        size += st.st_size
+        last = max(last, st.st_mtime)
+    if not existing:
+        return None
+    return CacheEntry(kind, existing, size, last)
+
+
+def scan(cache_dir: Path) -> List[CacheEntry]:
+    """Return all cache entries, least recently used first."""
+    entries: List[CacheEntry] = []
+    if cache_dir.is_dir():
+        for css in cache_dir.glob("*.css"):
+            e = _entry("style", [css, css.with_name(css.name + META_SUFFIX)])
+            if e is not None:
+                entries.append(e)
+        asset_root = cache_dir / ASSET_CACHE_SUBDIR
+        if asset_root.is_dir():
+            for p in asset_root.iterdir():
+                if p.is_file() and not p.name.endswith((META_SUFFIX, LOCK_SUFFIX, ".tmp")):
+                    e = _entry("asset", [p, p.with_name(p.name + META_SUFFIX)])
+                    if e is not None:
+                        entries.append(e)
+            for subdir in (SCALED_SUBDIR, FONT_SUBDIR):
+                for p in (asset_root / subdir).glob("*"):
+                    if p.is_file() and not p.name.endswith(".tmp"):
+                        e = _entry("asset", [p])
+                        if e is not None:
+                            entries.append(e)
+        css_root = cache_dir / CSS_CACHE_SUBDIR
+        if css_root.is_dir():
+            for p in css_root.glob("*.css"):
+                e = _entry("css", [p])
+                if e is not None:
+                    entries.append(e)
+        ast_root = cache_dir / AST_CACHE_SUBDIR
+        if ast_root.is_dir():
+            for p in ast_root.glob("*/*.json"):
+                e = _entry("ast", [p])
+                if e is not None:
+                    entries.append(e)
+        conv_root = cache_dir / CACHE_SUBDIR
+        if conv_root.is_dir():
+            for p in conv_root.glob("*/*"):
+                if p.is_file() and not p.name.startswith(".tmp-"):
+                    e = _entry("conversion", [p])
+                    if e is not None:
+                        entries.append(e)
+    entries.sort(key=lambda e: e.last_access)
+    return entries
+
+
+def _remove(entry: CacheEntry, errors: List[str]) -> bool:
+    ok = True
+    for f in entry.files:
+        try:
+            f.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            errors.append(f"{f}: {e}")
+            ok = False
+    return ok
+
+
+def _lock_files(cache_dir: Path) -> List[Path]:
+    return list(cache_dir.glob(f"*{LOCK_SUFFIX}")) + list((cache_dir / ASSET_CACHE_SUBDIR).glob(f"*{LOCK_SUFFIX}"))
+
+
+def _prune_locks(cache_dir: Path, errors: List[str]) -> int:
+    """Remove the URL lock files whose download is gone, unless one is in use."""
+    removed = 0
+    for lock in _lock_files(cache_dir):
+        if lock.with_name(lock.name[: -len(LOCK_SUFFIX)]).exists():
+            continue
+        try:
+            if remove_unused_lock(lock):
+                removed += 1
+        except OSError as e:
+            errors.append(f"{lock}: {e}")
+    return removed
+
+
+def prune(
+    cache_dir: Path,
+    *,
+    max_size: Optional[int] = None,
+    max_age: Optional[float] = None,
+    errors: Optional[List[str]] = None,
+) -> Dict[str, int]:
+    """Evict entries older than ``max_age`` seconds, then LRU entries beyond ``max_size`` bytes.
+
+    Lock files left behind by evicted or deleted downloads are removed as well.
+    Returns counts of removed entries and freed bytes; failures are appended to ``errors``.
+    """
+    errors = [] if errors is None else errors
+    entries = scan(cache_dir)
+    total = sum(e.size for e in entries)
+    now = time.time()
+    removed = freed = 0
+    for e in entries:
+        too_old = max_age is not None and now - e.last_access > max_age
+        too_big = max_size is not None and total > max_size
+        if not (too_old or too_big):
+            continue
+        if _remove(e, errors):
+            removed += 1
+            freed += e.size
+            total -= e.size
+    _prune_locks(cache_dir, errors)
+    return {"removed": removed, "freed": freed}
+
+
+def clear(cache_dir: Path, errors: Optional[List[str]] = None) -> int:
+    """Remove every cache entry (and URL lock files); returns the number of removed files."""
+    errors = [] if errors is None else errors
+    removed = 0
+    if not cache_dir.is_dir():
+        return 0
+    for pattern in ("*.css", f"*.css{META_SUFFIX}", f"*.css{LOCK_SUFFIX}"):
+        for p in cache_dir.glob(pattern):
+            try:
+                p.unlink()
+                removed += 1
+            except OSError as e:
+                errors.append(f"{p}: {e}")
+    for root in (
+        cache_dir / ASSET_CACHE_SUBDIR,
+        cache_dir / CSS_CACHE_SUBDIR,
+        cache_dir / AST_CACHE_SUBDIR,
+        cache_dir / CACHE_SUBDIR,
+    ):
+        if not root.is_dir():
+            continue
+        for p in sorted(root.rglob("*"), reverse=True):
+            try:
+                if p.is_dir():
+                    p.rmdir()
+                else:
+                    p.unlink()
+                    removed += 1
+            except OSError as e:
+                errors.append(f"{p}: {e}")
+    return removed
+
+
+def _budget(name: str, parse: Callable[[str], float], example: str) -> Optional[float]:
+    text = os.environ.get(name)
+    if not text:
+        return None
+    try:
+        return parse(text)
+    except ValueError:
+        if f"{name}={text}" not in _warned:
+            _warned.add(f"{name}={text}")
+            print(f"Ignoring invalid {name}={text} (expected e.g. {example}); cache eviction is skipped", file=sys.stderr)
+        raise
+
+
+def enforce_budget(cache_dir: Optional[Path] = None) -> Dict[str, int]:
+    """Apply the budget from FROM2TO_CACHE_MAX_SIZE / FROM2TO_CACHE_MAX_AGE, if configured.
+
+    An invalid value is reported once per process and disables eviction.
+    """
+    try:
+        max_size = _budget(MAX_SIZE_ENV, parse_size, "500M")
+        max_age = _budget(MAX_AGE_ENV, parse_age, "7d")
+    except ValueError:
+        return {"removed": 0, "freed": 0}
+    if max_size is None and max_age is None:
+        return {"removed": 0, "freed": 0}
+    if cache_dir is None:
+        from .style_utils import get_default_cache_dir
+
+        cache_dir = get_default_cache_dir()
+    return prune(cache_dir, max_size=None if max_size is None else int(max_size), max_age=max_age)
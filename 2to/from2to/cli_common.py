@@ -1,23 +1,72 @@
+from __future__ import annotations
+
 import argparse
 import os
+import sys
+import time
 from pathlib import Path
-from typing import Iterable, Optional
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
 
+# the rest is imported where needed, so --help and --list-styles stay fast
+# (see scripts/bench_startup.py)
+from . import constants
 from . import style_utils as su
 
+if TYPE_CHECKING:
+    from . import batch
+
+# --to formats and their file suffixes
+OUTPUT_FORMATS = {"html": ".html", "pdf": ".pdf"}
+
+
+def parse_formats(text: str) -> List[str]:
+    """Parse a comma-separated ``--to`` list such as ``html,pdf``."""
+    formats: List[str] = []
+    for name in text.split(","):
+        name = name.strip().lower()
+        if name not in OUTPUT_FORMATS:
+            raise argparse.ArgumentTypeError(f"unknown format {name!r} (choose from {', '.join(OUTPUT_FORMATS)})")
+        if name not in formats:
+            formats.append(name)
+    return formats
+
 
 def add_common_args(p: argparse.ArgumentParser) -> argparse.ArgumentParser:
     p.add_argument("--stdout", action="store_true", help="Write to stdout instead of a file")
 
     style_group = p.add_argument_group("Style options")
-    style_group.add_argument("-s", "--style", default=None, help=f"CSS style name, path, or URL (default: {su.DEFAULT_STYLE}) \[env: FROM2TO_STYLE={os.environ.get('FROM2TO_STYLE', '')}]")
+    style_group.add_argument("-s", "--style", default=None, help=f"CSS style name, path, or URL; a comma-separated list or 'all' writes one output per style plus an index page (default: {su.DEFAULT_STYLE}) \[env: FROM2TO_STYLE={os.environ.get('FROM2TO_STYLE', '')}]")
     style_group.add_argument("--list-styles", action="store_true", help="List available included and cached styles and exit")
-    style_group.add_argument("--no-cache", action="store_true", help="Do not cache downloaded URL styles; use a temp file")
+    style_group.add_argument("--no-cache", action="store_true", help="Do not cache downloaded URL styles; keep them in memory only")
+    style_group.add_argument(
+        "--style-ttl",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help=f"Revalidate cached URL styles older than this (default: {constants.DEFAULT_STYLE_TTL})",
+    )
     style_group.add_argument("--cache-dir", help="Override cache directory")
+    style_group.add_argument(
+        "--compile-css",
+        action="store_true",
+        help="Minify the style and, for PDF output, drop rules xhtml2pdf cannot apply (cached per style)",
+    )
+    style_group.add_argument(
+        "--prune-css",
+        action="store_true",
+        help="Inline only the rules whose selectors can match each document, plus the fonts and animations they use",
+    )
 
     content_group = p.add_argument_group("Content options")
     content_group.add_argument("--title", help="Set document title")
     content_group.add_argument("--toc", action="store_true", help="Enable table of contents via pandoc")
+    content_group.add_argument(
+        "--to",
+        type=parse_formats,
+        default=None,
+        metavar="FORMATS",
+        help="Write these formats (e.g. html,pdf) from a single parse of each input; outputs get the format's extension and parsed documents are cached (default: this command's format)",
+    )
     content_group.add_argument(
         "--pandoc-arg",
         action="append",
@@ -25,6 +74,53 @@ def add_common_args(p: argparse.ArgumentParser) -> argparse.ArgumentParser:
         default=[],
         help="Extra pandoc arg(s) (repeatable)",
     )
+    content_group.add_argument(
+        "--pandoc-backend",
+        choices=constants.PANDOC_BACKENDS,
+        default=None,
+        help=f"Run pandoc once per file or keep a warm pandoc worker process (default: {constants.DEFAULT_PANDOC_BACKEND}) \[env: FROM2TO_PANDOC_BACKEND={os.environ.get('FROM2TO_PANDOC_BACKEND', '')}]",
+    )
+
+    batch_group = p.add_argument_group("Batch options")
+    batch_group.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes for multiple inputs (0: one per CPU, default: 1)",
+    )
+    batch_group.add_argument(
+        "-w",
+        "--watch",
+        action="store_true",
+        help="Keep running and re-render when an input, its local images or the local style change",
+    )
+    batch_group.add_argument(
+        "--conversion-cache",
+        action="store_true",
+        help="Reuse cached outputs of unchanged documents (stored under the cache directory)",
+    )
+    batch_group.add_argument(
+        "--conversion-cache-size",
+        type=float,
+        default=constants.DEFAULT_CONVERSION_CACHE_MB,
+        metavar="MB",
+        help=f"Size limit of the conversion cache in MB (default: {constants.DEFAULT_CONVERSION_CACHE_MB})",
+    )
+
+    diag_group = p.add_argument_group("Diagnostics options")
+    diag_group.add_argument(
+        "--timings",
+        nargs="?",
+        const="text",
+        choices=("text", "json"),
+        help="Print wall time, CPU time and peak memory per pipeline stage to stderr (of the initial run in --watch mode)",
+    )
+    diag_group.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="Write cProfile statistics of the whole run to FILE (this process only; use -j 1 for batches)",
+    )
     return p
 
 
@@ -34,34 +130,263 @@ def post_parse_args(args: argparse.Namespace) -> argparse.Namespace:
             args.style = os.environ["FROM2TO_STYLE"]
         else:
             args.style = su.DEFAULT_STYLE
+    if args.pandoc_backend is None:
+        args.pandoc_backend = os.environ.get("FROM2TO_PANDOC_BACKEND", constants.DEFAULT_PANDOC_BACKEND)
     return args
 
 
 def list_styles_command(args: argparse.Namespace) -> int:
-    cache_dir = Path(args.cache_dir) if args.cache_dir else None
+    registry = su.get_registry(Path(args.cache_dir) if args.cache_dir else None)
     print("Included styles:")
-    for name in su.list_included_styles():
-        print(f"  {name}")
+    for info in registry.styles("included"):
+        print(f"  {info.name}")
     print("\nCached styles:")
-    for name in su.list_cached_styles(cache_dir):
-        print(f"  {name}")
+    for info in registry.styles("cached"):
+        print(f"  {info.name}")
     return 0
 
 
+def read_markdown(input_md: Path) -> Optional[str]:
+    """Return the Markdown read from stdin for the ``-`` input, None for regular files."""
+    from . import batch
+
+    if batch.is_stdin(input_md):
+        return sys.stdin.buffer.read().decode("utf-8")
+    return None
+
+
+def default_title(args: argparse.Namespace, input_md: Path) -> str:
+    if args.title:
+        return args.title
+    from . import batch
+
+    return "stdin" if batch.is_stdin(input_md) else input_md.stem
+
+
+def write_stdout(data: bytes) -> None:
+    sys.stdout.buffer.write(data)
+    sys.stdout.flush()
+
+
+def report_css_size(label: str, css_text: str, new_css_text: str) -> None:
+    from . import cache_index
+
+    before = len(css_text.encode("utf-8"))
+    after = len(new_css_text.encode("utf-8"))
+    saved = 100 * (before - after) / before if before else 0
+    print(
+        f"{label}: {cache_index.format_size(before)} -> {cache_index.format_size(after)} ({saved:.0f}% smaller)",
+        file=sys.stderr,
+    )
+
+
+def prune_style(args: argparse.Namespace, css_text: str, html: str, input_md: Path) -> str:
+    """With ``--prune-css``, drop the rules of ``css_text`` that cannot apply to ``html``."""
+    if not args.prune_css:
+        return css_text
+    from . import batch
+    from . import css
+
+    pruned = css.prune_css(css_text, html)
+    report_css_size(f"Pruned style for {'stdin' if batch.is_stdin(input_md) else input_md}", css_text, pruned)
+    return pruned
+
+
+def run_conversions(
+    args: argparse.Namespace,
+    worker: batch.Worker,
+    suffix: str,
+    css_target: Optional[str] = None,
+) -> int:
+    """Expand the inputs, resolve the style once and run ``worker`` for every file.
+
+    The input ``-`` reads Markdown from stdin and writes to stdout unless ``-o`` is given.
+    With ``--compile-css`` the style is compiled for ``css_target`` (see ``css.CSS_TARGETS``).
+    """
+    if not args.profile:
+        return _run_conversions(args, worker, suffix, css_target)
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return _run_conversions(args, worker, suffix, css_target)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        print(f"Wrote profile: {args.profile}", file=sys.stderr)
+
+
+def _run_conversions(args: argparse.Namespace, worker: batch.Worker, suffix: str, css_target: Optional[str]) -> int:
+    from . import batch
+    from . import cache_index
+    from . import conversion_cache as ccache
+    from . import css
+    from . import timings
+    from . import watch
+
+    # --to other formats than this command's: parse once, write each format
+    multi = args.to is not None and args.to != [suffix.lstrip(".")]
+    if multi:
+        from . import targets
+
+        worker = targets.convert_many
+        suffix = OUTPUT_FORMATS[args.to[0]]
+        # compiled per format by the worker
+        css_target = None
+    else:
+        args.to = None
+    if not args.input:
+        print("No input files given", file=sys.stderr)
+        return 2
+    if batch.STDIN in args.input:
+        if len(args.input) > 1:
+            print("Reading from stdin ('-') requires a single input", file=sys.stderr)
+            return 2
+        if args.watch:
+            print("--watch cannot be used when reading from stdin", file=sys.stderr)
+            return 2
+        if not args.output:
+            args.stdout = True
+        inputs = [(Path(batch.STDIN), Path("."))]
+    else:
+        inputs = batch.expand_inputs(args.input)
+    if not inputs:
+        print(f"No Markdown files found in: {' '.join(args.input)}", file=sys.stderr)
+        return 2
+    if args.stdout and len(inputs) > 1:
+        print("--stdout requires a single input file", file=sys.stderr)
+        return 2
+    if args.stdout and args.watch:
+        print("--watch cannot be combined with --stdout", file=sys.stderr)
+        return 2
+    if args.stdout and multi:
+        print("--to writes one file per format; it cannot write to stdout", file=sys.stderr)
+        return 2
+    link_css = getattr(args, "css_mode", "inline") == "link"
+    if link_css and args.stdout:
+        print("--css-mode link needs output files; it cannot write to stdout", file=sys.stderr)
+        return 2
+    if link_css and args.prune_css:
+        print("--prune-css prunes per document and needs --css-mode inline", file=sys.stderr)
+        return 2
+    # --style a,b,c or --style all: every input in every style
+    from . import previews
+
+    styles = previews.parse_styles(args.style)
+    if styles is not None:
+        if args.stdout or args.watch or link_css:
+            print("Several styles need output files and cannot be combined with --stdout, --watch or --css-mode link", file=sys.stderr)
+            return 2
+        if getattr(args, "engine", None) == "pandoc":
+            print("The pandoc engine ignores the style; use --engine xhtml2pdf to compare styles", file=sys.stderr)
+            return 2
+
+    cache_dir = Path(args.cache_dir) if args.cache_dir else None
+    recorder = None
+    if args.timings:
+        recorder = timings.Recorder()
+        timings.add_hook(recorder)
+
+    def finish(status: int) -> int:
+        cache_index.enforce_budget(cache_dir)
+        if recorder is not None:
+            timings.remove_hook(recorder)
+            print(recorder.report(args.timings), file=sys.stderr)
+        return status
+
+    spec = args.input[0]
+    single = len(args.input) == 1 and not Path(spec).is_dir() and not batch.is_glob(spec)
+
+    def plan(inputs: List[batch.InputSpec]) -> List[batch.Task]:
+        if args.stdout:
+            return [(inputs[0][0], None)]
+        return batch.plan_tasks(inputs, args.output, suffix, force_dir=not single)
+
+    if styles is not None:
+        status = previews.run_previews(args, plan(inputs), styles, args.to or [suffix.lstrip(".")])
+        if getattr(args, "browse", False) and status == 0:
+            import webbrowser
+
+            index = previews.index_path(plan(inputs)[0][1])
+            webbrowser.open(index.absolute().as_uri())
+        return finish(status)
+
+    def resolve_css(report: bool = False) -> Tuple[str, Optional[Path]]:
+        with timings.stage("resolve_style"):
+            css_text, css_path = su.resolve_style(args.style, cache_dir=cache_dir, no_cache=args.no_cache, ttl=args.style_ttl)
+        if args.compile_css and css_target:
+            with timings.stage("compile_css"):
+                compiled = css.compile_css(css_text, css_target, cache_dir=cache_dir or su.get_default_cache_dir())
+            if report:
+                report_css_size(f"Compiled style for {css_target}", css_text, compiled)
+            css_text = compiled
+        return css_text, css_path
+
+    try:
+        css_text, css_path = resolve_css(report=True)
+    except Exception as e:
+        print(str(e), file=sys.stderr)
+        return 2
+
+    def write_stylesheet(css_text: str) -> None:
+        if multi:
+            css_text = targets.target_css(args, css_text, "html")
+        su.write_stylesheet(css_text, args.css_dir)
+
+    tasks = plan(inputs)
+    if link_css:
+        # one shared stylesheet in the directory that holds every output
+        args.css_dir = Path(os.path.commonpath([str(out.parent.absolute()) for _, out in tasks if out is not None]))
+        write_stylesheet(css_text)
+
+    def restyle() -> str:
+        new_css_text = resolve_css()[0]
+        if link_css:
+            write_stylesheet(new_css_text)
+        return new_css_text
+
+    cache = None
+    if args.conversion_cache and multi:
+        # entries hold one output each; the parsed documents are cached instead
+        print("--conversion-cache is not used with --to", file=sys.stderr)
+    elif args.conversion_cache:
+        cache = ccache.ConversionCache(
+            (cache_dir or su.get_default_cache_dir()) / ccache.CACHE_SUBDIR,
+            max_bytes=int(args.conversion_cache_size * 1024 * 1024),
+        )
+
+    status = finish(batch.run_batch(tasks, worker, args, css_text, jobs=batch.resolve_jobs(args.jobs), cache=cache))
+    if not args.watch:
+        return status
+
+    if getattr(args, "browse", False):
+        # the browser tab reloads from disk; do not open a new one per rebuild
+        args.browse = False
+    return watch.watch(
+        args,
+        worker,
+        lambda: plan(batch.expand_inputs(args.input)),
+        restyle,
+        css_text,
+        None if su.is_url(args.style) else css_path,
+        cache=cache,
+    )
+
+
 def clear_cache(cache_dir: Optional[Path] = None) -> int:
+    from . import cache_index
+
     cdir = cache_dir or su.get_default_cache_dir()
     if not cdir.exists():
         print("Cache directory does not exist; nothing to clear.")
         return 0
-    removed = 0
-    for p in cdir.glob("*.css"):
-        try:
-            p.unlink()
-            removed += 1
-        except Exception:
-            pass
+    errors: List[str] = []
+    removed = cache_index.clear(cdir, errors)
     print(f"Removed {removed} cached files from {cdir}")
-    return 0
+    for err in errors:
+        print(f"Could not remove {err}", file=sys.stderr)
+    return 1 if errors else 0
 
 
 def clear_cache_main(argv: Optional[Iterable[str]] = None) -> int:
@@ -70,3 +395,56 @@ def clear_cache_main(argv: Optional[Iterable[str]] = None) -> int:
     args = p.parse_args(list(argv) if argv is not None else None)
     cache_dir = Path(args.cache_dir) if args.cache_dir else None
     return clear_cache(cache_dir)
+
+
+def cache_stats(cache_dir: Path) -> int:
+    from . import cache_index
+
+    entries = cache_index.scan(cache_dir)
+    print(f"Cache directory: {cache_dir}")
+    for kind, label in (
+        ("style", "styles"),
+        ("asset", "assets"),
+        ("css", "compiled css"),
+        ("ast", "parsed docs"),
+        ("conversion", "conversions"),
+    ):
+        items = [e for e in entries if e.kind == kind]
+        line = f"  {label + ':':<13} {len(items):>6} entries, {cache_index.format_size(sum(e.size for e in items)):>10}"
+        if items:
+            age = time.time() - items[0].last_access
+            line += f", least recently used {age / 86400:.1f} days ago"
+        print(line)
+    print(f"  {'total:':<13} {len(entries):>6} entries, {cache_index.format_size(sum(e.size for e in entries)):>10}")
+    budget = [f"{env}={os.environ[env]}" for env in (cache_index.MAX_SIZE_ENV, cache_index.MAX_AGE_ENV) if os.environ.get(env)]
+    print(f"  budget: {', '.join(budget) if budget else 'none'}")
+    return 0
+
+
+def cache_main(argv: Optional[Iterable[str]] = None) -> int:
+    from . import cache_index
+
+    p = argparse.ArgumentParser(prog="2to-cache", description="Inspect and manage the from2to style and conversion cache")
+    p.add_argument("--cache-dir", help="Override cache directory")
+    sub = p.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Show entry counts and sizes")
+    prune_p = sub.add_parser("prune", help="Evict least recently used entries")
+    prune_p.add_argument("--max-size", type=cache_index.parse_size, help="Evict LRU entries until the cache fits, e.g. 500M, 500MiB or 2G")
+    prune_p.add_argument("--max-age", type=cache_index.parse_age, help="Evict entries not used for this long, e.g. 30d or 12h")
+    sub.add_parser("clear", help="Remove all cached styles and conversions")
+    args = p.parse_args(list(argv) if argv is not None else None)
+    cache_dir = Path(args.cache_dir) if args.cache_dir else su.get_default_cache_dir()
+
+    if args.command == "stats":
+        return cache_stats(cache_dir)
+    if args.command == "clear":
+        return clear_cache(cache_dir)
+
+    if args.max_size is None and args.max_age is None:
+        p.error("prune needs --max-size and/or --max-age")
+    errors: List[str] = []
+    result = cache_index.prune(cache_dir, max_size=args.max_size, max_age=args.max_age, errors=errors)
+    print(f"Removed {result['removed']} entries ({cache_index.format_size(result['freed'])}) from {cache_dir}")
+    for err in errors:
+        print(f"Could not remove {err}", file=sys.stderr)
+    return 1 if errors else 0
@@ -0,0 +1,33 @@
+"""Names and defaults shared across from2to.
+
+This module imports nothing, so the CLIs can build their argument parsers and
+``cache_index`` can walk the cache directory without importing pandoc, CSS or
+PDF code. The modules that own these values re-export them under their own
+names.
+"""
+
+# Cache directory layout, relative to the cache directory
+ASSET_SUBDIR = "assets"
+# below ASSET_SUBDIR
+SCALED_SUBDIR = "scaled"
+FONT_SUBDIR = "fonts"
+CSS_SUBDIR = "compiled-css"
+AST_SUBDIR = "ast"
+CONVERSION_SUBDIR = "conversions"
+# Sidecars of downloaded URL styles and assets
+META_SUFFIX = ".json"
+LOCK_SUFFIX = ".lock"
+
+# "subprocess" runs pandoc once per conversion, "worker" reuses a long-lived
+# pandoc process and falls back to "subprocess" when it cannot be used.
+PANDOC_BACKENDS = ("subprocess", "worker")
+DEFAULT_PANDOC_BACKEND = "subprocess"
+
+# "xhtml2pdf" renders the styled HTML in-process, "pandoc" lets pandoc produce
+# the PDF directly (requires a pdf engine such as LaTeX; the style does not apply).
+PDF_ENGINES = ("xhtml2pdf", "pandoc")
+DEFAULT_PDF_ENGINE = "xhtml2pdf"
+
+# Revalidate cached URL styles older than this (seconds)
+DEFAULT_STYLE_TTL = 24 * 60 * 60
+DEFAULT_CONVERSION_CACHE_MB = 512
@@ -0,0 +1,186 @@
+"""Content-addressed cache of conversion outputs.
+
+Entries are keyed by a hash of everything that determines an output: the
+Markdown bytes, the resolved CSS, the output-affecting CLI options, the
+contents of the files they name (templates, filters, includes) and the pandoc
+version. Images referenced by the document are not part of the key.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from . import constants
+from . import convert as conv
+from . import url_cache
+from .pandoc_probe import pandoc_version
+
+DEFAULT_MAX_SIZE_MB = constants.DEFAULT_CONVERSION_CACHE_MB
+CACHE_SUBDIR = constants.CONVERSION_SUBDIR
+# Bump when the conversion pipeline changes in a way that alters outputs
+CACHE_FORMAT = "1"
+
+# Options that do not change the bytes of an output
+CACHE_KEY_IGNORED_ARGS = frozenset(
+    {
+        "input",
+        "output",
+        "stdout",
+        "browse",
+        "jobs",
+        "watch",
+        "style",
+        "list_styles",
+        "no_cache",
+        "style_ttl",
+        "cache_dir",
+        "pandoc_backend",
+        "conversion_cache",
+        "conversion_cache_size",
+        "timings",
+        "profile",
+        # replaced by the output's location relative to it, see ConversionCache.key
+        "css_dir",
+    }
+)
+
+
+def files_equal(a: Path, b: Path) -> bool:
+    try:
+        if a.stat().st_size != b.stat().st_size:
+            return False
+        with open(a, "rb") as fa, open(b, "rb") as fb:
+            while True:
+                ca = fa.read(1 << 16)
+                if ca != fb.read(1 << 16):
+                    return False
+                if not ca:
+                    return True
+    except OSError:
+        return False
+
+
+class ConversionCache:
+    """On-disk output cache with an LRU size limit.
+
+    Instances only hold plain attributes, so they can be passed to worker processes.
+    """
+
+    def __init__(self, root: Path, max_bytes: int = DEFAULT_MAX_SIZE_MB * 1024 * 1024) -> None:
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    def key(
+        self,
+        input_md: Path,
+        args: argparse.Namespace,
+        css_text: str,
+        suffix: str,
+        out_path: Optional[Path] = None,
+    ) -> str:
+        options = {k: v for k, v in sorted(vars(args).items()) if k not in CACHE_KEY_IGNORED_ARGS}
+        css_dir = getattr(args, "css_dir", None)
+        # the href of a linked stylesheet depends on where the output is written
+        css_link = os.path.relpath(out_path.parent, css_dir) if css_dir and out_path else ""
+        h = hashlib.sha256()
+        for part in (
+            CACHE_FORMAT,
+            suffix,
+            pandoc_version(),
+            # the default title is the input file name
+            input_md.stem,
+            json.dumps(options, sort_keys=True, default=str),
+            css_text,
+            css_link,
+        ):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        h.update(input_md.read_bytes())
+        for path in conv.pandoc_files(getattr(args, "pandoc_arg", None)):
+            h.update(b"\0")
+            h.update(path.read_bytes())
+        return h.hexdigest()
+
+    def entry_path(self, key: str, suffix: str) -> Path:
+        return self.root / key[:2] / f"{key}{suffix}"
+
+    def lookup(self, key: str, suffix: str) -> Optional[Path]:
+        entry = self.entry_path(key, suffix)
+        if entry.is_file():
+            try:
+                # mtime doubles as the last-access time for eviction
+                os.utime(entry)
+            except OSError:
+                pass
+            return entry
+        return None
+
+    def store(self, key: str, suffix: str, output: Path) -> Path:
+        entry = self.entry_path(key, suffix)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=entry.parent, prefix=".tmp-")
+        os.close(fd)
+        try:
+            shutil.copyfile(output, tmp)
+            os.chmod(tmp, url_cache.file_mode())
+            os.replace(tmp, entry)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        return entry
+
+    @staticmethod
+    def place(entry: Path, dest: Path) -> bool:
+        """Copy a cache entry to ``dest``.
+
+        Entries are copied rather than linked, so outputs get their own inode
+        and mode and refreshing an entry's mtime in ``lookup`` leaves them alone.
+        Returns False and leaves ``dest`` untouched when it already has the same bytes.
+        """
+        if dest.is_file() and files_equal(entry, dest):
+            return False
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.tmp-{os.getpid()}")
+        tmp.unlink(missing_ok=True)
+        try:
+            shutil.copyfile(entry, tmp)
+            os.replace(tmp, dest)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return True
+
+    def entries(self) -> List[Tuple[Path, os.stat_result]]:
+        found = []
+        if self.root.is_dir():
+            for p in self.root.glob("*/*"):
+                if p.is_file() and not p.name.startswith(".tmp-"):
+                    found.append((p, p.stat()))
+        return found
+
+    def size(self) -> int:
+        return sum(st.st_size for _p, st in self.entries())
+
+    def prune(self, max_bytes: Optional[int] = None) -> int:
+        """Evict least recently used entries until the cache fits; returns the number removed."""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self.entries(), key=lambda e: e[1].st_mtime)
+        total = sum(st.st_size for _p, st in entries)
+        removed = 0
+        for p, st in entries:
+            if total <= limit:
+                break
+            try:
+                p.unlink()
+            except OSError:
+                continue
+            total -= st.st_size
+            removed += 1
+        return removed
+
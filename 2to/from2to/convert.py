@@ -1,38 +1,388 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Iterable, Optional
+from typing import BinaryIO, Dict, Iterable, List, Optional
 
-import pypandoc  # provided by pypandoc-binary
+from . import constants
+from . import pandoc_probe
+from . import pandoc_worker as pw
+from . import url_cache
+
+PANDOC_BACKENDS = constants.PANDOC_BACKENDS
+DEFAULT_PANDOC_BACKEND = constants.DEFAULT_PANDOC_BACKEND
+# Read size when streaming pandoc's output
+STREAM_CHUNK_SIZE = 1 << 16
+HEAD_END = b"</head>"
+
+AST_CACHE_SUBDIR = constants.AST_SUBDIR
+# Bump when parse_markdown output changes for the same input and options
+AST_CACHE_FORMAT = "2"
+# Parsed documents kept in memory per process
+AST_MEMORY_ENTRIES = 8
+# pandoc options that act on the parse (reader options): they are applied once
+# when the AST is built, not again when it is rendered.
+# Value: whether the option takes a separate argument.
+PARSE_OPTIONS = {
+    "-f": True,
+    "--from": True,
+    "-r": True,
+    "--read": True,
+    "--shift-heading-level-by": True,
+    "--file-scope": False,
+    "--strip-comments": False,
+    "--abbreviations": True,
+    "--default-image-extension": True,
+    "--tab-stop": True,
+    "--preserve-tabs": False,
+    "--track-changes": True,
+    "--indented-code-classes": True,
+    "--extract-media": True,
+}
+# Filters and citeproc run when the AST is rendered, where they see the output
+# format (FORMAT), exactly as in a direct conversion.
+RENDER_OPTIONS = {
+    "-F": True,
+    "--filter": True,
+    "-L": True,
+    "--lua-filter": True,
+    "-C": False,
+    "--citeproc": False,
+}
+# pandoc options whose value names a file pandoc reads
+PANDOC_FILE_OPTIONS = frozenset(
+    {
+        "-H",
+        "--include-in-header",
+        "-B",
+        "--include-before-body",
+        "-A",
+        "--include-after-body",
+        "--template",
+        "-L",
+        "--lua-filter",
+        "-F",
+        "--filter",
+        "-d",
+        "--defaults",
+        "--metadata-file",
+        "--bibliography",
+        "--csl",
+        "--citation-abbreviations",
+        "--abbreviations",
+        "--syntax-definition",
+        "--highlight-style",
+    }
+)
+
+_ast_memo: "OrderedDict[str, str]" = OrderedDict()
+_ast_lock = threading.Lock()
+
+
+def flatten_pandoc_args(pandoc_args: Optional[Iterable[str]]) -> List[str]:
+    flat: List[str] = []
+    for item in pandoc_args or ():
+        # flatten in case list-of-lists
+        if isinstance(item, (list, tuple)):
+            flat.extend(item)
+        else:
+            flat.append(item)
+    return flat
+
+
+def pandoc_files(pandoc_args: Optional[Iterable[str]]) -> List[Path]:
+    """Existing files named by pandoc options (see ``PANDOC_FILE_OPTIONS``)."""
+    flat = flatten_pandoc_args(pandoc_args)
+    files: List[Path] = []
+    for i, arg in enumerate(flat):
+        if arg.startswith("--") and "=" in arg:
+            name, value = arg.split("=", 1)
+        elif arg in PANDOC_FILE_OPTIONS and i + 1 < len(flat):
+            name, value = arg, flat[i + 1]
+        elif not arg.startswith("--") and len(arg) > 2:
+            # short option with its value attached, e.g. -Hheader.html
+            name, value = arg[:2], arg[2:]
+        else:
+            continue
+        # --highlight-style and --filter also take names that are not files
+        if name in PANDOC_FILE_OPTIONS and Path(value).is_file():
+            files.append(Path(value))
+    return files
+
+
+def _without(flat_args: List[str], options: Dict[str, bool]) -> List[str]:
+    kept: List[str] = []
+    skip = False
+    for arg in flat_args:
+        if skip:
+            skip = False
+            continue
+        name = arg.split("=", 1)[0]
+        if name in options:
+            skip = options[name] and "=" not in arg
+            continue
+        if not arg.startswith("--") and arg[:2] in options:
+            # short option with its value attached, e.g. -fgfm
+            continue
+        kept.append(arg)
+    return kept
+
+
+def parse_args(flat_args: List[str]) -> List[str]:
+    """``flat_args`` without the render-only options (see ``RENDER_OPTIONS``), for parsing to an AST."""
+    return _without(flat_args, RENDER_OPTIONS)
+
+
+def render_args(flat_args: List[str]) -> List[str]:
+    """``flat_args`` without the parse options (see ``PARSE_OPTIONS``), for rendering a parsed AST."""
+    return _without(flat_args, PARSE_OPTIONS)
+
+
+def _standalone_args(title: Optional[str], toc: bool, flat_args: List[str]) -> List[str]:
+    extra_args = ["--standalone"]
+    if title:
+        extra_args += [f"--metadata=title:{title}"]
+    if toc:
+        extra_args += ["--toc"]
+    return extra_args + flat_args
+
+
+def _html_args(title: Optional[str], toc: bool, flat_args: List[str]) -> List[str]:
+    return ["--from=markdown", "--to=html"] + _standalone_args(title, toc, flat_args)
 
 
 def convert_markdown_to_html(
-    input_md: Path,
+    input_md: Optional[Path],
     pandoc_args: Optional[Iterable[str]] = None,
     title: Optional[str] = None,
     toc: bool = False,
+    backend: str = DEFAULT_PANDOC_BACKEND,
+    text: Optional[str] = None,
 ) -> str:
-    extra_args = ["--standalone", "--from=markdown", "--to=html"]
-    if title:
-        extra_args += [f"--metadata=title:{title}"]
-    if toc:
-        extra_args += ["--toc"]
-    if pandoc_args:
-        # flatten in case list-of-lists
-        for item in pandoc_args:
-            if isinstance(item, (list, tuple)):
-                extra_args.extend(item)
-            else:
-                extra_args.append(item)
+    """Convert the Markdown file ``input_md`` (or the Markdown ``text``, if given) to standalone HTML."""
+    flat_args = flatten_pandoc_args(pandoc_args)
+    # arbitrary pandoc CLI args cannot be expressed as worker requests
+    if backend == "worker" and not flat_args:
+        html = pw.convert_text(
+            text if text is not None else Path(input_md).read_text(encoding="utf-8"),
+            to="html",
+            toc=toc,
+            metadata={"title": title} if title else None,
+        )
+        if html is not None:
+            return html
+
+    extra_args = _html_args(title, toc, flat_args)
+    pypandoc = pandoc_probe.load_pypandoc()
+    if text is not None:
+        return pypandoc.convert_text(text, to="html", format="markdown", extra_args=extra_args)
     html = pypandoc.convert_file(str(input_md), to="html", extra_args=extra_args)
     return html
 
 
-def convert_markdown_to_pdf(
+def ast_key(text: str, flat_args: List[str]) -> str:
+    h = hashlib.sha256()
+    for part in (AST_CACHE_FORMAT, pandoc_probe.pandoc_version(), json.dumps(flat_args)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    # e.g. --metadata-file and --abbreviations change the parse
+    for path in pandoc_files(flat_args):
+        try:
+            data = path.read_bytes()
+        except OSError:
+            continue
+        h.update(hashlib.sha256(data).digest())
+    h.update(text.encode("utf-8"))
+    return h.hexdigest()
+
+
+def _read_ast(entry: Path) -> Optional[str]:
+    try:
+        ast = entry.read_text(encoding="utf-8")
+        # mtime doubles as the last-access time for eviction
+        os.utime(entry)
+    except OSError:
+        return None
+    return ast
+
+
+def _write_ast(entry: Path, ast: str) -> None:
+    try:
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=entry.parent, prefix=".tmp-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(ast)
+        os.replace(tmp, entry)
+    except OSError:
+        # the cache is an optimization; a read-only cache directory is not an error
+        pass
+
+
+def parse_markdown(
+    input_md: Optional[Path],
+    pandoc_args: Optional[Iterable[str]] = None,
+    backend: str = DEFAULT_PANDOC_BACKEND,
+    text: Optional[str] = None,
+    cache_dir: Optional[Path] = None,
+) -> str:
+    """Parse the Markdown file ``input_md`` (or ``text``) into pandoc's JSON AST.
+
+    The last ``AST_MEMORY_ENTRIES`` ASTs are kept in memory and, with
+    ``cache_dir``, on disk under ``ast/``, keyed by the Markdown, the pandoc
+    args, the files they name and the pandoc version. Render the AST with
+    ``render_ast``; the title, table of contents, filters and citeproc are
+    applied there, so one AST serves every output.
+    """
+    flat_args = parse_args(flatten_pandoc_args(pandoc_args))
+    if text is None:
+        text = Path(input_md).read_text(encoding="utf-8")
+    key = ast_key(text, flat_args)
+    with _ast_lock:
+        ast = _ast_memo.get(key)
+        if ast is not None:
+            _ast_memo.move_to_end(key)
+            return ast
+
+    entry = Path(cache_dir) / AST_CACHE_SUBDIR / key[:2] / f"{key}.json" if cache_dir else None
+    ast = _read_ast(entry) if entry is not None else None
+    if ast is None:
+        if backend == "worker" and not flat_args:
+            ast = pw.convert_text(text, to="json", standalone=False)
+        if ast is None:
+            pypandoc = pandoc_probe.load_pypandoc()
+            ast = pypandoc.convert_text(text, to="json", format="markdown", extra_args=flat_args)
+        if entry is not None:
+            _write_ast(entry, ast)
+
+    with _ast_lock:
+        _ast_memo[key] = ast
+        while len(_ast_memo) > AST_MEMORY_ENTRIES:
+            _ast_memo.popitem(last=False)
+    return ast
+
+
+def render_ast(
+    ast: str,
+    to: str = "html",
+    pandoc_args: Optional[Iterable[str]] = None,
+    title: Optional[str] = None,
+    toc: bool = False,
+    backend: str = DEFAULT_PANDOC_BACKEND,
+    outputfile: Optional[str] = None,
+) -> str:
+    """Render a ``parse_markdown`` AST as standalone ``to`` output.
+
+    The parse options among ``pandoc_args`` were applied by ``parse_markdown``
+    and are skipped. With ``outputfile`` pandoc writes the result there (needed
+    for ``to="pdf"``).
+    """
+    flat_args = render_args(flatten_pandoc_args(pandoc_args))
+    if backend == "worker" and not flat_args and outputfile is None:
+        output = pw.convert_text(ast, to=to, from_="json", toc=toc, metadata={"title": title} if title else None)
+        if output is not None:
+            return output
+
+    pypandoc = pandoc_probe.load_pypandoc()
+    kwargs = {"outputfile": outputfile} if outputfile else {}
+    return pypandoc.convert_text(ast, to=to, format="json", extra_args=_standalone_args(title, toc, flat_args), **kwargs)
+
+
+def copy_inserting(src: BinaryIO, dst: BinaryIO, marker: bytes, insert: bytes) -> bool:
+    """Copy ``src`` to ``dst`` in chunks, writing ``insert`` before the first ``marker``.
+
+    Returns False when ``marker`` never occurred (nothing was inserted).
+    """
+    keep = len(marker) - 1
+    pending = b""
+    while True:
+        chunk = src.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            dst.write(pending)
+            return False
+        pending += chunk
+        pos = pending.find(marker)
+        if pos >= 0:
+            dst.write(pending[:pos])
+            dst.write(insert)
+            dst.write(pending[pos:])
+            shutil.copyfileobj(src, dst, STREAM_CHUNK_SIZE)
+            return True
+        # hold back a tail that may be the start of a marker split across chunks
+        dst.write(pending[: len(pending) - keep])
+        pending = pending[len(pending) - keep :]
+
+
+def stream_markdown_to_html(
     input_md: Path,
+    out_path: Path,
+    pandoc_args: Optional[Iterable[str]] = None,
+    title: Optional[str] = None,
+    toc: bool = False,
+    head: str = "",
+) -> None:
+    """Convert ``input_md`` to standalone HTML written straight to ``out_path``.
+
+    pandoc's output is copied to the file as it arrives, with ``head`` inserted
+    before ``</head>`` (or at the start, as ``style_utils.insert_head`` does),
+    so memory use does not grow with the document. The file is replaced only
+    when pandoc succeeds.
+    """
+    pypandoc = pandoc_probe.load_pypandoc()
+    # same command and environment as pypandoc.convert_file
+    cmd = [pandoc_probe.pandoc_path(), "--from=markdown", "--to=html", str(input_md)]
+    cmd += _html_args(title, toc, flatten_pandoc_args(pandoc_args))
+    env = os.environ.copy()
+    env["PATH"] = env.get("PATH", "") + os.pathsep + os.path.join(os.path.dirname(os.path.realpath(pypandoc.__file__)), "files")
+
+    insert = head.encode("utf-8")
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=out_path.parent, prefix=f".{out_path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out, tempfile.TemporaryFile() as err:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err, env=env)
+            try:
+                assert proc.stdout is not None
+                with proc.stdout:
+                    found = copy_inserting(proc.stdout, out, HEAD_END, insert)
+            finally:
+                if proc.poll() is None and sys.exc_info()[0] is not None:
+                    proc.kill()
+                proc.wait()
+            err.seek(0)
+            message = err.read().decode("utf-8", errors="replace")
+            if proc.returncode != 0:
+                raise RuntimeError(f'Pandoc died with exitcode "{proc.returncode}" during conversion: {message}')
+            if message:
+                # pandoc warnings, e.g. unresolved resources
+                sys.stderr.write(message)
+        if not found and insert:
+            # no </head> (custom template): prepend, still without loading the file
+            with open(tmp, "rb") as src, tempfile.NamedTemporaryFile(dir=out_path.parent, delete=False) as dst:
+                dst.write(insert)
+                shutil.copyfileobj(src, dst, STREAM_CHUNK_SIZE)
+            os.replace(dst.name, tmp)
+        # mkstemp files are 0600; give the output the mode a plain write would
+        os.chmod(tmp, url_cache.file_mode())
+        os.replace(tmp, out_path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def convert_markdown_to_pdf(
+    input_md: Optional[Path],
     pandoc_args: Optional[Iterable[str]] = None,
     title: Optional[str] = None,
     toc: bool = False,
+    text: Optional[str] = None,
     **kwargs,
 ) -> str:
     extra_args = ["--standalone", "--from=markdown"]
@@ -40,13 +390,8 @@ def convert_markdown_to_pdf(
         extra_args += [f"--metadata=title:{title}"]
     if toc:
         extra_args += ["--toc"]
-    if pandoc_args:
-        # flatten in case list-of-lists
-        for item in pandoc_args:
-            if isinstance(item, (list, tuple)):
-                extra_args.extend(item)
-            else:
-                extra_args.append(item)
-    print(kwargs.get("outputfile"))
-    html = pypandoc.convert_file(str(input_md), to="pdf", extra_args=extra_args, **kwargs)
-    return html
+    extra_args += flatten_pandoc_args(pandoc_args)
+    pypandoc = pandoc_probe.load_pypandoc()
+    if text is not None:
+        return pypandoc.convert_text(text, to="pdf", format="markdown", extra_args=extra_args, **kwargs)
+    return pypandoc.convert_file(str(input_md), to="pdf", extra_args=extra_args, **kwargs)
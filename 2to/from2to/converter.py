@@ -0,0 +1,204 @@
+"""Library entry point: a reusable Markdown converter for embedding in services.
+
+``Converter`` is configured once. The style is resolved (and compiled) when it
+is created, pandoc is located up front, and everything resolved later -- PDF
+assets, xhtml2pdf itself -- stays warm for the next call.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+import tempfile
+import threading
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+from . import assets
+from . import convert as conv
+from . import css
+from . import pandoc_probe
+from . import pdf
+from . import style_utils as su
+from . import timings
+
+# Markdown text (str or UTF-8 bytes) or a path to a Markdown file
+Source = Union[str, bytes, Path]
+# Title for text sources; files default to their name like the CLIs do
+DEFAULT_TITLE = "document"
+# Serializes xhtml2pdf renders of every Converter in the process
+_render_lock = threading.Lock()
+
+
+class Converter:
+    """Convert Markdown to HTML or PDF with a fixed configuration.
+
+    Instances can be shared across threads. pandoc runs concurrently;
+    xhtml2pdf renders are serialized across every instance in a process because
+    ReportLab keeps global state, so use several processes for parallel PDF output.
+
+    ``to_html`` / ``to_pdf`` accept Markdown text, UTF-8 bytes or a ``Path``;
+    the ``*_async`` variants run them on ``executor`` (the event loop's default
+    executor if None).
+
+    ``asset_roots`` is for untrusted Markdown: PDF assets are then never
+    downloaded and only read from those directories and the style's own.
+    """
+
+    def __init__(
+        self,
+        style: str = su.DEFAULT_STYLE,
+        *,
+        pandoc_args: Optional[Iterable[str]] = None,
+        toc: bool = False,
+        pandoc_backend: str = conv.DEFAULT_PANDOC_BACKEND,
+        pdf_engine: str = pdf.DEFAULT_PDF_ENGINE,
+        compile_css: bool = False,
+        prune_css: bool = False,
+        image_dpi: Optional[int] = None,
+        cache_dir: Optional[Path] = None,
+        style_ttl: Optional[float] = None,
+        asset_roots: Optional[Iterable[Path]] = None,
+        executor: Optional[Executor] = None,
+    ) -> None:
+        if pandoc_backend not in conv.PANDOC_BACKENDS:
+            raise ValueError(f"Unknown pandoc backend: {pandoc_backend}")
+        if pdf_engine not in pdf.PDF_ENGINES:
+            raise ValueError(f"Unknown PDF engine: {pdf_engine}")
+        if asset_roots is not None and pdf_engine != "xhtml2pdf":
+            raise ValueError("asset_roots needs the xhtml2pdf PDF engine")
+        self.style = style
+        self.pandoc_args = conv.flatten_pandoc_args(pandoc_args)
+        self.toc = toc
+        self.pandoc_backend = pandoc_backend
+        self.pdf_engine = pdf_engine
+        self.compile_css = compile_css
+        self.prune_css = prune_css
+        self.image_dpi = image_dpi
+        self.cache_dir = Path(cache_dir) if cache_dir else su.get_default_cache_dir()
+        self.style_ttl = style_ttl
+        self.asset_roots = [Path(r).resolve() for r in asset_roots] if asset_roots is not None else None
+        self.executor = executor
+
+        self._lock = threading.Lock()
+        self._css: Dict[str, str] = {}
+        self._resolvers: Dict[Path, assets.AssetResolver] = {}
+        self._style_dir: Optional[Path] = None
+        pandoc_probe.load_pypandoc()
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Resolve the style again and forget resolved assets (e.g. after files changed)."""
+        with timings.stage("resolve_style"):
+            css_text, origin = su.resolve_style(self.style, cache_dir=self.cache_dir, ttl=self.style_ttl)
+        with timings.stage("compile_css"):
+            compiled = {target: self._compile(css_text, target) for target in css.CSS_TARGETS}
+        style_dir = origin.parent.resolve() if origin is not None else None
+        if style_dir == self.cache_dir.resolve():
+            # a URL style's directory is the cache, which also holds other documents
+            style_dir = None
+        with self._lock:
+            self._css = compiled
+            self._style_dir = style_dir
+            self._resolvers = {}
+
+    def _compile(self, css_text: str, target: str) -> str:
+        if not self.compile_css:
+            return css_text
+        return css.compile_css(css_text, target, cache_dir=self.cache_dir)
+
+    def _html(self, source: Source, title: Optional[str], target: str) -> str:
+        if isinstance(source, Path):
+            input_md: Optional[Path] = source
+            text = None
+            default_title = source.stem
+        else:
+            input_md = None
+            text = source.decode("utf-8") if isinstance(source, bytes) else source
+            default_title = DEFAULT_TITLE
+        with timings.stage("pandoc"):
+            html = conv.convert_markdown_to_html(
+                input_md,
+                pandoc_args=self.pandoc_args,
+                title=title or default_title,
+                toc=self.toc,
+                backend=self.pandoc_backend,
+                text=text,
+            )
+        with timings.stage("inject_css"):
+            css_text = self._css[target]
+            if self.prune_css:
+                css_text = css.prune_css(css_text, html)
+            return su.inject_css(html, css_text)
+
+    def _roots(self) -> Optional[List[Path]]:
+        if self.asset_roots is None:
+            return None
+        return self.asset_roots + ([self._style_dir] if self._style_dir is not None else [])
+
+    def _resolver(self, base_dir: Path) -> assets.AssetResolver:
+        with self._lock:
+            resolver = self._resolvers.get(base_dir)
+            if resolver is None:
+                resolver = assets.AssetResolver(
+                    base_dir, self.cache_dir, ttl=self.style_ttl, image_dpi=self.image_dpi, roots=self._roots()
+                )
+                self._resolvers[base_dir] = resolver
+        return resolver
+
+    def to_html(self, source: Source, *, title: Optional[str] = None) -> str:
+        """Return standalone HTML with the style inlined."""
+        return self._html(source, title, "html")
+
+    def to_pdf(self, source: Source, *, title: Optional[str] = None, base_dir: Optional[Path] = None) -> bytes:
+        """Return the PDF bytes.
+
+        Relative images and fonts resolve against ``base_dir``, which defaults to
+        the directory of a ``Path`` source, else the first of ``asset_roots`` (or
+        the style's directory) or the working directory.
+        """
+        if base_dir is None:
+            roots = self._roots()
+            base_dir = source.parent if isinstance(source, Path) else roots[0] if roots else Path.cwd()
+        base_dir = Path(base_dir).resolve()
+
+        if self.pdf_engine == "pandoc":
+            with timings.stage("pandoc"):
+                return self._pandoc_pdf(source, title)
+
+        html = self._html(source, title, "pdf")
+        resolver = self._resolver(base_dir)
+        with timings.stage("assets"):
+            resolver.prefetch(assets.references(html))
+        with _render_lock, timings.stage("pdf"):
+            return pdf.html_to_pdf_bytes(html, base_path=base_dir / "_", resolver=resolver)
+
+    def _pandoc_pdf(self, source: Source, title: Optional[str]) -> bytes:
+        fd, tmp = tempfile.mkstemp(suffix=".pdf")
+        os.close(fd)
+        try:
+            if isinstance(source, Path):
+                conv.convert_markdown_to_pdf(
+                    source, self.pandoc_args, title=title or source.stem, toc=self.toc, outputfile=tmp
+                )
+            else:
+                text = source.decode("utf-8") if isinstance(source, bytes) else source
+                conv.convert_markdown_to_pdf(
+                    None, self.pandoc_args, title=title or DEFAULT_TITLE, toc=self.toc, text=text, outputfile=tmp
+                )
+            return Path(tmp).read_bytes()
+        finally:
+            os.unlink(tmp)
+
+    async def to_html_async(self, source: Source, *, title: Optional[str] = None) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(self.to_html, source, title=title))
+
+    async def to_pdf_async(
+        self, source: Source, *, title: Optional[str] = None, base_dir: Optional[Path] = None
+    ) -> bytes:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(self.to_pdf, source, title=title, base_dir=base_dir)
+        )
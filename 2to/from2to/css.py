@@ -0,0 +1,509 @@
+"""Stylesheet compilation: minify CSS and drop rules the target cannot use.
+
+``compile_css`` parses a stylesheet into rules, serializes them without
+comments or redundant whitespace and, for the ``pdf`` target, removes what
+xhtml2pdf would parse and then ignore: unknown at-rules, ``@media`` blocks
+for other media, selectors that can never match on paper, unsupported
+properties and values it cannot evaluate. Results are cached per stylesheet
+and target, in memory and under the cache directory.
+
+``prune_css`` additionally drops the selectors that cannot match one
+rendered document, and the ``@font-face`` and ``@keyframes`` rules nothing
+left refers to.
+"""
+from __future__ import annotations
+
+import contextlib
+import functools
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+from . import constants
+
+CSS_TARGETS = ("html", "pdf")
+CACHE_SUBDIR = constants.CSS_SUBDIR
+# Bump when the compiler output changes so stale cache entries are not reused
+COMPILER_VERSION = "1"
+
+# At-rules whose block holds rules rather than declarations
+GROUPING_AT_RULES = frozenset({"media", "supports", "layer", "container", "document", "-moz-document", "scope", "starting-style"})
+# At-rules xhtml2pdf reads; everything else is skipped by its parser
+PDF_AT_RULES = frozenset({"charset", "import", "namespace", "media", "page", "font-face"})
+PDF_MEDIA = frozenset({"all", "print", "pdf"})
+# Never true for a static document; a selector using one outside :not() never matches
+PDF_DEAD_PSEUDO_CLASSES = frozenset(
+    {"hover", "focus", "focus-within", "focus-visible", "active", "visited", "target", "target-within"}
+)
+PDF_PSEUDO_ELEMENTS = frozenset({"before", "after", "first-line", "first-letter", "marker", "placeholder", "selection"})
+# Functions xhtml2pdf can evaluate in a declaration value; var() is resolved before
+PDF_FUNCTIONS = frozenset({"rgb", "rgba", "url", "var"})
+# Shorthands xhtml2pdf expands into the longhands it supports
+PDF_SHORTHANDS = frozenset(
+    {
+        "background", "border", "border-bottom", "border-color", "border-left", "border-radius",
+        "border-right", "border-style", "border-top", "border-width", "flex", "flex-flow", "font",
+        "gap", "list-style", "margin", "padding",
+    }
+)
+
+_FUNCTION = re.compile(r"([-\w]+)\(")
+_PSEUDO = re.compile(r"(::?)([-\w]+)")
+
+
+class Rule(NamedTuple):
+    """One parsed rule; exactly one of the optional fields is set for block rules."""
+
+    prelude: str  # selector list or "@name params"
+    declarations: Optional[List[Tuple[str, str]]] = None  # style rules
+    children: Optional[List["Rule"]] = None  # @media, @supports, ...
+    block: Optional[str] = None  # any other block, minified verbatim
+
+
+# --- scanning -------------------------------------------------------------
+
+# Strings may run to the end of the line when unterminated, as in the CSS tokenizer
+_STRING = r""""(?:\\[\s\S]|[^"\\\n])*"?|'(?:\\[\s\S]|[^'\\\n])*'?"""
+_STRING_RE = re.compile(_STRING)
+_COMMENT_RE = re.compile(rf"({_STRING})|/\*[\s\S]*?(?:\*/|$)")
+_SCAN_RE = re.compile(rf"{_STRING}|\\[\s\S]|[()\[\]{{}};,]")
+_SPACE_RE = re.compile(rf"({_STRING})|\s+")
+
+
+def _scan(text: str, i: int, stops: str) -> int:
+    """Return the index of the first char in ``stops`` outside strings and brackets."""
+    depth = 0
+    for m in _SCAN_RE.finditer(text, i):
+        c = m.group(0)
+        if len(c) != 1:
+            continue
+        if depth == 0 and c in stops:
+            return m.start()
+        if c in "([{":
+            depth += 1
+        elif c in ")]}" and depth:
+            depth -= 1
+    return len(text)
+
+
+def _outside_strings(text: str) -> str:
+    """``text`` with string contents blanked, for pattern matching."""
+    return _STRING_RE.sub('""', text)
+
+
+def strip_comments(css: str) -> str:
+    # a comment separates tokens like whitespace does
+    return _COMMENT_RE.sub(lambda m: m.group(1) or " ", css)
+
+
+@functools.lru_cache(maxsize=None)
+def _tight_re(tight: str) -> "re.Pattern[str]":
+    return re.compile(rf"({_STRING})|\s*([{re.escape(tight)}])\s*")
+
+
+def _squeeze(text: str, tight: str = "{};,") -> str:
+    """Collapse whitespace outside strings and drop it around the chars in ``tight``."""
+    text = _SPACE_RE.sub(lambda m: m.group(1) or " ", text)
+    return _tight_re(tight).sub(lambda m: m.group(1) or m.group(2), text).strip()
+
+
+# --- parsing and serialization ---------------------------------------------
+
+
+def _at_name(prelude: str) -> str:
+    return re.match(r"@([-\w]*)", prelude).group(1).lower()  # type: ignore[union-attr]
+
+
+def _parse_declarations(body: str) -> List[Tuple[str, str]]:
+    decls = []
+    i = 0
+    while i < len(body):
+        j = _scan(body, i, ";")
+        item = body[i:j]
+        i = j + 1
+        name, sep, value = item.partition(":")
+        name = name.strip()
+        value = _squeeze(value)
+        if sep and name and value:
+            decls.append((name, value))
+    return decls
+
+
+def parse(css: str) -> List[Rule]:
+    """Parse comment-free CSS into a list of rules."""
+    rules: List[Rule] = []
+    i = 0
+    n = len(css)
+    while i < n:
+        j = _scan(css, i, "{;}")
+        raw = css[i:j]
+        if j >= n or css[j] != "{":
+            # statements (@import ...;) and stray text up to the next ; or }
+            if raw.strip().startswith("@"):
+                rules.append(Rule(_squeeze(raw)))
+            i = j + 1
+            continue
+        end = _scan(css, j + 1, "}")
+        body = css[j + 1 : end]
+        i = end + 1
+        if raw.strip().startswith("@"):
+            prelude = _squeeze(raw)
+            if _at_name(prelude) in GROUPING_AT_RULES:
+                rules.append(Rule(prelude, children=parse(body)))
+            else:
+                rules.append(Rule(prelude, block=_squeeze(body)))
+        elif _scan(body, 0, "{") < len(body):
+            # nested rules (CSS nesting) are kept as they are
+            rules.append(Rule(_squeeze(raw, "{};,>~+"), block=_squeeze(body)))
+        else:
+            rules.append(Rule(_squeeze(raw, "{};,>~+"), declarations=_parse_declarations(body)))
+    return rules
+
+
+def serialize(rules: List[Rule]) -> str:
+    out = []
+    for rule in rules:
+        if rule.children is not None:
+            inner = serialize(rule.children)
+            if inner:
+                out.append(f"{rule.prelude}{{{inner}}}")
+        elif rule.declarations is not None:
+            if rule.declarations:
+                body = ";".join(f"{name}:{value}" for name, value in rule.declarations)
+                out.append(f"{rule.prelude}{{{body}}}")
+        elif rule.block is not None:
+            if rule.block:
+                out.append(f"{rule.prelude}{{{rule.block}}}")
+        else:
+            out.append(f"{rule.prelude};")
+    return "".join(out)
+
+
+# --- the pdf target ----------------------------------------------------------
+
+
+def media_types(prelude: str) -> List[str]:
+    """The media types xhtml2pdf reads from an ``@media`` prelude.
+
+    Like its parser, this takes leading identifiers up to ``and``; a query that
+    starts with ``(`` counts as ``all``.
+    """
+    types: List[str] = []
+    src = prelude[len("@media") :].strip()
+    while src:
+        m = re.match(r"-?[A-Za-z_][-\w]*", src)
+        if m is None:
+            types.append("all")
+            break
+        if m.group(0).lower() == "and":
+            break
+        types.append(m.group(0).lower())
+        src = src[m.end() :].lstrip()
+        if src.startswith(","):
+            src = src[1:].lstrip()
+    return types
+
+
+def _selector_can_match(selector: str) -> bool:
+    text = _outside_strings(selector)
+    depth = 0
+    for i, c in enumerate(text):
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth = max(depth - 1, 0)
+        elif c == ":" and depth == 0 and (i == 0 or text[i - 1] != ":"):
+            m = _PSEUDO.match(text, i)
+            if m is None:
+                continue
+            name = m.group(2).lower()
+            if name in PDF_PSEUDO_ELEMENTS or (m.group(1) == ":" and name in PDF_DEAD_PSEUDO_CLASSES):
+                return False
+            if m.group(1) == "::":
+                # any other pseudo-element does not exist in a PDF either
+                return False
+    return True
+
+
+def _split_selectors(prelude: str) -> List[str]:
+    parts = []
+    i = 0
+    while i <= len(prelude):
+        j = _scan(prelude, i, ",")
+        if prelude[i:j].strip():
+            parts.append(prelude[i:j])
+        i = j + 1
+    return parts
+
+
+@functools.lru_cache(maxsize=None)
+def pdf_properties() -> Optional[FrozenSet[str]]:
+    """Properties xhtml2pdf applies, or None when it is not installed."""
+    try:
+        from xhtml2pdf.parser import attrNames
+    except ImportError:
+        return None
+    names = set(attrNames) | PDF_SHORTHANDS
+    try:
+        from xhtml2pdf.w3c.cssSpecial import SHORTHAND_LONGHANDS  # type: ignore[attr-defined]
+
+        names.update(SHORTHAND_LONGHANDS)
+    except ImportError:
+        pass
+    return frozenset(names)
+
+
+def _keep_declaration(name: str, value: str, supported: Optional[FrozenSet[str]]) -> bool:
+    if name.startswith("--"):
+        # custom properties feed var()
+        return True
+    if supported is not None and name.lower() not in supported:
+        return False
+    return all(f.lower() in PDF_FUNCTIONS for f in _FUNCTION.findall(_outside_strings(value)))
+
+
+def filter_for_pdf(rules: List[Rule]) -> List[Rule]:
+    """Drop the rules, selectors and declarations xhtml2pdf cannot apply."""
+    supported = pdf_properties()
+    kept: List[Rule] = []
+    for rule in rules:
+        if rule.prelude.startswith("@"):
+            name = _at_name(rule.prelude)
+            if name not in PDF_AT_RULES:
+                continue
+            if name == "media":
+                if not PDF_MEDIA.intersection(media_types(rule.prelude)):
+                    continue
+                kept.append(rule._replace(children=filter_for_pdf(rule.children or [])))
+            else:
+                kept.append(rule)
+            continue
+        if rule.declarations is None:
+            kept.append(rule)
+            continue
+        selectors = [s for s in _split_selectors(rule.prelude) if _selector_can_match(s)]
+        declarations = [(n, v) for n, v in rule.declarations if _keep_declaration(n, v, supported)]
+        if selectors and declarations:
+            kept.append(Rule(",".join(selectors), declarations=declarations))
+    return kept
+
+
+# --- pruning against a document ---------------------------------------------
+
+# Functional pseudo-classes whose arguments do not have to be present in the document
+_FUNCTIONAL_PSEUDO = re.compile(r":[-\w]+\(")
+_ATTRIBUTE = re.compile(r"\[\s*([-\w]+)[^\]]*\]")
+_CLASS = re.compile(r"\.(-?[_a-zA-Z][-\w]*)")
+_ID = re.compile(r"#(-?[_a-zA-Z][-\w]*)")
+_TYPE = re.compile(r"(?:^|(?<=[\s>+~(]))([a-zA-Z][-\w]*)")
+
+
+class DocumentFeatures(NamedTuple):
+    """What selectors can require of an HTML document."""
+
+    tags: FrozenSet[str]
+    classes: FrozenSet[str]
+    ids: FrozenSet[str]
+    attributes: FrozenSet[str]
+
+
+def document_features(html: str) -> DocumentFeatures:
+    from html.parser import HTMLParser
+
+    tags = set()
+    classes = set()
+    ids = set()
+    attributes = set()
+
+    class Collector(HTMLParser):
+        def handle_starttag(self, tag, attrs):  # type: ignore[no-untyped-def]
+            tags.add(tag)
+            for name, value in attrs:
+                attributes.add(name)
+                if name == "class" and value:
+                    classes.update(value.split())
+                elif name == "id" and value:
+                    ids.add(value)
+
+    collector = Collector(convert_charrefs=True)
+    collector.feed(html)
+    collector.close()
+    return DocumentFeatures(frozenset(tags), frozenset(classes), frozenset(ids), frozenset(attributes))
+
+
+def _drop_functional_arguments(selector: str) -> str:
+    """Remove the arguments of :not(), :is(), :has() and friends."""
+    out = []
+    i = 0
+    for m in _FUNCTIONAL_PSEUDO.finditer(selector):
+        if m.start() < i:
+            continue
+        out.append(selector[i : m.start()])
+        i = _scan(selector, m.end(), ")") + 1
+    out.append(selector[i:])
+    return "".join(out)
+
+
+def selector_may_match(selector: str, features: DocumentFeatures) -> bool:
+    """False only when ``selector`` needs a tag, class, id or attribute the document lacks."""
+    text = _outside_strings(selector)
+    if "\\" in text or "|" in text.replace("|=", ""):
+        # escapes and namespaces are not worth decoding; keep the selector
+        return True
+    text = _drop_functional_arguments(text)
+    if not features.attributes.issuperset(name.lower() for name in _ATTRIBUTE.findall(text)):
+        return False
+    text = _ATTRIBUTE.sub(" ", text)
+    # pseudo-classes and pseudo-elements never require anything
+    text = re.sub(r"::?[-\w]+", " ", text)
+    return (
+        features.classes.issuperset(_CLASS.findall(text))
+        and features.ids.issuperset(_ID.findall(text))
+        and features.tags.issuperset(tag.lower() for tag in _TYPE.findall(_CLASS.sub(" ", _ID.sub(" ", text))))
+    )
+
+
+def _prune_selectors(rules: List[Rule], features: DocumentFeatures) -> List[Rule]:
+    kept: List[Rule] = []
+    for rule in rules:
+        if rule.children is not None:
+            kept.append(rule._replace(children=_prune_selectors(rule.children, features)))
+        elif rule.prelude.startswith("@"):
+            kept.append(rule)
+        else:
+            selectors = [s for s in _split_selectors(rule.prelude) if selector_may_match(s, features)]
+            if selectors:
+                kept.append(rule._replace(prelude=",".join(selectors)))
+    return kept
+
+
+def _referenced_text(rules: List[Rule]) -> str:
+    """All declaration values of ``rules``, lowercased, for looking up font and animation names."""
+    parts = []
+    for rule in rules:
+        if rule.children is not None:
+            parts.append(_referenced_text(rule.children))
+        elif rule.declarations is not None:
+            parts.extend(value for _, value in rule.declarations)
+        elif rule.block is not None and not _defines_name(rule):
+            parts.append(rule.block)
+    return " ".join(parts).lower()
+
+
+def _defines_name(rule: Rule) -> bool:
+    """True for the @font-face and @keyframes rules that other rules refer to by name."""
+    if not rule.prelude.startswith("@"):
+        return False
+    name = _at_name(rule.prelude)
+    return name == "font-face" or name.endswith("keyframes")
+
+
+def _is_referenced(name: str, text: str) -> bool:
+    name = name.strip().strip("\"'").lower()
+    return bool(name) and re.search(rf"(?<![-\w]){re.escape(name)}(?![-\w])", text) is not None
+
+
+def _prune_unreferenced(rules: List[Rule], text: str) -> List[Rule]:
+    kept: List[Rule] = []
+    for rule in rules:
+        if rule.children is not None:
+            kept.append(rule._replace(children=_prune_unreferenced(rule.children, text)))
+            continue
+        name = _at_name(rule.prelude) if _defines_name(rule) else ""
+        if name == "font-face" and rule.block is not None:
+            families = [v for n, v in _parse_declarations(rule.block) if n.lower() == "font-family"]
+            if families and not any(_is_referenced(f, text) for f in families):
+                continue
+        elif name.endswith("keyframes"):
+            if not _is_referenced(rule.prelude.split(None, 1)[-1], text):
+                continue
+        kept.append(rule)
+    return kept
+
+
+def prune_rules(rules: List[Rule], features: DocumentFeatures) -> List[Rule]:
+    """Drop selectors that cannot match the document, then unused fonts and animations."""
+    rules = _prune_selectors(rules, features)
+    return _prune_unreferenced(rules, _referenced_text(rules))
+
+
+# --- compiling and caching ---------------------------------------------------
+
+
+def compile_text(css: str, target: str) -> str:
+    """Minify ``css`` and, for the ``pdf`` target, drop what xhtml2pdf ignores."""
+    if target not in CSS_TARGETS:
+        raise ValueError(f"Unknown CSS target: {target}")
+    rules = parse(strip_comments(css))
+    if target == "pdf":
+        rules = filter_for_pdf(rules)
+    return serialize(rules)
+
+
+@functools.lru_cache(maxsize=8)
+def _parsed(css: str) -> List[Rule]:
+    return parse(strip_comments(css))
+
+
+def prune_css(css: str, html: str) -> str:
+    """Return ``css`` (minified) without the rules that cannot apply to ``html``.
+
+    The parsed stylesheet is reused across documents.
+    """
+    return serialize(prune_rules(_parsed(css), document_features(html)))
+
+
+@functools.lru_cache(maxsize=None)
+def _target_version(target: str) -> str:
+    if target != "pdf":
+        return ""
+    try:
+        from importlib.metadata import version
+
+        return version("xhtml2pdf")
+    except Exception:
+        return ""
+
+
+def cache_key(css: str, target: str) -> str:
+    h = hashlib.sha256()
+    h.update(f"{COMPILER_VERSION}\0{target}\0{_target_version(target)}\0".encode("utf-8"))
+    h.update(css.encode("utf-8"))
+    return h.hexdigest()
+
+
+_compiled: Dict[str, str] = {}
+
+
+def compile_css(css: str, target: str, *, cache_dir: Optional[Path] = None) -> str:
+    """Return the compiled stylesheet, reusing earlier results for the same style and target.
+
+    With ``cache_dir`` the result is also stored on disk, under ``compiled-css/``.
+    """
+    key = cache_key(css, target)
+    compiled = _compiled.get(key)
+    if compiled is not None:
+        return compiled
+
+    path = cache_dir / CACHE_SUBDIR / f"{key}.css" if cache_dir is not None else None
+    if path is not None:
+        try:
+            compiled = path.read_text(encoding="utf-8")
+            # the mtime records the last access for cache eviction
+            os.utime(path)
+        except OSError:
+            compiled = None
+
+    if compiled is None:
+        compiled = compile_text(css, target)
+        if path is not None:
+            from .url_cache import atomic_write
+
+            with contextlib.suppress(OSError):
+                path.parent.mkdir(parents=True, exist_ok=True)
+                atomic_write(path, compiled.encode("utf-8"))
+
+    _compiled[key] = compiled
+    return compiled
@@ -0,0 +1,144 @@
+"""Font subsetting for PDF output (``--subset-fonts``).
+
+Styles such as ``latex`` and ``tufte`` embed web fonts with ``@font-face``.
+xhtml2pdf parses the whole TrueType file of every face on every render before
+ReportLab picks the glyphs it draws. ``subset_font`` cuts a face down to the
+characters a document uses first, so it is parsed and embedded in a fraction of
+the time. Subsets are cached by font hash and character set under
+``<cache_dir>/assets/fonts``, so repeat renders and batch runs reuse them.
+
+xhtml2pdf registers a face once per process under its family name, and ReportLab
+once under its PostScript name, so a later document would be drawn with the
+subset of an earlier one. Each subset therefore gets a PostScript name of its
+own, and ``name_faces`` gives the ``@font-face`` rules of the document a
+matching family name.
+
+Needs fontTools (``pip install fonttools``); without it fonts are embedded whole.
+"""
+from __future__ import annotations
+
+import contextlib
+import functools
+import hashlib
+import html as html_lib
+import importlib.util
+import io
+import os
+import re
+import string
+from pathlib import Path
+from typing import FrozenSet
+
+from . import constants
+from . import url_cache
+
+FONT_SUBDIR = constants.FONT_SUBDIR
+# xhtml2pdf embeds TrueType only; .woff/.woff2/.otf sources are skipped by it
+SUBSET_SUFFIXES = (".ttf",)
+# Always kept: page numbers, counters, list markers and common punctuation that
+# the style or xhtml2pdf may draw without them appearing in the document text
+BASE_CHARS = string.printable + " «·»‐–—‘’“”•…−"
+# Bump when subsets change for the same font and characters
+SUBSET_VERSION = "2"
+
+_HIDDEN_RE = re.compile(r"<(head|script|style)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_TAG_RE = re.compile(r"<[^>]*>")
+_CONTENT_RE = re.compile(r"\bcontent\s*:\s*([^;}]*)", re.IGNORECASE)
+_FONT_FACE_RE = re.compile(r"@font-face\s*\{[^}]*\}", re.IGNORECASE)
+_FAMILY_RE = re.compile(r"(font-family\s*:\s*)([^;}]+)", re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=None)
+def available() -> bool:
+    """Whether fontTools is installed (without importing it, which takes a while)."""
+    return importlib.util.find_spec("fontTools") is not None
+
+
+def document_chars(html: str) -> FrozenSet[str]:
+    """Characters ``html`` may draw: its text, CSS ``content`` strings and ``BASE_CHARS``, in both cases."""
+    text = html_lib.unescape(_TAG_RE.sub(" ", _HIDDEN_RE.sub(" ", html)))
+    text += "".join(m.group(1) for m in _CONTENT_RE.finditer(html)) + BASE_CHARS
+    # text-transform may change the case
+    return frozenset(text + text.upper() + text.lower())
+
+
+def chars_key(chars: FrozenSet[str]) -> str:
+    text = SUBSET_VERSION + "\0" + "".join(sorted(chars))
+    return hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()[:16]
+
+
+def face_tag(chars: FrozenSet[str]) -> str:
+    """Suffix of the family and PostScript names of the subsets for ``chars``."""
+    return chars_key(chars)[:8]
+
+
+def name_faces(html: str, chars: FrozenSet[str]) -> str:
+    """Rename each ``@font-face`` family in ``html`` to ``<family>-<face_tag>``.
+
+    The old name stays an alias, so the rules that use it still apply.
+    """
+    tag = face_tag(chars)
+
+    def family(m: "re.Match[str]") -> str:
+        # xhtml2pdf matches the names of a family list as written, so lowercase them
+        name = m.group(2).split(",")[0].strip().strip("'\"").lower()
+        return f"{m.group(1)}'{name}-{tag}', '{name}'"
+
+    return _FONT_FACE_RE.sub(lambda m: _FAMILY_RE.sub(family, m.group(0), count=1), html)
+
+
+def subset_font(path: Path, chars: FrozenSet[str], cache_dir: Path) -> Path:
+    """A copy of the TrueType font ``path`` with only the glyphs of ``chars``, kept in ``cache_dir/fonts``.
+
+    Returns ``path`` itself when fontTools is missing, the font cannot be
+    subset or the subset would not be smaller.
+    """
+    if not available():
+        return path
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return path
+    font_key = hashlib.sha256(data).hexdigest()[:24]
+    out = cache_dir / FONT_SUBDIR / f"{font_key}-{chars_key(chars)}{path.suffix.lower()}"
+    if not out.is_file():
+        try:
+            subset = _subset(data, chars)
+        except Exception:
+            # fonts fontTools cannot read are left to xhtml2pdf
+            subset = None
+        # an empty entry remembers that the font is embedded whole
+        out.parent.mkdir(parents=True, exist_ok=True)
+        url_cache.atomic_write(out, subset if subset is not None and len(subset) < len(data) else b"")
+    else:
+        # the mtime records the last access for cache eviction
+        with contextlib.suppress(OSError):
+            os.utime(out)
+    return out if out.stat().st_size else path
+
+
+def _subset(data: bytes, chars: FrozenSet[str]) -> bytes:
+    from fontTools import subset
+
+    options = subset.Options()
+    # PDF viewers rasterise without TrueType hinting
+    options.hinting = False
+    options.desubroutinize = True
+    options.notdef_outline = True
+    options.name_IDs = ["*"]
+    font = subset.load_font(io.BytesIO(data), options)
+    try:
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(unicodes={ord(c) for c in chars})
+        subsetter.subset(font)
+        # ReportLab shares one embedded font between files with the same PostScript name
+        names = font["name"]
+        ps_name = f"{names.getDebugName(6) or 'Font'}-{face_tag(chars)}"
+        for record in names.names:
+            if record.nameID == 6:
+                record.string = ps_name
+        buf = io.BytesIO()
+        subset.save_font(font, buf, options)
+    finally:
+        font.close()
+    return buf.getvalue()
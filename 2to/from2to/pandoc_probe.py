@@ -0,0 +1,88 @@
+"""Locate pandoc once and remember it across runs.
+
+On first use pypandoc runs ``pandoc --version`` for every candidate location
+to pick a binary. The result is stored in the user cache directory and
+handed back to pypandoc in later runs, as long as the binary is unchanged.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+PROBE_FILE = "pandoc-probe.json"
+
+_probe: Optional[Dict[str, Any]] = None
+
+
+def _probe_key(pypandoc_file: str) -> str:
+    parts = [pypandoc_file, os.environ.get("PYPANDOC_PANDOC", ""), os.environ.get("PATH", "")]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def _binary_stat(path: str) -> Optional[list]:
+    resolved = path if os.sep in path else shutil.which(path)
+    try:
+        st = os.stat(resolved or path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _probe_file() -> Path:
+    from .style_utils import get_user_cache_dir
+
+    return get_user_cache_dir() / PROBE_FILE
+
+
+def _load(key: str) -> Optional[Dict[str, Any]]:
+    try:
+        data = json.loads(_probe_file().read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if data.get("key") != key or _binary_stat(data.get("path", "")) != data.get("stat"):
+        return None
+    return data
+
+
+def _save(data: Dict[str, Any]) -> None:
+    try:
+        path = _probe_file()
+        tmp = path.with_name(f".{path.name}.{os.getpid()}")
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def load_pypandoc():
+    """Import pypandoc with its pandoc path and version primed from the probe cache."""
+    global _probe
+    import pypandoc  # provided by pypandoc-binary
+
+    if _probe is not None:
+        return pypandoc
+    key = _probe_key(pypandoc.__file__)
+    data = _load(key)
+    module_vars = vars(pypandoc)
+    if data is not None and "__pandoc_path" in module_vars and "__version" in module_vars:
+        if module_vars["__pandoc_path"] is None:
+            module_vars["__pandoc_path"] = data["path"]
+            module_vars["__version"] = data["version"]
+    else:
+        path = pypandoc.get_pandoc_path()
+        data = {"key": key, "path": path, "version": pypandoc.get_pandoc_version(), "stat": _binary_stat(path)}
+        _save(data)
+    _probe = data
+    return pypandoc
+
+
+def pandoc_path() -> str:
+    return load_pypandoc().get_pandoc_path()
+
+
+def pandoc_version() -> str:
+    return load_pypandoc().get_pandoc_version()
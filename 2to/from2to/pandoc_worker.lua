@@ -0,0 +1,40 @@
+-- Long-lived pandoc worker, run as `pandoc lua pandoc_worker.lua`.
+--
+-- Reads one JSON request per line from stdin and answers with one JSON line
+-- on stdout: {"output": ...} on success or {"error": ...} on failure.
+-- Request keys: text, from, to, standalone, toc, metadata, variables.
+local json = pandoc.json
+
+local templates = {}
+
+local function template_for(format)
+  if not templates[format] then
+    templates[format] = pandoc.template.compile(pandoc.template.default(format))
+  end
+  return templates[format]
+end
+
+local function convert(req)
+  local doc = pandoc.read(req.text, req.from or "markdown")
+  for key, value in pairs(req.metadata or {}) do
+    doc.meta[key] = value
+  end
+  local opts = { table_of_contents = req.toc or false }
+  if req.standalone then
+    opts.template = template_for(req.to)
+    opts.variables = req.variables or {}
+  end
+  return pandoc.write(doc, req.to, opts)
+end
+
+for line in io.lines() do
+  local ok, result = pcall(function()
+    return convert(json.decode(line, false))
+  end)
+  if ok then
+    io.write(json.encode({ output = result }), "\n")
+  else
+    io.write(json.encode({ error = tostring(result) }), "\n")
+  end
+  io.flush()
+end
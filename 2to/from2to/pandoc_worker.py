@@ -0,0 +1,182 @@
+"""Long-lived pandoc worker process.
+
+Starting the pandoc binary is the largest fixed cost of a conversion. The
+worker keeps one ``pandoc lua`` process per Python process alive and feeds it
+conversion requests as JSON lines (see ``pandoc_worker.lua``). When the worker
+cannot be used, callers fall back to a regular pandoc subprocess.
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import subprocess
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+WORKER_SCRIPT = Path(__file__).resolve().with_name("pandoc_worker.lua")
+# pandoc.json (used by the worker script) is available from pandoc 3.1.1
+MIN_PANDOC_VERSION = (3, 1, 1)
+# Seconds to wait for a reply before the worker is killed and the request falls back
+TIMEOUT = 120
+
+
+class PandocWorkerError(RuntimeError):
+    """Raised when pandoc reports an error for a request."""
+
+
+def _version_tuple(text: str) -> tuple:
+    parts = []
+    for item in text.split("."):
+        if not item.isdigit():
+            break
+        parts.append(int(item))
+    return tuple(parts)
+
+
+class PandocWorker:
+    """A ``pandoc lua`` process answering conversion requests over stdin/stdout.
+
+    Requests are serialized with a lock, so a single worker can be shared by
+    several threads.
+    """
+
+    def __init__(self, pandoc_path: str, timeout: float = TIMEOUT) -> None:
+        self.pandoc_path = pandoc_path
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._proc: Optional[subprocess.Popen] = None
+
+    def start(self) -> None:
+        self._proc = subprocess.Popen(
+            [self.pandoc_path, "lua", str(WORKER_SCRIPT)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def request(self, req: Dict[str, Any]) -> str:
+        """Send one request and return the converted text.
+
+        Raises ``PandocWorkerError`` for conversion errors and ``OSError`` when
+        the worker process is gone, or ``TimeoutError`` after killing it when no
+        reply arrives within ``timeout`` seconds.
+        """
+        line = json.dumps(req).encode("ascii") + b"\n"
+        with self._lock:
+            if not self.alive:
+                raise BrokenPipeError("pandoc worker is not running")
+            proc = self._proc
+            assert proc is not None and proc.stdin and proc.stdout
+            expired = threading.Event()
+
+            def expire() -> None:
+                expired.set()
+                # unblocks readline with EOF
+                proc.kill()
+
+            timer = threading.Timer(self.timeout, expire)
+            timer.daemon = True
+            timer.start()
+            try:
+                proc.stdin.write(line)
+                proc.stdin.flush()
+                reply = proc.stdout.readline()
+            finally:
+                timer.cancel()
+        if expired.is_set():
+            proc.wait()
+            raise TimeoutError(f"pandoc worker did not reply within {self.timeout:g}s")
+        if not reply:
+            raise BrokenPipeError("pandoc worker exited")
+        data = json.loads(reply.decode("utf-8"))
+        if "error" in data:
+            raise PandocWorkerError(data["error"])
+        return data["output"]
+
+    def close(self) -> None:
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            if proc.stdin:
+                proc.stdin.close()
+            proc.wait(timeout=5)
+        except Exception:
+            proc.kill()
+
+
+_worker: Optional[PandocWorker] = None
+_worker_lock = threading.Lock()
+_unavailable = False
+
+
+def get_worker() -> Optional[PandocWorker]:
+    """Return the process-wide worker, starting it on first use.
+
+    Returns None when the bundled pandoc cannot run the worker.
+    """
+    global _worker, _unavailable
+    with _worker_lock:
+        if _worker is not None and _worker.alive:
+            return _worker
+        if _unavailable:
+            return None
+        try:
+            from .pandoc_probe import pandoc_path, pandoc_version
+
+            if _version_tuple(pandoc_version()) < MIN_PANDOC_VERSION:
+                raise RuntimeError("pandoc is too old for the worker backend")
+            worker = PandocWorker(pandoc_path())
+            worker.start()
+        except Exception:
+            _unavailable = True
+            return None
+        _worker = worker
+        return _worker
+
+
+def shutdown() -> None:
+    global _worker
+    with _worker_lock:
+        if _worker is not None:
+            _worker.close()
+            _worker = None
+
+
+atexit.register(shutdown)
+
+
+def convert_text(
+    text: str,
+    *,
+    to: str,
+    from_: str = "markdown",
+    standalone: bool = True,
+    toc: bool = False,
+    metadata: Optional[Dict[str, str]] = None,
+    variables: Optional[Dict[str, Any]] = None,
+) -> Optional[str]:
+    """Convert ``text`` with the worker, or return None if it is unavailable."""
+    worker = get_worker()
+    if worker is None:
+        return None
+    req = {
+        "text": text,
+        "from": from_,
+        "to": to,
+        "standalone": standalone,
+        "toc": toc,
+        "metadata": metadata or {},
+        "variables": variables or {},
+    }
+    try:
+        return worker.request(req)
+    except OSError:
+        # the process died or was killed for hanging; drop it so the next call starts a fresh one
+        shutdown()
+        return None
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import dataclasses
+import io
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+from . import constants
+
+if TYPE_CHECKING:
+    from .assets import AssetResolver
+
+PDF_ENGINES = constants.PDF_ENGINES
+DEFAULT_PDF_ENGINE = constants.DEFAULT_PDF_ENGINE
+
+
+def link_callback(uri: str, rel: str) -> str:
+    """Convert HTML URIs to absolute file paths for xhtml2pdf."""
+    # If already absolute file path
+    p = Path(uri)
+    if p.exists():
+        return str(p)
+
+    # file:// URI
+    if uri.startswith("file://"):
+        return uri[7:]
+
+    # Relative resource path to current working directory
+    rp = Path(rel).parent / uri
+    if rp.exists():
+        return str(rp)
+
+    # Last resort: return original
+    return uri
+
+
+def _resource_policy(resolver: Optional[AssetResolver]):
+    """xhtml2pdf's default resource policy, also allowing reads from the resolver's cache.
+
+    The default confines local reads to the working directory, which would block
+    downloaded assets, scaled images and font subsets kept in the cache directory.
+    A resolver with ``roots`` gets no network access and reads below its roots only.
+    """
+    if resolver is None or (resolver.cache_dir is None and resolver.roots is None):
+        return None
+    try:
+        from xhtml2pdf.config.resources import default_policy
+    except ImportError:
+        # releases without resource policies read any local file
+        return None
+    policy = default_policy()
+    cached = (resolver.cache_dir.resolve(),) if resolver.cache_dir is not None else ()
+    if resolver.roots is not None:
+        return dataclasses.replace(policy, allow_remote=False, base_dir=None, extra_roots=(*resolver.roots, *cached))
+    return dataclasses.replace(policy, extra_roots=(*policy.extra_roots, *cached))
+
+
+def html_to_pdf_bytes(html: str, base_path: Path, resolver: Optional[AssetResolver] = None) -> bytes:
+    """Render ``html`` with xhtml2pdf.
+
+    References are resolved by ``resolver`` when given (see ``assets``), otherwise
+    with ``link_callback`` relative to ``base_path``.
+    """
+    from xhtml2pdf import pisa  # optional dependency, only needed for PDF output
+
+    # Ensure that relative resources resolve relative to base_path
+    # xhtml2pdf uses pisa.CreatePDF; provide link_callback for images/fonts
+    result = io.BytesIO()
+    pisa_status = pisa.CreatePDF(  # type: ignore
+        src=html,
+        dest=result,
+        link_callback=resolver.link_callback if resolver is not None else lambda uri, rel: link_callback(uri, str(base_path)),
+        encoding="utf-8",
+        resource_policy=_resource_policy(resolver),
+    )
+    if pisa_status.err:
+        raise RuntimeError("PDF generation failed")
+    return result.getvalue()
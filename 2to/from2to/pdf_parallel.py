@@ -0,0 +1,317 @@
+"""Render long documents with xhtml2pdf in parallel processes.
+
+xhtml2pdf lays a document out on one core. ``html_to_pdf_bytes_parallel``
+splits the HTML at its top-level sections (the shallowest heading level that
+occurs more than once directly in ``<body>``, or pandoc's ``--section-divs``
+sections), renders groups of
+sections of about equal size in a process pool with the same ``<head>`` and
+style, and merges the PDFs with pypdf (installed with xhtml2pdf).
+
+Each group starts on a new page. Bookmarks are rebuilt from the headings. Links
+between groups, such as the ``--toc`` entries and footnote references,
+are rewritten as follows:
+
+- Links to a heading point at that heading's page.
+- Links to other elements point at a page estimated from the nearest
+  headings around them.
+
+Documents that print page numbers (``<pdf:pagenumber>``/``<pdf:pagecount>``)
+are rendered in one process because every chunk would count from 1.
+"""
+from __future__ import annotations
+
+import io
+import logging
+import re
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote, unquote
+
+from . import pdf
+
+if TYPE_CHECKING:
+    from .assets import AssetResolver
+
+# Cross-chunk links are rendered as URI links with this scheme and resolved after merging
+LINK_SCHEME = "x-2to-link"
+HEADINGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+VOID_ELEMENTS = frozenset(
+    "area base br col embed hr img input link meta param source track wbr".split()
+)
+
+_PAGE_NUMBER_RE = re.compile(r"<pdf:page(?:number|count)\b", re.IGNORECASE)
+_HREF_RE = re.compile(r"""(\bhref\s*=\s*)(["'])#([^"']+)\2""", re.IGNORECASE)
+_SECTION_LEVEL_RE = re.compile(r"\blevel([1-6])\b")
+_SPACE_RE = re.compile(r"\s+")
+
+
+class Heading(NamedTuple):
+    offset: int
+    level: int
+    id: str
+    text: str
+
+
+class Layout(NamedTuple):
+    body_start: int  # just after <body ...>
+    body_end: int  # at </body>
+    sections: List[int]  # offsets of the top-level sections
+    ids: Dict[str, int]  # element id -> offset
+    headings: List[Heading]  # every heading, in document order
+
+
+class _LayoutParser(HTMLParser):
+    def __init__(self, html: str) -> None:
+        super().__init__(convert_charrefs=True)
+        self._line_offsets = [0]
+        for m in re.finditer("\n", html):
+            self._line_offsets.append(m.end())
+        self.depth = 0
+        self.body_start: Optional[int] = None
+        self.body_end: Optional[int] = None
+        # (offset, sort level) of the elements directly in <body>
+        self.children: List[Tuple[int, int]] = []
+        self.ids: Dict[str, int] = {}
+        self.headings: List[Heading] = []
+        self._heading: Optional[Tuple[int, int, str, List[str]]] = None
+
+    def _offset(self) -> int:
+        line, col = self.getpos()
+        return self._line_offsets[line - 1] + col
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        offset = self._offset()
+        if tag == "body":
+            self.body_start = offset + len(self.get_starttag_text() or "")
+            self.depth = 0
+            return
+        a = dict(attrs)
+        if a.get("id"):
+            self.ids.setdefault(a["id"] or "", offset)
+        if self.body_start is not None and self.body_end is None and self.depth == 0:
+            level = 0
+            if tag in HEADINGS:
+                level = int(tag[1])
+            elif tag == "section":
+                m = _SECTION_LEVEL_RE.search(a.get("class") or "")
+                level = int(m.group(1)) if m else 0
+            self.children.append((offset, level))
+        if tag in HEADINGS and self._heading is None:
+            self._heading = (offset, int(tag[1]), a.get("id") or "", [])
+        if tag not in VOID_ELEMENTS:
+            self.depth += 1
+
+    def handle_startendtag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        depth = self.depth
+        self.handle_starttag(tag, attrs)
+        self.depth = depth
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "body" and self.body_end is None:
+            self.body_end = self._offset()
+        if tag in VOID_ELEMENTS or self.body_start is None or self.body_end is not None:
+            return
+        self.depth -= 1
+        if tag in HEADINGS and self._heading is not None:
+            offset, level, ident, text = self._heading
+            self.headings.append(Heading(offset, level, ident, _SPACE_RE.sub(" ", "".join(text)).strip()))
+            self._heading = None
+
+    def handle_data(self, data: str) -> None:
+        if self._heading is not None:
+            self._heading[3].append(data)
+
+
+def layout(html: str) -> Optional[Layout]:
+    """Find the top-level sections of ``html``; None if it cannot be split safely."""
+    parser = _LayoutParser(html)
+    parser.feed(html)
+    parser.close()
+    if parser.body_start is None or parser.body_end is None or parser.depth != 0:
+        # no body or unbalanced raw HTML: boundaries are not reliable
+        return None
+    levels = [level for _, level in parser.children if level]
+    # a lone "# Title" above "## Chapter"s does not count as a level to split at
+    repeated = [level for level in set(levels) if levels.count(level) > 1]
+    if not repeated:
+        return None
+    top = min(repeated)
+    sections = [offset for offset, level in parser.children if level == top]
+    return Layout(parser.body_start, parser.body_end, sections, parser.ids, parser.headings)
+
+
+def plan_chunks(page: Layout, chunks: int) -> List[Tuple[int, int]]:
+    """Group the sections into at most ``chunks`` body ranges of about equal size.
+
+    The content before the first section goes into the first range.
+    """
+    ranges: List[Tuple[int, int]] = []
+    start = page.body_start
+    for cut in page.sections[1:]:
+        remaining = chunks - len(ranges)
+        if remaining <= 1:
+            break
+        # cut once this range holds its share of what is left
+        if cut - start >= (page.body_end - start) / remaining:
+            ranges.append((start, cut))
+            start = cut
+    ranges.append((start, page.body_end))
+    return ranges
+
+
+def _chunk_html(html: str, page: Layout, start: int, end: int, local_ids: Dict[str, int]) -> str:
+    def relink(m: "re.Match[str]") -> str:
+        ident = unquote(m.group(3))
+        if ident in local_ids or ident not in page.ids:
+            return m.group(0)
+        return f"{m.group(1)}{m.group(2)}{LINK_SCHEME}:{quote(ident, safe='')}{m.group(2)}"
+
+    return html[: page.body_start] + _HREF_RE.sub(relink, html[start:end]) + html[page.body_end :]
+
+
+def _init_worker(log_disable: int) -> None:
+    # spawned workers start with fresh logging; keep the caller's logging.disable()
+    logging.disable(log_disable)
+
+
+def _render(html: str, base_path: Path, resolver: Optional[AssetResolver]) -> bytes:
+    return pdf.html_to_pdf_bytes(html, base_path=base_path, resolver=resolver)
+
+
+def _flat_outline(reader, items, out: List[Tuple[str, int]]) -> None:
+    for item in items:
+        if isinstance(item, list):
+            _flat_outline(reader, item, out)
+        else:
+            out.append((_SPACE_RE.sub(" ", str(item.title)).strip(), reader.get_destination_page_number(item)))
+
+
+def _heading_pages(reader, headings: List[Heading]) -> List[Tuple[Heading, int]]:
+    """Match the chunk's headings to its bookmarks by title, in order."""
+    outline: List[Tuple[str, int]] = []
+    _flat_outline(reader, reader.outline, outline)
+    found: List[Tuple[Heading, int]] = []
+    i = 0
+    for heading in headings:
+        for j in range(i, len(outline)):
+            if outline[j][0] == heading.text:
+                found.append((heading, outline[j][1]))
+                i = j + 1
+                break
+    return found
+
+
+def _target_pages(
+    page: Layout, ranges: List[Tuple[int, int]], readers: list
+) -> Tuple[Dict[str, int], List[Tuple[Heading, int]]]:
+    """Page index in the merged document of every element id, and of every bookmarked heading."""
+    targets: Dict[str, int] = {}
+    placed: List[Tuple[Heading, int]] = []
+    first = 0
+    by_offset = sorted(page.ids.items(), key=lambda kv: kv[1])
+    for (start, end), reader in zip(ranges, readers):
+        pages = len(reader.pages)
+        inside = [h for h in page.headings if start <= h.offset < end]
+        # known (offset, page) points: chunk start, headings, chunk end
+        matched = _heading_pages(reader, inside)
+        known = [(start, 0)] + [(h.offset, p) for h, p in matched] + [(end, pages - 1)]
+        for h, p in matched:
+            placed.append((h, first + p))
+            if h.id:
+                targets[h.id] = first + p
+        k = 0
+        for ident, offset in by_offset:
+            if not start <= offset < end or ident in targets:
+                continue
+            while k + 1 < len(known) and known[k + 1][0] <= offset:
+                k += 1
+            (o0, p0), (o1, p1) = known[k], known[min(k + 1, len(known) - 1)]
+            frac = (offset - o0) / (o1 - o0) if o1 > o0 else 0.0
+            targets[ident] = first + p0 + int(round(frac * (p1 - p0)))
+        first += pages
+    return targets, placed
+
+
+def _add_outline(writer, placed: List[Tuple[Heading, int]]) -> None:
+    # rebuilt from the headings: a chunk that starts below the top level has no
+    # parent for its first bookmarks and would come out nested wrongly
+    parents: List[Tuple[int, object]] = []
+    for heading, page_index in placed:
+        while parents and parents[-1][0] >= heading.level:
+            parents.pop()
+        item = writer.add_outline_item(heading.text, page_index, parent=parents[-1][1] if parents else None)
+        parents.append((heading.level, item))
+
+
+def merge(parts: List[bytes], page: Layout, ranges: List[Tuple[int, int]]) -> bytes:
+    """Concatenate the chunk PDFs, keeping bookmarks and resolving cross-chunk links."""
+    from pypdf import PdfReader, PdfWriter
+    from pypdf.generic import ArrayObject, NameObject
+
+    readers = [PdfReader(io.BytesIO(data)) for data in parts]
+    writer = PdfWriter()
+    for reader in readers:
+        writer.append(reader, import_outline=False)
+    if readers[0].metadata:
+        writer.add_metadata(dict(readers[0].metadata))
+
+    targets, placed = _target_pages(page, ranges, readers)
+    _add_outline(writer, placed)
+    prefix = f"{LINK_SCHEME}:"
+    for pdf_page in writer.pages:
+        annots = pdf_page.get("/Annots")
+        if annots is None:
+            continue
+        for ref in list(annots.get_object()):
+            annot = ref.get_object()
+            action = annot.get("/A")
+            uri = action.get_object().get("/URI") if action is not None else None
+            if uri is None or not str(uri).startswith(prefix):
+                continue
+            target = targets.get(unquote(str(uri)[len(prefix) :]))
+            if target is None:
+                annots.get_object().remove(ref)
+                continue
+            del annot[NameObject("/A")]
+            annot[NameObject("/Dest")] = ArrayObject([writer.pages[target].indirect_reference, NameObject("/Fit")])
+
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def html_to_pdf_bytes_parallel(
+    html: str,
+    base_path: Path,
+    resolver: Optional[AssetResolver] = None,
+    *,
+    jobs: int,
+) -> bytes:
+    """Like ``pdf.html_to_pdf_bytes``, rendering up to ``jobs`` groups of sections in parallel.
+
+    Falls back to a single render when the document has fewer than two
+    top-level sections or prints page numbers.
+    """
+    page = layout(html) if jobs > 1 and not _PAGE_NUMBER_RE.search(html) else None
+    if page is None or len(page.sections) < 2:
+        return _render(html, base_path, resolver)
+
+    ranges = plan_chunks(page, min(jobs, len(page.sections)))
+    chunks = []
+    for start, end in ranges:
+        local_ids = {ident: offset for ident, offset in page.ids.items() if start <= offset < end}
+        chunks.append(_chunk_html(html, page, start, end, local_ids))
+
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    # spawn: forked children would inherit ReportLab's global state and open temp files
+    with ProcessPoolExecutor(
+        max_workers=len(chunks),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(logging.root.manager.disable,),
+    ) as pool:
+        parts = list(pool.map(_render, chunks, [base_path] * len(chunks), [resolver] * len(chunks)))
+    return merge(parts, page, ranges)
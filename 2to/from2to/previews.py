@@ -0,0 +1,208 @@
+"""Render documents in several styles at once (``--style a,b,c`` or ``--style all``).
+
+Each input is converted by pandoc once and every style is added to the same
+HTML: pages are written as ``name.<style>.html``, PDFs are rendered in a
+process pool (``-j``) as ``name.<style>.pdf``, and ``name.styles.html`` links
+(and for HTML, shows) all of them side by side.
+"""
+from __future__ import annotations
+
+import argparse
+import html as html_lib
+import re
+import sys
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from . import batch
+from . import cli_common as cc
+from . import convert as conv
+from . import style_utils as su
+from . import targets
+from . import timings
+
+# --style value that selects every included style
+ALL_STYLES = "all"
+INDEX_SUFFIX = ".styles.html"
+# Concurrent style downloads
+RESOLVE_THREADS = 8
+
+INDEX_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8" />
+<title>{title}: {count} styles</title>
+<style>
+body {{ font-family: system-ui, sans-serif; margin: 1.5rem; }}
+.grid {{ display: grid; grid-template-columns: repeat(auto-fill, minmax(24rem, 1fr)); gap: 1.5rem; }}
+.style h2 {{ font-size: 1.1rem; margin: 0 0 .4rem; }}
+.style a {{ margin-right: .6rem; }}
+iframe {{ width: 100%; height: 28rem; border: 1px solid #ccc; margin-top: .4rem; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<div class="grid">
+{cards}
+</div>
+</body>
+</html>
+"""
+
+
+def parse_styles(spec: str) -> Optional[List[str]]:
+    """The styles of a multi-style ``--style`` value, or None for a single style."""
+    if spec == ALL_STYLES:
+        return [Path(name).stem for name in su.list_included_styles()]
+    if "," not in spec or su.is_url(spec) or Path(spec).exists():
+        return None
+    return [s.strip() for s in spec.split(",") if s.strip()]
+
+
+def style_labels(styles: List[str]) -> List[str]:
+    """File-name-safe, unique labels for ``styles`` (names, paths or URLs)."""
+    labels: List[str] = []
+    for style in styles:
+        name = style.rstrip("/").rsplit("/", 1)[-1] if su.is_url(style) else Path(style).name
+        if name.lower().endswith(".css"):
+            name = name[:-4]
+        label = base = re.sub(r"[^\w.-]+", "-", name).strip("-.") or "style"
+        n = 2
+        while label in labels:
+            label = f"{base}-{n}"
+            n += 1
+        labels.append(label)
+    return labels
+
+
+def output_path(out_path: Path, label: str, fmt: str) -> Path:
+    return out_path.with_name(f"{out_path.stem}.{label}{cc.OUTPUT_FORMATS[fmt]}")
+
+
+def _write_pdf(
+    html: str, input_md: Path, path: Path, args: argparse.Namespace, css_text: str, record: bool
+) -> List[timings.StageTiming]:
+    # runs in a pool process; the stages are handed back to the parent
+    if not record:
+        targets.write_pdf(html, input_md, path, args, css_text)
+        return []
+    with timings.collect() as stages:
+        targets.write_pdf(html, input_md, path, args, css_text)
+    return stages
+
+
+def index_path(out_path: Path) -> Path:
+    return out_path.with_name(out_path.stem + INDEX_SUFFIX)
+
+
+def write_index(input_md: Path, out_path: Path, labels: List[str], formats: List[str], written: Set[Path]) -> Path:
+    """Write ``name.styles.html``, linking the outputs of ``input_md`` that were ``written``."""
+    index = index_path(out_path)
+    cards = []
+    for label in labels:
+        paths = {fmt: output_path(out_path, label, fmt) for fmt in formats}
+        links = " ".join(
+            f'<a href="{html_lib.escape(path.name)}">{fmt.upper()}</a>' for fmt, path in paths.items() if path in written
+        )
+        frame = ""
+        if "html" in paths and paths["html"] in written:
+            frame = f'<iframe loading="lazy" src="{html_lib.escape(paths["html"].name)}"></iframe>'
+        cards.append(f'<div class="style"><h2>{html_lib.escape(label)}</h2>{links}{frame}</div>')
+    index.parent.mkdir(parents=True, exist_ok=True)
+    index.write_text(
+        INDEX_TEMPLATE.format(title=html_lib.escape(input_md.stem), count=len(labels), cards="\n".join(cards)),
+        encoding="utf-8",
+    )
+    return index
+
+
+def run_previews(args: argparse.Namespace, tasks: List[batch.Task], styles: List[str], formats: List[str]) -> int:
+    """Write every input in every style and format, plus an index page per input.
+
+    Returns the highest exit status (2: a style could not be resolved, 1: an output failed).
+    """
+    cache_dir = Path(args.cache_dir) if args.cache_dir else None
+
+    def resolve(style: str) -> str:
+        with timings.stage("resolve_style"):
+            return su.resolve_style(style, cache_dir=cache_dir, no_cache=args.no_cache, ttl=args.style_ttl)[0]
+
+    status = 0
+    resolved: Dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=min(RESOLVE_THREADS, len(styles))) as threads:
+        futures = {style: threads.submit(resolve, style) for style in styles}
+    for style, label in zip(styles, style_labels(styles)):
+        try:
+            resolved[label] = futures[style].result()
+        except Exception as e:
+            print(f"Style {style}: {e}", file=sys.stderr)
+            status = 2
+    if not resolved:
+        return status
+    labels = list(resolved)
+
+    jobs = batch.resolve_jobs(args.jobs)
+    pool = ProcessPoolExecutor(max_workers=jobs) if "pdf" in formats and jobs > 1 else None
+    pending: List[Tuple[Path, Path, Future]] = []
+    # inputs that get an index page, and the outputs written so far
+    indexed: List[Tuple[Path, Path]] = []
+    written: Set[Path] = set()
+    try:
+        for input_md, out_path in tasks:
+            assert out_path is not None
+            if not batch.is_stdin(input_md) and not input_md.is_file():
+                print(f"Input file not found: {input_md}", file=sys.stderr)
+                status = max(status, 2)
+                continue
+            try:
+                with timings.stage("pandoc"):
+                    html = conv.convert_markdown_to_html(
+                        input_md,
+                        pandoc_args=args.pandoc_arg,
+                        title=cc.default_title(args, input_md),
+                        toc=args.toc,
+                        backend=args.pandoc_backend,
+                        text=cc.read_markdown(input_md),
+                    )
+            except Exception as e:
+                print(f"Error converting {input_md}: {e}", file=sys.stderr)
+                status = max(status, 1)
+                continue
+
+            for label in labels:
+                for fmt in formats:
+                    path = output_path(out_path, label, fmt)
+                    css_text = targets.target_css(args, resolved[label], fmt)
+                    if fmt == "pdf" and pool is not None:
+                        pending.append((input_md, path, pool.submit(_write_pdf, html, input_md, path, args, css_text, timings.active())))
+                        continue
+                    try:
+                        (targets.write_html if fmt == "html" else targets.write_pdf)(html, input_md, path, args, css_text)
+                    except Exception as e:
+                        print(f"Error writing {path}: {e}", file=sys.stderr)
+                        status = max(status, 1)
+                    else:
+                        written.add(path)
+                        print(f"Wrote: {path}")
+            indexed.append((input_md, out_path))
+
+        for input_md, path, future in pending:
+            try:
+                stages = future.result()
+            except Exception as e:
+                print(f"Error writing {path}: {e}", file=sys.stderr)
+                status = max(status, 1)
+                continue
+            for t in stages:
+                timings.emit(t._replace(file=str(input_md)))
+            written.add(path)
+            print(f"Wrote: {path}")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # after every output, so that the pages link only what exists
+    for input_md, out_path in indexed:
+        print(f"Wrote: {write_index(input_md, out_path, labels, formats, written)}")
+    return status
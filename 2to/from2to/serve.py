@@ -0,0 +1,400 @@
+"""``2to-serve``: a local HTTP server that converts Markdown to HTML or PDF.
+
+Requests are handled on one asyncio event loop; conversions run in a fixed
+pool of worker processes that each keep a ``Converter`` per style warm.
+Requests that find every worker busy wait in a bounded queue and get a 429
+once it is full. A conversion that exceeds the timeout has its worker killed
+together with the pandoc processes it started, and the worker is replaced.
+
+    POST /html?style=NAME&title=TEXT&toc=1   Markdown body -> text/html
+    POST /pdf?style=NAME&title=TEXT&toc=1    Markdown body -> application/pdf
+    GET  /metrics                            Prometheus text format
+    GET  /health
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from . import cli_common as cc
+from . import convert as conv
+from . import style_utils as su
+from . import timings
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8020
+DEFAULT_QUEUE_DEPTH = 32
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_MAX_BODY_MB = 10.0
+MAX_HEADERS = 100
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPES = {"html": "text/html; charset=utf-8", "pdf": "application/pdf"}
+
+# (format, markdown, style, title, toc)
+Job = Tuple[str, str, str, Optional[str], bool]
+# (status, content type, body, extra headers)
+Response = Tuple[int, str, bytes, Dict[str, str]]
+
+
+class QueueFull(Exception):
+    pass
+
+
+class ConversionTimeout(Exception):
+    pass
+
+
+def _worker_main(conn: Any, options: Dict[str, Any], style: str) -> None:
+    """Worker process loop: receive jobs, send back ``(ok, bytes or error message, stage timings)``."""
+    if hasattr(os, "setsid"):
+        # own process group, so that a timeout can kill pandoc along with us
+        os.setsid()
+    # Ctrl+C is handled by the server, which then stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from .converter import Converter
+
+    converters: Dict[Tuple[str, bool], Converter] = {}
+    try:
+        converters[(style, False)] = Converter(style, **options)
+    except Exception:
+        # reported per request
+        pass
+    while True:
+        try:
+            fmt, text, style, title, toc = conn.recv()
+        except (EOFError, OSError):
+            return
+        with timings.collect() as stages:
+            try:
+                converter = converters.get((style, toc))
+                if converter is None:
+                    converter = converters[(style, toc)] = Converter(style, toc=toc, **options)
+                if fmt == "html":
+                    ok, data = True, converter.to_html(text, title=title).encode("utf-8")
+                else:
+                    ok, data = True, converter.to_pdf(text, title=title)
+            except Exception as e:
+                ok, data = False, f"{type(e).__name__}: {e}"
+        conn.send((ok, data, stages))
+
+
+class _Worker:
+    """One worker process and the pipe to it."""
+
+    def __init__(self, ctx: Any, options: Dict[str, Any], style: str) -> None:
+        self._ctx = ctx
+        self._args = (options, style)
+        self._start()
+
+    def _start(self) -> None:
+        self.conn, child = self._ctx.Pipe()
+        self.process = self._ctx.Process(target=_worker_main, args=(child, *self._args), daemon=True)
+        self.process.start()
+        child.close()
+
+    def call(self, job: Job) -> Tuple[bool, Any, List[timings.StageTiming]]:
+        self.conn.send(job)
+        return self.conn.recv()
+
+    def kill(self) -> None:
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)  # type: ignore[attr-defined]
+        except (AttributeError, OSError):
+            # no process groups (Windows) or not started its group yet
+            self.process.kill()
+        self.process.join()
+
+    def restart(self) -> None:
+        self.kill()
+        self._start()
+
+
+class WorkerPool:
+    """A fixed number of worker processes with a bounded wait queue."""
+
+    def __init__(self, size: int, options: Dict[str, Any], style: str, *, queue_depth: int, timeout: float) -> None:
+        # spawned workers do not inherit the event loop or its threads
+        ctx = multiprocessing.get_context("spawn")
+        self.size = size
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self.waiting = 0
+        self.busy = 0
+        self._workers = [_Worker(ctx, options, style) for _ in range(size)]
+        self._idle: "asyncio.Queue[_Worker]" = asyncio.Queue()
+        for worker in self._workers:
+            self._idle.put_nowait(worker)
+        # blocking pipe I/O; spare threads for calls abandoned on timeout
+        self._threads = ThreadPoolExecutor(max_workers=2 * size, thread_name_prefix="2to-serve")
+
+    async def run(self, job: Job) -> bytes:
+        if self._idle.empty() and self.waiting >= self.queue_depth:
+            raise QueueFull()
+        self.waiting += 1
+        try:
+            worker = await self._idle.get()
+        finally:
+            self.waiting -= 1
+        self.busy += 1
+        loop = asyncio.get_running_loop()
+        try:
+            ok, data, stages = await asyncio.wait_for(loop.run_in_executor(self._threads, worker.call, job), self.timeout)
+        except asyncio.TimeoutError:
+            # killing and spawning a process blocks; keep the loop serving
+            await loop.run_in_executor(None, worker.restart)
+            raise ConversionTimeout() from None
+        except (EOFError, OSError):
+            await loop.run_in_executor(None, worker.restart)
+            raise RuntimeError("Worker process died") from None
+        finally:
+            self.busy -= 1
+            self._idle.put_nowait(worker)
+        for t in stages:
+            timings.emit(t)
+        if not ok:
+            raise RuntimeError(data)
+        return data
+
+    def close(self) -> None:
+        for worker in self._workers:
+            worker.kill()
+        self._threads.shutdown(wait=False)
+
+
+class Metrics:
+    """Request counts by format, style and status, latency histograms by format
+    and time per pipeline stage (fed by a ``timings`` hook)."""
+
+    def __init__(self) -> None:
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.buckets: Dict[str, List[int]] = {}
+        self.latency_sum: Dict[str, float] = {}
+        self.latency_count: Dict[str, int] = {}
+        # stage -> [calls, wall seconds, cpu seconds]
+        self.stages: Dict[str, List[float]] = {}
+
+    def observe_stage(self, timing: timings.StageTiming) -> None:
+        s = self.stages.setdefault(timing.stage, [0, 0.0, 0.0])
+        s[0] += 1
+        s[1] += timing.wall
+        s[2] += timing.cpu
+
+    def observe(self, fmt: str, style: str, status: int, seconds: Optional[float]) -> None:
+        key = (fmt, style, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        if seconds is None:
+            return
+        counts = self.buckets.setdefault(fmt, [0] * len(LATENCY_BUCKETS))
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                counts[i] += 1
+        self.latency_sum[fmt] = self.latency_sum.get(fmt, 0.0) + seconds
+        self.latency_count[fmt] = self.latency_count.get(fmt, 0) + 1
+
+    def render(self, pool: WorkerPool) -> str:
+        lines = [
+            "# HELP from2to_queue_depth Requests waiting for a worker.",
+            "# TYPE from2to_queue_depth gauge",
+            f"from2to_queue_depth {pool.waiting}",
+            "# HELP from2to_queue_limit Maximum queue depth before requests are rejected.",
+            "# TYPE from2to_queue_limit gauge",
+            f"from2to_queue_limit {pool.queue_depth}",
+            "# HELP from2to_workers_busy Workers running a conversion.",
+            "# TYPE from2to_workers_busy gauge",
+            f"from2to_workers_busy {pool.busy}",
+            "# HELP from2to_workers Worker processes.",
+            "# TYPE from2to_workers gauge",
+            f"from2to_workers {pool.size}",
+            "# HELP from2to_requests_total Conversion requests by format, style and status.",
+            "# TYPE from2to_requests_total counter",
+        ]
+        for (fmt, style, status), n in sorted(self.requests.items()):
+            lines.append(f'from2to_requests_total{{format="{fmt}",style="{_label(style)}",status="{status}"}} {n}')
+        lines += [
+            "# HELP from2to_request_duration_seconds Time from accepting a conversion to its response.",
+            "# TYPE from2to_request_duration_seconds histogram",
+        ]
+        for fmt, counts in sorted(self.buckets.items()):
+            for bound, n in zip(LATENCY_BUCKETS, counts):
+                lines.append(f'from2to_request_duration_seconds_bucket{{format="{fmt}",le="{bound}"}} {n}')
+            lines.append(f'from2to_request_duration_seconds_bucket{{format="{fmt}",le="+Inf"}} {self.latency_count[fmt]}')
+            lines.append(f'from2to_request_duration_seconds_sum{{format="{fmt}"}} {self.latency_sum[fmt]:.6f}')
+            lines.append(f'from2to_request_duration_seconds_count{{format="{fmt}"}} {self.latency_count[fmt]}')
+        for name, help_text, index in (
+            ("from2to_stage_calls_total", "Pipeline stages run in the workers.", 0),
+            ("from2to_stage_seconds_total", "Wall time spent per pipeline stage.", 1),
+            ("from2to_stage_cpu_seconds_total", "CPU time spent per pipeline stage, pandoc included.", 2),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for stage, values in sorted(self.stages.items()):
+                value = values[index]
+                lines.append(f'{name}{{stage="{stage}"}} {value:.6f}' if index else f'{name}{{stage="{stage}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _text(status: int, message: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    return status, "text/plain; charset=utf-8", f"{message}\n".encode("utf-8"), headers or {}
+
+
+class Server:
+    def __init__(self, pool: WorkerPool, style: str, styles: Iterable[str], *, max_body: int) -> None:
+        self.pool = pool
+        self.style = style
+        # only known style names: a style URL or path would let clients fetch or read anything
+        self.styles = {style}
+        for name in styles:
+            self.styles |= {name, name[: -len(".css")] if name.endswith(".css") else name}
+        self.max_body = max_body
+        self.metrics = Metrics()
+        timings.add_hook(self.metrics.observe_stage)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            status, ctype, body, headers = await self._respond(reader)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            status, ctype, body, headers = _text(400, "Malformed request")
+        head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", f"Content-Type: {ctype}", f"Content-Length: {len(body)}", "Connection: close"]
+        head += [f"{name}: {value}" for name, value in headers.items()]
+        try:
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def _respond(self, reader: asyncio.StreamReader) -> Response:
+        request_line = await reader.readline()
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        headers: Dict[str, str] = {}
+        for _ in range(MAX_HEADERS + 1):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        else:
+            return _text(431, "Too many headers")
+
+        url = urlsplit(target)
+        fmt = url.path.strip("/")
+        if url.path == "/health":
+            return _text(200, "ok")
+        if url.path == "/metrics":
+            return 200, "text/plain; version=0.0.4; charset=utf-8", self.metrics.render(self.pool).encode("utf-8"), {}
+        if fmt not in CONTENT_TYPES:
+            return _text(404, "Not found; POST Markdown to /html or /pdf")
+        if method != "POST":
+            return _text(405, "Use POST", {"Allow": "POST"})
+        if "content-length" not in headers:
+            return _text(411, "Content-Length required")
+        length = int(headers["content-length"])
+        if length > self.max_body:
+            return _text(413, f"Body larger than {self.max_body} bytes")
+        data = await reader.readexactly(length)
+
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        style = query.get("style", self.style)
+        if style not in self.styles:
+            return _text(400, f"Unknown style: {style}")
+        try:
+            text = data.decode("utf-8")
+        except UnicodeDecodeError:
+            return _text(400, "Body is not UTF-8")
+        toc = query.get("toc", "").lower() in ("1", "true", "yes")
+
+        start = time.perf_counter()
+        try:
+            out = await self.pool.run((fmt, text, style, query.get("title") or None, toc))
+        except QueueFull:
+            self.metrics.observe(fmt, style, 429, None)
+            return _text(429, "Too many requests queued", {"Retry-After": "1"})
+        except ConversionTimeout:
+            self.metrics.observe(fmt, style, 504, time.perf_counter() - start)
+            return _text(504, f"Conversion took longer than {self.pool.timeout:g}s")
+        except RuntimeError as e:
+            self.metrics.observe(fmt, style, 500, time.perf_counter() - start)
+            return _text(500, str(e))
+        self.metrics.observe(fmt, style, 200, time.perf_counter() - start)
+        return 200, CONTENT_TYPES[fmt], out, {}
+
+
+async def serve(args: argparse.Namespace) -> None:
+    cache_dir = Path(args.cache_dir) if args.cache_dir else None
+    options: Dict[str, Any] = {
+        "pandoc_backend": args.pandoc_backend,
+        "compile_css": args.compile_css,
+        "prune_css": args.prune_css,
+        "image_dpi": args.image_dpi,
+        "cache_dir": cache_dir,
+        "style_ttl": args.style_ttl,
+        # documents come from clients: no downloads, no local files outside these
+        "asset_roots": [Path(args.assets_dir)] if args.assets_dir else [],
+    }
+    pool = WorkerPool(args.workers, options, args.style, queue_depth=args.queue_depth, timeout=args.timeout)
+    try:
+        styles = list(su.list_included_styles()) + list(su.list_cached_styles(cache_dir))
+        server = Server(pool, args.style, styles, max_body=int(args.max_body * 1024 * 1024))
+        srv = await asyncio.start_server(server.handle, args.host, args.port)
+        host, port = srv.sockets[0].getsockname()[:2]
+        print(f"Serving on http://{host}:{port} with {pool.size} workers", file=sys.stderr, flush=True)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                # Windows: Ctrl+C raises KeyboardInterrupt instead
+                pass
+        async with srv:
+            await stop.wait()
+    finally:
+        pool.close()
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    p = argparse.ArgumentParser(prog="2to-serve", description="Serve Markdown to HTML/PDF conversions over HTTP")
+    p.add_argument("--host", default=DEFAULT_HOST, help=f"Address to listen on (default: {DEFAULT_HOST})")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on, 0 for any free port (default: {DEFAULT_PORT})")
+    p.add_argument("-j", "--workers", type=int, default=0, help="Worker processes (0: one per CPU, default: 0)")
+    p.add_argument("--queue-depth", type=int, default=DEFAULT_QUEUE_DEPTH, help=f"Requests that may wait for a worker before answering 429 (default: {DEFAULT_QUEUE_DEPTH})")
+    p.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, metavar="SECONDS", help=f"Kill conversions running longer than this (default: {DEFAULT_TIMEOUT:g})")
+    p.add_argument("--max-body", type=float, default=DEFAULT_MAX_BODY_MB, metavar="MB", help=f"Largest accepted Markdown body (default: {DEFAULT_MAX_BODY_MB:g})")
+    p.add_argument("-s", "--style", default=None, help=f"Default style; requests may pick any included or cached style by name (default: {su.DEFAULT_STYLE})")
+    p.add_argument("--assets-dir", metavar="DIR", help="Directory PDF requests may read images and fonts from; relative paths resolve against it (default: only the style's own directory)")
+    p.add_argument("--cache-dir", help="Override cache directory")
+    p.add_argument("--style-ttl", type=float, default=None, metavar="SECONDS", help="Revalidate cached URL styles older than this")
+    p.add_argument("--compile-css", action="store_true", help="Minify styles and drop rules xhtml2pdf cannot apply")
+    p.add_argument("--prune-css", action="store_true", help="Inline only the rules each document can use")
+    p.add_argument("--image-dpi", type=int, default=None, metavar="DPI", help="Downscale large images in PDFs to this resolution")
+    p.add_argument("--pandoc-backend", choices=conv.PANDOC_BACKENDS, default=None, help="Run pandoc per request or keep a warm pandoc process per worker")
+    args = cc.post_parse_args(p.parse_args(list(argv) if argv is not None else None))
+    if args.workers <= 0:
+        args.workers = os.cpu_count() or 1
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,351 @@
+"""Incremental site builds (``2html --site SRC DST``).
+
+Every Markdown file under SRC becomes a page at the same place under DST.
+``DST/.2html-build.json`` records what each page was built from -- its
+Markdown, the local style file, the images it references and the files pandoc
+reads for it (``--pandoc-arg`` includes, templates and filters, and
+``bibliography``/``csl`` in the front matter) -- with their size, mtime and
+hash. A build converts only the pages whose files changed (all of them when
+the style or the options did), copies changed images under SRC next to the
+pages, removes the pages of deleted sources and rewrites only the directory
+index pages whose listing changed.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import html as html_lib
+import json
+import os
+import re
+import shutil
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from . import batch
+from . import cache_index
+from . import conversion_cache as ccache
+from . import convert as conv
+from . import style_utils as su
+from . import targets
+from .pandoc_probe import pandoc_version
+from .url_cache import atomic_write
+from .watch import local_references
+
+DB_NAME = ".2html-build.json"
+# Bump when the database layout or the pages' markup changes
+DB_VERSION = 1
+INDEX_NAME = "index.html"
+# Options that do not change the pages
+BUILD_IGNORED_ARGS = ccache.CACHE_KEY_IGNORED_ARGS | {"src", "dst", "force"}
+# front matter keys that name files pandoc reads
+FRONT_MATTER_FILES = ("bibliography", "csl", "citation-abbreviations")
+
+INDEX_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8" />
+<meta name="viewport" content="width=device-width, initial-scale=1" />
+<title>{title}</title>
+</head>
+<body>
+{up}<h1>{title}</h1>
+<ul>
+{items}
+</ul>
+</body>
+</html>
+"""
+
+_FRONT_MATTER_RE = re.compile(r"\A---[ \t]*\r?\n(.*?)\r?\n(?:---|\.\.\.)[ \t]*(?:\r?\n|\Z)", re.DOTALL)
+_H1_RE = re.compile(r"^#[ \t]+(.+?)[ \t#]*$", re.MULTILINE)
+
+
+def _key(path: Path) -> str:
+    return os.path.abspath(path)
+
+
+def _is_within(path: Path, root: Path) -> bool:
+    try:
+        Path(_key(path)).relative_to(_key(root))
+    except ValueError:
+        return False
+    return True
+
+
+def _front_matter_values(text: str, key: str) -> List[str]:
+    m = _FRONT_MATTER_RE.match(text)
+    if m is None:
+        return []
+    values: List[str] = []
+    lines = m.group(1).splitlines()
+    for i, line in enumerate(lines):
+        name, sep, value = line.partition(":")
+        if not sep or name != key:
+            continue
+        value = value.strip()
+        if value.startswith("[") and value.endswith("]"):
+            values += value[1:-1].split(",")
+        elif value:
+            values.append(value)
+        else:
+            # block list
+            for item in lines[i + 1 :]:
+                if not item.lstrip().startswith("- "):
+                    break
+                values.append(item.lstrip()[2:])
+    return [v.strip().strip("\"'") for v in values if v.strip()]
+
+
+def page_title(text: str, default: str) -> str:
+    """The title of a page for the index: its front matter title, first heading or ``default``."""
+    titles = _front_matter_values(text, "title")
+    if titles:
+        return titles[0]
+    m = _H1_RE.search(text)
+    return m.group(1) if m else default
+
+
+def front_matter_files(text: str, input_md: Path) -> List[Path]:
+    """Files named in the front matter (see ``FRONT_MATTER_FILES``).
+
+    pandoc looks for them in the working directory; the document's directory is
+    tried next.
+    """
+    files: List[Path] = []
+    for key in FRONT_MATTER_FILES:
+        for value in _front_matter_values(text, key):
+            path = Path(value)
+            if not path.exists() and (input_md.parent / value).exists():
+                path = input_md.parent / value
+            files.append(path)
+    return files
+
+
+class Signatures:
+    """Content hashes of files, rehashing only those whose size or mtime changed since ``known``."""
+
+    def __init__(self, known: Dict[str, List[Any]]) -> None:
+        self.known = known
+        # key -> [mtime_ns, size, sha256] of every file looked at in this build
+        self.current: Dict[str, List[Any]] = {}
+
+    def digest(self, path: Path) -> Optional[str]:
+        """The sha256 of ``path``, or None if it does not exist."""
+        key = _key(path)
+        sig = self.current.get(key)
+        if sig is None:
+            try:
+                st = path.stat()
+            except OSError:
+                return None
+            sig = self.known.get(key)
+            if sig is None or sig[:2] != [st.st_mtime_ns, st.st_size]:
+                h = hashlib.sha256()
+                with open(path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 16), b""):
+                        h.update(chunk)
+                sig = [st.st_mtime_ns, st.st_size, h.hexdigest()]
+            self.current[key] = sig
+        return sig[2]
+
+
+def load_db(path: Path) -> Dict[str, Any]:
+    """The build database at ``path``; an empty one if it is missing, unreadable or of another version."""
+    try:
+        db = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        db = None
+    if not isinstance(db, dict) or db.get("version") != DB_VERSION:
+        db = {"version": DB_VERSION, "config": "", "stylesheet": None, "files": {}, "pages": {}, "assets": {}, "indexes": {}}
+    return db
+
+
+def config_key(args: argparse.Namespace, css_text: str) -> str:
+    """A hash of everything every page depends on: the style, the options and pandoc."""
+    options = {k: v for k, v in sorted(vars(args).items()) if k not in BUILD_IGNORED_ARGS}
+    h = hashlib.sha256()
+    for part in (str(DB_VERSION), pandoc_version(), json.dumps(options, sort_keys=True, default=str), css_text):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _remove(path: Path, root: Path) -> None:
+    """Delete ``path`` and the directories below ``root`` it leaves empty."""
+    try:
+        path.unlink()
+    except OSError:
+        return
+    parent = path.parent
+    while parent != root and _is_within(parent, root):
+        try:
+            parent.rmdir()
+        except OSError:
+            break
+        parent = parent.parent
+
+
+def render_index(
+    directory: str, title: str, subdirs: List[str], pages: List[Tuple[str, str]], args: argparse.Namespace, css_text: str, out_path: Path
+) -> str:
+    """The index page of ``directory``: links to its subdirectories and its ``(name, title)`` pages."""
+    items = [f'<li><a href="{html_lib.escape(d)}/{INDEX_NAME}">{html_lib.escape(d)}/</a></li>' for d in subdirs]
+    items += [f'<li><a href="{html_lib.escape(name)}">{html_lib.escape(t)}</a></li>' for name, t in pages]
+    up = f'<nav><a href="../{INDEX_NAME}">Up</a></nav>\n' if directory else ""
+    page = INDEX_TEMPLATE.format(title=html_lib.escape(title), up=up, items="\n".join(items))
+    head = targets.html_head(args, css_text, out_path)
+    return su.insert_head(page, head if head is not None else su.style_tag(css_text))
+
+
+def write_indexes(
+    dst: Path, site_title: str, pages: Dict[str, Dict[str, Any]], known: Dict[str, str], args: argparse.Namespace, css_text: str
+) -> Dict[str, str]:
+    """Write the index page of every directory without an ``index`` page whose listing changed.
+
+    Returns the written or unchanged indexes (directory -> hash) for the database.
+    """
+    subdirs: Dict[str, Set[str]] = {"": set()}
+    listed: Dict[str, List[Tuple[str, str]]] = {"": []}
+    for rel, page in pages.items():
+        parent, _, name = rel.rpartition("/")
+        listed.setdefault(parent, []).append((name, page["title"]))
+        while parent:
+            up, _, sub = parent.rpartition("/")
+            subdirs.setdefault(parent, set())
+            subdirs.setdefault(up, set()).add(sub)
+            listed.setdefault(parent, [])
+            parent = up
+
+    indexes: Dict[str, str] = {}
+    for directory in sorted(subdirs):
+        rel = f"{directory}/{INDEX_NAME}" if directory else INDEX_NAME
+        if rel in pages:
+            # the directory's own index.md
+            continue
+        out_path = dst / rel
+        entries = sorted((p for p in listed[directory]), key=lambda p: (p[1].lower(), p[0]))
+        html = render_index(
+            directory, directory.rpartition("/")[2] or site_title, sorted(subdirs[directory]), entries, args, css_text, out_path
+        )
+        digest = hashlib.sha256(html.encode("utf-8")).hexdigest()
+        if known.get(directory) != digest or not out_path.is_file():
+            out_path.parent.mkdir(parents=True, exist_ok=True)
+            out_path.write_text(html, encoding="utf-8")
+            print(f"Wrote index: {out_path}")
+        indexes[directory] = digest
+    for directory in set(known) - set(indexes):
+        rel = f"{directory}/{INDEX_NAME}" if directory else INDEX_NAME
+        if rel not in pages:
+            _remove(dst / rel, dst)
+    return indexes
+
+
+def build(args: argparse.Namespace, worker: batch.Worker) -> int:
+    """Bring ``args.dst`` up to date with the Markdown tree ``args.src``; ``worker`` converts one page.
+
+    Returns the highest exit status (2: bad arguments or style, 1: a page failed).
+    """
+    src, dst = Path(args.src), Path(args.dst)
+    if not src.is_dir():
+        print(f"Source directory not found: {src}", file=sys.stderr)
+        return 2
+    if args.css_mode == "link" and args.prune_css:
+        print("--prune-css prunes per document and needs --css-mode inline", file=sys.stderr)
+        return 2
+    cache_dir = Path(args.cache_dir) if args.cache_dir else None
+    try:
+        css_text, css_path = su.resolve_style(args.style, cache_dir=cache_dir, no_cache=args.no_cache, ttl=args.style_ttl)
+    except Exception as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    css_text = targets.target_css(args, css_text, "html")
+
+    db_path = dst / DB_NAME
+    db = load_db(db_path)
+    dst.mkdir(parents=True, exist_ok=True)
+    if args.css_mode == "link":
+        args.css_dir = Path(_key(dst))
+        sheet = su.write_stylesheet(css_text, args.css_dir).name
+        if db["stylesheet"] and db["stylesheet"] != sheet:
+            _remove(dst / db["stylesheet"], dst)
+        db["stylesheet"] = sheet
+    elif db["stylesheet"]:
+        _remove(dst / db["stylesheet"], dst)
+        db["stylesheet"] = None
+    config = config_key(args, css_text)
+    rebuild_all = args.force or db["config"] != config
+
+    inputs = [(path, base) for path, base in batch.expand_inputs([str(src)]) if not _is_within(path, dst)]
+    tasks = batch.plan_tasks(inputs, str(dst), ".html", force_dir=True)
+    signatures = Signatures(db["files"])
+    shared = conv.pandoc_files(args.pandoc_arg) + ([css_path] if css_path is not None and not su.is_url(args.style) else [])
+
+    old_pages: Dict[str, Dict[str, Any]] = db["pages"]
+    pages: Dict[str, Dict[str, Any]] = {}
+    pending: Dict[str, Dict[str, Any]] = {}
+    dirty: List[batch.Task] = []
+    for input_md, out_path in tasks:
+        assert out_path is not None
+        rel = out_path.relative_to(dst).as_posix()
+        try:
+            text = input_md.read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError):
+            text = ""
+        images = [p for p in local_references(input_md) if p.is_file()]
+        deps = [input_md] + images + front_matter_files(text, input_md) + shared
+        page = {
+            "source": _key(input_md),
+            "deps": {_key(p): signatures.digest(p) for p in deps},
+            "title": page_title(text, input_md.stem),
+            # images under SRC are copied next to the page
+            "assets": sorted({Path(os.path.relpath(_key(p), _key(src))).as_posix() for p in images if _is_within(p, src)}),
+        }
+        old = old_pages.get(rel)
+        if rebuild_all or old is None or old["source"] != page["source"] or old["deps"] != page["deps"] or not out_path.is_file():
+            pending[rel] = page
+            dirty.append((input_md, out_path))
+        else:
+            pages[rel] = page
+
+    def done(task: batch.Task, status: int) -> None:
+        assert task[1] is not None
+        rel = task[1].relative_to(dst).as_posix()
+        # a failed page keeps no dependencies, so the next build retries it
+        pages[rel] = pending[rel] if status == 0 else dict(pending[rel], deps={})
+
+    status = 0
+    if dirty:
+        status = batch.run_batch(dirty, worker, args, css_text, jobs=batch.resolve_jobs(args.jobs), on_result=done)
+
+    removed = 0
+    for rel in sorted(set(old_pages) - set(pages)):
+        _remove(dst / rel, dst)
+        print(f"Removed: {dst / rel}")
+        removed += 1
+
+    assets: Dict[str, Optional[str]] = {}
+    for page in pages.values():
+        for rel in page["assets"]:
+            if rel in assets:
+                continue
+            digest = assets[rel] = signatures.digest(src / rel)
+            target = dst / rel
+            if digest is not None and (db["assets"].get(rel) != digest or not target.is_file()):
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(src / rel, target)
+    for rel in set(db["assets"]) - set(assets):
+        _remove(dst / rel, dst)
+
+    db.update(
+        config=config,
+        files=signatures.current,
+        pages=pages,
+        assets=assets,
+        indexes=write_indexes(dst, Path(_key(src)).name, pages, db["indexes"], args, css_text),
+    )
+    atomic_write(db_path, json.dumps(db, indent=1, sort_keys=True).encode("utf-8"))
+    print(f"{len(dirty)} pages rebuilt, {len(tasks) - len(dirty)} up to date, {removed} removed")
+    cache_index.enforce_budget(cache_dir)
+    return status
@@ -1,10 +1,9 @@
 from __future__ import annotations
 
-import shutil
-import sys
-import tempfile
+import functools
+import threading
 from pathlib import Path
-from typing import Iterable, Optional, Tuple
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
 from urllib.parse import urlparse
 
 PACKAGE_NAME = "from2to"
@@ -24,8 +23,21 @@ def get_package_root() -> Path:
     return Path(__file__).resolve().parent
 
 
+def get_user_cache_dir() -> Path:
+    import os
+
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA", str(Path.home() / "AppData" / "Local"))
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", str(Path.home() / ".cache"))
+    dir_ = Path(base) / PACKAGE_NAME
+    dir_.mkdir(parents=True, exist_ok=True)
+    return dir_
+
+
+@functools.lru_cache(maxsize=None)
 def get_default_cache_dir() -> Path:
-    # Prefer a cache dir inside the package install directory
+    # Decided once per process; prefer a cache dir inside the package install directory
     pkg_root = get_package_root()
     pkg_cache = pkg_root / "styles" / "cache"
     try:
@@ -41,37 +53,173 @@ def get_default_cache_dir() -> Path:
         pass
 
     # Fall back to user cache dirs
-    import os
+    return get_user_cache_dir()
 
-    if os.name == "nt":
-        base = os.environ.get("LOCALAPPDATA", str(Path.home() / "AppData" / "Local"))
-    else:
-        base = os.environ.get("XDG_CACHE_HOME", str(Path.home() / ".cache"))
-    dir_ = Path(base) / PACKAGE_NAME
-    dir_.mkdir(parents=True, exist_ok=True)
-    return dir_
+
+def get_included_dir() -> Path:
+    return get_package_root() / "styles" / "included"
 
 
 def list_included_styles() -> Iterable[str]:
-    root = get_package_root() / "styles" / "included"
-    if root.exists():
-        for p in sorted(root.glob("*.css")):
-            yield p.name
+    return [info.name for info in get_registry().styles("included")]
 
 
 def list_cached_styles(cache_dir: Optional[Path] = None) -> Iterable[str]:
-    cdir = cache_dir or get_default_cache_dir()
-    if cdir.exists():
-        for p in sorted(cdir.glob("*.css")):
-            yield p.name
+    return [info.name for info in get_registry(cache_dir).styles("cached")]
 
 
 def download_url(url: str, dest: Path) -> None:
-    import urllib.request
+    from . import url_cache
 
     dest.parent.mkdir(parents=True, exist_ok=True)
-    with urllib.request.urlopen(url) as resp, open(dest, "wb") as f:
-        shutil.copyfileobj(resp, f)
+    with url_cache.download(url) as resp:
+        url_cache.atomic_write(dest, resp.read())
+
+
+class StyleInfo(NamedTuple):
+    name: str
+    path: Path
+    source: str  # "included" or "cached"
+    size: int
+    mtime_ns: int
+
+
+class StyleRegistry:
+    """Index of included and cached styles with an in-memory CSS text cache.
+
+    The directory listings are rebuilt only when a directory's mtime changes,
+    and CSS text is re-read only when the file's mtime or size changes.
+    Safe to share between threads.
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = None) -> None:
+        self._cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._index: Dict[str, Tuple[Optional[int], Dict[str, StyleInfo]]] = {}
+        self._texts: Dict[Path, Tuple[int, int, str]] = {}
+
+    @property
+    def cache_dir(self) -> Path:
+        return self._cache_dir or get_default_cache_dir()
+
+    def _dir(self, source: str) -> Path:
+        return get_included_dir() if source == "included" else self.cache_dir
+
+    def _scan(self, source: str) -> Dict[str, StyleInfo]:
+        root = self._dir(source)
+        try:
+            dir_mtime: Optional[int] = root.stat().st_mtime_ns
+        except OSError:
+            dir_mtime = None
+        with self._lock:
+            cached = self._index.get(source)
+            if cached is not None and cached[0] == dir_mtime:
+                return cached[1]
+            found: Dict[str, StyleInfo] = {}
+            if dir_mtime is not None:
+                from . import url_cache
+
+                for p in sorted(root.glob("*.css")):
+                    try:
+                        st = p.stat()
+                    except OSError:
+                        continue
+                    # URL entries are listed by the URL's file name and the newest one
+                    # wins, but a file of that name (e.g. copied in by hand) shadows them;
+                    # the others are listed under their own file name
+                    name = url_cache.display_name(p) if source == "cached" else p.name
+                    info = StyleInfo(name, p, source, st.st_size, st.st_mtime_ns)
+                    prev = found.get(name)
+                    if prev is not None and (
+                        prev.path.name == name or (p.name != name and prev.mtime_ns > st.st_mtime_ns)
+                    ):
+                        prev, info = info, prev
+                    found[name] = info
+                    if prev is not None:
+                        found[prev.path.name] = prev._replace(name=prev.path.name)
+            self._index[source] = (dir_mtime, found)
+            return found
+
+    def styles(self, source: str) -> List[StyleInfo]:
+        return list(self._scan(source).values())
+
+    def find(self, style: str) -> Optional[StyleInfo]:
+        """Look up a style name (with or without .css) in the cache, then the included styles."""
+        names = [style]
+        if not style.endswith(".css"):
+            names.append(f"{style}.css")
+        for source in ("cached", "included"):
+            index = self._scan(source)
+            for nm in names:
+                if nm in index:
+                    return index[nm]
+            # the file name of a URL entry, hash included
+            for info in index.values():
+                if info.path.name in names:
+                    return info
+        return None
+
+    def read(self, path: Path) -> str:
+        st = path.stat()
+        with self._lock:
+            entry = self._texts.get(path)
+            if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+                return entry[2]
+        text = path.read_text(encoding="utf-8")
+        with self._lock:
+            self._texts[path] = (st.st_mtime_ns, st.st_size, text)
+        return text
+
+    def resolve(
+        self,
+        style: str,
+        *,
+        no_cache: bool = False,
+        ttl: Optional[float] = None,
+    ) -> Tuple[str, Optional[Path]]:
+        """Resolve style to CSS text and origin path.
+
+        Resolution order:
+        - If URL: use the cache entry for the URL, revalidated after ``ttl``
+          seconds (unless no_cache -> download into memory, no origin path).
+        - Elif local path exists: use it.
+        - Elif exists in cache dir as {style} or {style}.css: use it.
+        - Elif exists in included styles as {style} or {style}.css: use it.
+
+        Returns (css_text, origin_path)
+        """
+        if is_url(style):
+            from . import url_cache
+
+            if no_cache:
+                return (url_cache.fetch_text(style), None)
+            target = url_cache.fetch(style, self.cache_dir, ttl=url_cache.DEFAULT_TTL if ttl is None else ttl)
+            return (self.read(target), target)
+
+        p = Path(style)
+        if p.is_file():
+            return (self.read(p), p.resolve())
+
+        info = self.find(style)
+        if info is not None:
+            return (self.read(info.path), info.path)
+
+        raise FileNotFoundError(
+            f"Could not resolve style '{style}'. Use URL, file path, cached name, or included name."
+        )
+
+
+_registries: Dict[Optional[Path], StyleRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(cache_dir: Optional[Path] = None) -> StyleRegistry:
+    """Return the shared registry for ``cache_dir`` (None: the default cache dir)."""
+    with _registries_lock:
+        registry = _registries.get(cache_dir)
+        if registry is None:
+            registry = _registries[cache_dir] = StyleRegistry(cache_dir)
+        return registry
 
 
 def resolve_style(
@@ -79,64 +227,60 @@ def resolve_style(
     *,
     cache_dir: Optional[Path] = None,
     no_cache: bool = False,
+    ttl: Optional[float] = None,
 ) -> Tuple[str, Optional[Path]]:
-    """Resolve style to CSS text and origin path.
-
-    Resolution order:
-    - If URL: download to cache dir (unless no_cache -> temp) and use it.
-    - Elif local path exists: use it.
-    - Elif exists in cache dir as {style} or {style}.css: use it.
-    - Elif exists in included styles as {style} or {style}.css: use it.
+    """Resolve style to CSS text and origin path via the shared registry.
 
-    Returns (css_text, origin_path)
+    See ``StyleRegistry.resolve`` for the resolution order.
     """
-    cdir = cache_dir or get_default_cache_dir()
-
-    def read_css(path: Path) -> str:
-        return path.read_text(encoding="utf-8")
-
-    if is_url(style):
-        url_path = urlparse(style).path
-        name = Path(url_path).name or "style.css"
-        if not name.endswith(".css"):
-            name = f"{name}.css"
-        if no_cache:
-            tmp = Path(tempfile.gettempdir()) / f"{PACKAGE_NAME}-{name}"
-            download_url(style, tmp)
-            return (read_css(tmp), tmp)
-        else:
-            cdir.mkdir(parents=True, exist_ok=True)
-            target = cdir / name
-            if not target.exists():
-                download_url(style, target)
-            return (read_css(target), target)
-
-    p = Path(style)
-    if p.is_file():
-        return (read_css(p), p.resolve())
-
-    names = [style]
-    if not style.endswith(".css"):
-        names.append(f"{style}.css")
-
-    for nm in names:
-        cp = cdir / nm
-        if cp.is_file():
-            return (read_css(cp), cp)
-
-    inc_root = get_package_root() / "styles" / "included"
-    for nm in names:
-        ip = inc_root / nm
-        if ip.is_file():
-            return (read_css(ip), ip)
-
-    raise FileNotFoundError(
-        f"Could not resolve style '{style}'. Use URL, file path, cached name, or included name."
-    )
+    return get_registry(cache_dir).resolve(style, no_cache=no_cache, ttl=ttl)
 
 
-def inject_css(html: str, css_text: str) -> str:
-    style_tag = f"\n<style>\n{css_text}\n</style>\n"
+def style_tag(css_text: str) -> str:
+    return f"\n<style>\n{css_text}\n</style>\n"
+
+
+def link_tag(href: str) -> str:
+    from html import escape
+
+    return f'\n<link rel="stylesheet" href="{escape(href)}" />\n'
+
+
+def insert_head(html: str, tag: str) -> str:
+    """Insert ``tag`` before ``</head>``, or at the start when there is no head."""
     if "</head>" in html:
-        return html.replace("</head>", style_tag + "</head>", 1)
-    return style_tag + html
+        return html.replace("</head>", tag + "</head>", 1)
+    return tag + html
+
+
+def inject_css(html: str, css_text: str) -> str:
+    return insert_head(html, style_tag(css_text))
+
+
+def stylesheet_name(css_text: str) -> str:
+    """Content-hashed file name for a shared stylesheet, e.g. ``style.1a2b3c4d5e6f.css``."""
+    import hashlib
+
+    return f"style.{hashlib.sha256(css_text.encode('utf-8')).hexdigest()[:12]}.css"
+
+
+def write_stylesheet(css_text: str, directory: Path) -> Path:
+    """Write ``css_text`` to its content-hashed file in ``directory`` unless it is already there."""
+    from . import url_cache
+
+    path = directory / stylesheet_name(css_text)
+    if not path.is_file():
+        directory.mkdir(parents=True, exist_ok=True)
+        url_cache.atomic_write(path, css_text.encode("utf-8"))
+    return path
+
+
+def stylesheet_href(css_text: str, css_dir: Path, out_path: Path) -> str:
+    """Relative URL of the shared stylesheet in ``css_dir`` as seen from ``out_path``."""
+    import os
+
+    return Path(os.path.relpath(css_dir / stylesheet_name(css_text), out_path.parent)).as_posix()
+
+
+def link_css(html: str, href: str) -> str:
+    return insert_head(html, link_tag(href))
@@ -0,0 +1,140 @@
+"""Write the HTML and PDF outputs of a conversion.
+
+``write_html`` and ``write_pdf`` are the last stages of 2html and 2pdf: they
+take pandoc's HTML and add the style, render and write. ``convert_many`` is
+the batch worker behind ``--to html,pdf``: it parses each input once into
+pandoc's AST (cached in memory and under the cache directory, see
+``convert.parse_markdown``), renders the HTML once and writes every requested
+format from it.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from . import batch
+from . import cli_common as cc
+from . import constants
+from . import convert as conv
+from . import style_utils as su
+from . import timings
+
+
+def target_css(args: argparse.Namespace, css_text: str, target: str) -> str:
+    """The style for ``target`` (see ``css.CSS_TARGETS``), compiled with ``--compile-css``."""
+    if not args.compile_css:
+        return css_text
+    from . import css
+
+    cache_dir = Path(args.cache_dir) if args.cache_dir else su.get_default_cache_dir()
+    return css.compile_css(css_text, target, cache_dir=cache_dir)
+
+
+def html_head(args: argparse.Namespace, css_text: str, out_path: Optional[Path]) -> Optional[str]:
+    """The ``<style>`` or ``<link>`` for an HTML output; None if ``--prune-css`` needs the document first."""
+    if getattr(args, "css_mode", "inline") == "link":
+        # Reference the shared stylesheet written by run_conversions
+        assert out_path is not None, "linked styles need an output file"
+        return su.link_tag(su.stylesheet_href(css_text, args.css_dir, out_path))
+    if args.prune_css:
+        return None
+    return su.style_tag(css_text)
+
+
+def write_html(html: str, input_md: Path, out_path: Optional[Path], args: argparse.Namespace, css_text: str) -> None:
+    """Add the style to pandoc's ``html`` and write it to ``out_path`` (stdout if None)."""
+    with timings.stage("inject_css"):
+        head = html_head(args, css_text, out_path)
+        if head is None:
+            head = su.style_tag(cc.prune_style(args, css_text, html, input_md))
+        html = su.insert_head(html, head)
+
+    with timings.stage("write"):
+        if out_path is None:
+            sys.stdout.write(html)
+            return
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        out_path.write_text(html, encoding="utf-8")
+
+
+def write_pdf(html: str, input_md: Path, out_path: Optional[Path], args: argparse.Namespace, css_text: str) -> None:
+    """Render pandoc's ``html`` with the style using xhtml2pdf and write it to ``out_path`` (stdout if None)."""
+    from . import assets
+    from . import fonts
+    from . import pdf
+    from . import pdf_parallel
+
+    with timings.stage("inject_css"):
+        css_text = cc.prune_style(args, css_text, html, input_md)
+        html = su.inject_css(html, css_text)
+        font_chars = fonts.document_chars(html) if getattr(args, "subset_fonts", False) else None
+        if font_chars is not None:
+            html = fonts.name_faces(html, font_chars)
+
+    # Resolve images and fonts once, relative to the input's directory; remote ones are
+    # downloaded concurrently into the cache
+    resolver = assets.AssetResolver(
+        input_md.resolve().parent,
+        Path(args.cache_dir) if args.cache_dir else su.get_default_cache_dir(),
+        ttl=args.style_ttl,
+        image_dpi=getattr(args, "image_dpi", None),
+        font_chars=font_chars,
+    )
+    with timings.stage("assets"):
+        resolver.prefetch(assets.references(html))
+
+    # Produce PDF in memory
+    with timings.stage("pdf"):
+        render_jobs = batch.resolve_jobs(getattr(args, "render_jobs", 1))
+        if render_jobs > 1:
+            pdf_bytes = pdf_parallel.html_to_pdf_bytes_parallel(
+                html, base_path=input_md.resolve(), resolver=resolver, jobs=render_jobs
+            )
+        else:
+            pdf_bytes = pdf.html_to_pdf_bytes(html, base_path=input_md.resolve(), resolver=resolver)
+    with timings.stage("write"):
+        if out_path is None:
+            cc.write_stdout(pdf_bytes)
+            return
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        out_path.write_bytes(pdf_bytes)
+
+
+def convert_many(input_md: Path, out_path: Optional[Path], args: argparse.Namespace, css_text: str) -> List[Path]:
+    """Write every format of ``args.to``, named like ``out_path`` with the format's suffix.
+
+    ``css_text`` is the uncompiled style; it is compiled per format. Returns the files written.
+    """
+    assert out_path is not None, "--to needs output files"
+    cache_dir = Path(args.cache_dir) if args.cache_dir else su.get_default_cache_dir()
+    with timings.stage("parse"):
+        ast = conv.parse_markdown(
+            input_md,
+            pandoc_args=args.pandoc_arg,
+            backend=args.pandoc_backend,
+            text=cc.read_markdown(input_md),
+            cache_dir=cache_dir,
+        )
+    title = cc.default_title(args, input_md)
+
+    html = None
+    written: List[Path] = []
+    for fmt in args.to:
+        path = out_path.with_suffix(cc.OUTPUT_FORMATS[fmt])
+        if fmt == "pdf" and getattr(args, "engine", constants.DEFAULT_PDF_ENGINE) == "pandoc":
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with timings.stage("pandoc"):
+                conv.render_ast(ast, "pdf", pandoc_args=args.pandoc_arg, title=title, toc=args.toc, outputfile=str(path))
+        else:
+            if html is None:
+                # one HTML rendering serves the page and the xhtml2pdf input
+                with timings.stage("pandoc"):
+                    html = conv.render_ast(
+                        ast, "html", pandoc_args=args.pandoc_arg, title=title, toc=args.toc, backend=args.pandoc_backend
+                    )
+            write = write_html if fmt == "html" else write_pdf
+            write(html, input_md, path, args, target_css(args, css_text, fmt))
+        written.append(path)
+    return written
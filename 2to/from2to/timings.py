@@ -0,0 +1,150 @@
+"""Per-stage timing instrumentation for the conversion pipeline.
+
+The pipeline wraps its stages (``resolve_style``, ``pandoc``, ``inject_css``,
+``assets``, ``pdf``, ``write``) in ``stage(name)``. Each finished stage is
+passed as a ``StageTiming`` to the registered hooks, or to the list of the
+enclosing ``collect()`` block in the same thread or task; with neither a
+stage costs two checks.
+
+CPU time includes child processes (pandoc) once they have exited. Peak memory
+is the process's resident set high-water mark when the stage ends, so a stage
+that raises it is the one that allocated the most; it is None on Windows.
+"""
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+
+class StageTiming(NamedTuple):
+    stage: str
+    wall: float  # seconds
+    cpu: float  # seconds, this process and its finished children
+    max_rss: Optional[int]  # bytes
+    file: Optional[str] = None
+
+
+Hook = Callable[[StageTiming], None]
+
+_hooks: List[Hook] = []
+# the stages list of the innermost collect() block; per thread and asyncio task
+_collecting: "contextvars.ContextVar[Optional[List[StageTiming]]]" = contextvars.ContextVar("collecting", default=None)
+
+
+def add_hook(hook: Hook) -> None:
+    """Call ``hook`` with every finished stage (e.g. to feed a metrics system)."""
+    _hooks.append(hook)
+
+
+def remove_hook(hook: Hook) -> None:
+    with contextlib.suppress(ValueError):
+        _hooks.remove(hook)
+
+
+def active() -> bool:
+    """Whether any hook is registered, i.e. whether stage timings are used."""
+    return bool(_hooks)
+
+
+def emit(timing: StageTiming) -> None:
+    for hook in list(_hooks):
+        hook(timing)
+
+
+def _cpu() -> float:
+    # os.times() counts in clock ticks; process_time() resolves short stages
+    t = os.times()
+    return time.process_time() + t.children_user + t.children_system
+
+
+def max_rss() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    recorded = _collecting.get()
+    if recorded is None and not _hooks:
+        yield
+        return
+    wall, cpu = time.perf_counter(), _cpu()
+    try:
+        yield
+    finally:
+        timing = StageTiming(name, time.perf_counter() - wall, _cpu() - cpu, max_rss())
+        if recorded is not None:
+            recorded.append(timing)
+        else:
+            emit(timing)
+
+
+@contextlib.contextmanager
+def collect() -> Iterator[List[StageTiming]]:
+    """Capture the stages run inside the block instead of passing them to the hooks.
+
+    Batch workers use this to return a file's stages to the parent process,
+    which then emits them with the file name attached. Only stages of the
+    current thread (or asyncio task) are captured; the hooks stay in place for
+    the others.
+    """
+    recorded: List[StageTiming] = []
+    token = _collecting.set(recorded)
+    try:
+        yield recorded
+    finally:
+        _collecting.reset(token)
+
+
+class Recorder:
+    """Hook that keeps every stage, for the ``--timings`` report."""
+
+    def __init__(self) -> None:
+        self.timings: List[StageTiming] = []
+        self.start = time.perf_counter()
+
+    def __call__(self, timing: StageTiming) -> None:
+        self.timings.append(timing)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        stages: Dict[str, Dict[str, float]] = {}
+        for t in self.timings:
+            s = stages.setdefault(t.stage, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "max_rss_bytes": 0})
+            s["calls"] += 1
+            s["wall_s"] += t.wall
+            s["cpu_s"] += t.cpu
+            s["max_rss_bytes"] = max(s["max_rss_bytes"], t.max_rss or 0)
+        return stages
+
+    def report(self, fmt: str = "text") -> str:
+        total = time.perf_counter() - self.start
+        if fmt == "json":
+            return json.dumps(
+                {
+                    "wall_s": round(total, 6),
+                    "max_rss_bytes": max_rss(),
+                    "summary": {
+                        name: {k: round(v, 6) if isinstance(v, float) else v for k, v in s.items()} for name, s in self.summary().items()
+                    },
+                    "stages": [
+                        {"stage": t.stage, "file": t.file, "wall_s": round(t.wall, 6), "cpu_s": round(t.cpu, 6), "max_rss_bytes": t.max_rss}
+                        for t in self.timings
+                    ],
+                }
+            )
+        lines = [f"{'stage':<14} {'calls':>5} {'wall':>10} {'cpu':>10} {'peak RSS':>10}"]
+        for name, s in self.summary().items():
+            rss = f"{s['max_rss_bytes'] / 1024 ** 2:.1f} MiB" if s["max_rss_bytes"] else "-"
+            lines.append(f"{name:<14} {s['calls']:>5} {s['wall_s'] * 1000:>7.1f} ms {s['cpu_s'] * 1000:>7.1f} ms {rss:>10}")
+        lines.append(f"{'total':<14} {'':>5} {total * 1000:>7.1f} ms")
+        return "\n".join(lines)
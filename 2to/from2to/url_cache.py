@@ -0,0 +1,211 @@
+"""HTTP cache for URL styles (and remote PDF assets, see ``assets``).
+
+Each URL gets its own entry, ``<name>-<hash of url>.css``, with a JSON
+sidecar holding the URL, ETag, Last-Modified and fetch time. Entries are
+listed and looked up by ``<name>.css`` (see ``display_name``) and are reused
+for ``ttl`` seconds and then revalidated with a conditional request.
+Writes go through a temp file and ``os.replace``, and a per-entry lock file
+serializes concurrent processes fetching the same URL.
+"""
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+from . import constants
+
+DEFAULT_TTL = constants.DEFAULT_STYLE_TTL
+META_SUFFIX = constants.META_SUFFIX
+LOCK_SUFFIX = constants.LOCK_SUFFIX
+TIMEOUT = 30
+
+_ENTRY_RE = re.compile(r"^(?P<name>.+)-[0-9a-f]{16}(?P<suffix>\.[^.]+)$")
+
+
+def _read_umask() -> int:
+    # the umask can only be read by setting it; done once, at import
+    mask = os.umask(0o022)
+    os.umask(mask)
+    return mask
+
+
+_UMASK = _read_umask()
+
+
+def file_mode() -> int:
+    """The mode ``open`` gives new files (``0o666`` less the umask); mkstemp files get 0600."""
+    return 0o666 & ~_UMASK
+
+
+def entry_path(url: str, cache_dir: Path, suffix: str = ".css") -> Path:
+    name = Path(urlparse(url).path).name or f"style{suffix}"
+    if suffix and name.endswith(suffix):
+        name = name[: -len(suffix)]
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    return cache_dir / f"{name}-{digest}{suffix}"
+
+
+def meta_path(entry: Path) -> Path:
+    return entry.with_name(entry.name + META_SUFFIX)
+
+
+def display_name(entry: Path) -> str:
+    """The name of the URL's file, which ``entry`` is listed and looked up by.
+
+    Files without a sidecar, such as styles copied in by hand, keep their own name.
+    """
+    m = _ENTRY_RE.match(entry.name)
+    if m is not None and meta_path(entry).is_file():
+        return m.group("name") + m.group("suffix")
+    return entry.name
+
+
+@contextlib.contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """Hold an exclusive cross-process lock on ``path`` (created if missing)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ~10s; keep waiting
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write(path: Path, data: bytes) -> None:
+    """Replace ``path`` with ``data`` in one step, with the mode a plain write would give it."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, file_mode())
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise
+
+
+def read_meta(entry: Path) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads(meta_path(entry).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(entry: Path, meta: Dict[str, Any]) -> None:
+    atomic_write(meta_path(entry), json.dumps(meta, indent=2).encode("utf-8"))
+
+
+def remove_unused_lock(path: Path) -> bool:
+    """Unlink the lock file ``path`` unless a process holds it; returns whether it is gone."""
+    if os.name == "nt":
+        # a lock file in use is open, and Windows refuses to delete open files
+        try:
+            path.unlink(missing_ok=True)
+        except PermissionError:
+            return False
+        return True
+
+    import fcntl
+
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return True
+    with f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        path.unlink(missing_ok=True)
+    return True
+
+
+def download(url: str, headers: Optional[Dict[str, str]] = None) -> Any:
+    import urllib.request
+
+    req = urllib.request.Request(url, headers=headers or {})
+    return urllib.request.urlopen(req, timeout=TIMEOUT)
+
+
+def fetch(url: str, cache_dir: Path, *, ttl: float = DEFAULT_TTL, suffix: str = ".css") -> Path:
+    """Return the cache entry for ``url``, downloading or revalidating it as needed.
+
+    A stale entry is kept (and returned) when revalidation fails.
+    """
+    import urllib.error
+
+    entry = entry_path(url, cache_dir, suffix)
+    with file_lock(entry.with_name(entry.name + LOCK_SUFFIX)):
+        meta = read_meta(entry) if entry.is_file() else None
+        if meta is not None and time.time() - meta.get("fetched_at", 0) < ttl:
+            # the sidecar's mtime records the last access for cache eviction
+            with contextlib.suppress(OSError):
+                os.utime(meta_path(entry))
+            return entry
+
+        headers: Dict[str, str] = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            with download(url, headers) as resp:
+                data = resp.read()
+                etag = resp.headers.get("ETag")
+                last_modified = resp.headers.get("Last-Modified")
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and meta is not None:
+                meta["fetched_at"] = time.time()
+                _write_meta(entry, meta)
+                return entry
+            if meta is not None:
+                return entry
+            raise
+        except OSError:
+            if meta is not None:
+                return entry
+            raise
+
+        atomic_write(entry, data)
+        _write_meta(
+            entry,
+            {"url": url, "etag": etag, "last_modified": last_modified, "fetched_at": time.time()},
+        )
+        return entry
+
+
+def fetch_text(url: str) -> str:
+    """Download ``url`` without caching it."""
+    with download(url) as resp:
+        return resp.read().decode("utf-8")
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Sequence, Set
+
+from . import batch
+from .style_utils import is_url
+
+if TYPE_CHECKING:
+    from .conversion_cache import ConversionCache
+
+POLL_INTERVAL = 0.5
+# Quiet period required after the last change before rebuilding
+DEBOUNCE = 0.3
+
+_MD_IMAGE_RE = re.compile(r"!\[[^\]]*\]\(\s*<?([^)\s>]+)")
+_HTML_SRC_RE = re.compile(r"""\bsrc\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+
+
+def local_references(input_md: Path) -> List[Path]:
+    """Return local image paths referenced by a Markdown document."""
+    try:
+        text = input_md.read_text(encoding="utf-8")
+    except (OSError, UnicodeDecodeError):
+        return []
+    refs: List[Path] = []
+    for m in list(_MD_IMAGE_RE.finditer(text)) + list(_HTML_SRC_RE.finditer(text)):
+        ref = m.group(1)
+        if is_url(ref) or ":" in ref.split("/", 1)[0]:
+            # remote or data: URIs
+            continue
+        refs.append(input_md.parent / ref)
+    return refs
+
+
+def _mtimes(paths: Iterable[Path]) -> Dict[Path, Optional[int]]:
+    found: Dict[Path, Optional[int]] = {}
+    for p in paths:
+        try:
+            found[p] = p.stat().st_mtime_ns
+        except OSError:
+            found[p] = None
+    return found
+
+
+def watch(
+    args: argparse.Namespace,
+    worker: batch.Worker,
+    plan: Callable[[], Sequence[batch.Task]],
+    resolve_css: Callable[[], str],
+    css_text: str,
+    style_path: Optional[Path],
+    *,
+    cache: Optional[ConversionCache] = None,
+) -> int:
+    """Re-render tasks whenever their input, local images or the local style change.
+
+    Conversions run in this process, so imports, the resolved style and the
+    pandoc worker (if enabled) stay warm between rebuilds. Returns on Ctrl+C.
+    """
+    deps: Dict[Path, List[Path]] = {}
+
+    def dependencies(tasks: Sequence[batch.Task], refresh: Set[Path]) -> Set[Path]:
+        paths: Set[Path] = set()
+        for input_md, _out in tasks:
+            if input_md not in deps or input_md in refresh:
+                deps[input_md] = [input_md] + local_references(input_md)
+            paths.update(deps[input_md])
+        if style_path is not None:
+            paths.add(style_path)
+        return paths
+
+    print("Watching for changes (Ctrl+C to stop)...", file=sys.stderr)
+    try:
+        tasks = plan()
+        seen = _mtimes(dependencies(tasks, set()))
+        while True:
+            time.sleep(POLL_INTERVAL)
+            tasks = plan()
+            current = _mtimes(dependencies(tasks, set()))
+            if current == seen:
+                continue
+            while True:
+                time.sleep(DEBOUNCE)
+                settled = _mtimes(current)
+                if settled == current:
+                    break
+                current = settled
+
+            changed = {p for p in current if current[p] != seen.get(p)}
+            if style_path is not None and style_path in changed:
+                try:
+                    css_text = resolve_css()
+                except Exception as e:
+                    print(str(e), file=sys.stderr)
+                    seen = current
+                    continue
+                dirty = list(tasks)
+            else:
+                dirty = [t for t in tasks if any(p in changed for p in deps[t[0]])]
+
+            # an edited input may reference different images now
+            current.update(_mtimes(dependencies(tasks, {t[0] for t in dirty}) - set(current)))
+            seen = current
+            if dirty:
+                batch.run_batch(dirty, worker, args, css_text, cache=cache)
+    except KeyboardInterrupt:
+        return 0
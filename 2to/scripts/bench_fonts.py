@@ -0,0 +1,106 @@
+"""Compare PDF size and render time with whole and subset (--subset-fonts) fonts.
+
+    uv run --extra fonts scripts/bench_fonts.py --font LM-regular.ttf LM-bold.ttf LM-italic.ttf
+
+Embeds the given TrueType files as the regular, bold, italic and bold italic
+faces of the body font of a generated document and renders it three times,
+each in a fresh process because xhtml2pdf keeps embedded fonts for the whole
+process: with whole fonts, with subsets made from scratch (``cold``) and with
+the cached subsets (``cached``). The time covers font subsetting and the
+xhtml2pdf render; the best of ``--repeat`` runs is reported.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from bench_suite import VARIANTS, document
+from from2to import assets
+from from2to import convert as conv
+from from2to import fonts
+from from2to import pdf
+from from2to import style_utils as su
+
+# (font-weight, font-style) of the --font files, in order
+FACES = (("normal", "normal"), ("bold", "normal"), ("normal", "italic"), ("bold", "italic"))
+
+
+def font_css(paths: List[Path]) -> str:
+    rules = [
+        f"@font-face {{ font-family: 'Bench'; font-weight: {weight}; font-style: {style}; src: url('{path.name}'); }}"
+        for path, (weight, style) in zip(paths, FACES)
+    ]
+    return "\n".join(rules) + "\nbody, h1, h2, h3, p, li, td, th { font-family: 'Bench'; }\n"
+
+
+def render(html: str, md: Path, cache_dir: Path, subset: bool) -> Tuple[float, int]:
+    """Render in this (fresh) process; returns the wall time and the PDF size."""
+    logging.disable(logging.WARNING)
+    # xhtml2pdf reads local files below the working directory only
+    os.chdir(md.parent)
+    start = time.perf_counter()
+    font_chars = fonts.document_chars(html) if subset else None
+    if font_chars is not None:
+        html = fonts.name_faces(html, font_chars)
+    resolver = assets.AssetResolver(md.parent, cache_dir, font_chars=font_chars)
+    resolver.prefetch(assets.references(html))
+    data = pdf.html_to_pdf_bytes(html, base_path=md, resolver=resolver)
+    return time.perf_counter() - start, len(data)
+
+
+def best(html: str, md: Path, cache_dir: Path, subset: bool, repeat: int, clear: Optional[Path] = None) -> Tuple[float, int]:
+    runs = []
+    for _ in range(repeat):
+        if clear is not None:
+            for p in clear.glob("*"):
+                p.unlink()
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            runs.append(pool.submit(render, html, md, cache_dir, subset).result())
+    return min(runs)
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--font", type=Path, nargs="+", required=True, help="TrueType files: regular [bold [italic [bold italic]]]")
+    p.add_argument("--sections", type=int, default=30, help="Sections in the generated document (default: %(default)s)")
+    p.add_argument("--variant", choices=VARIANTS, default="plain", help="Section content (default: %(default)s)")
+    p.add_argument("--repeat", type=int, default=3, help="Runs per measurement (default: %(default)s)")
+    args = p.parse_args()
+
+    if not fonts.available():
+        p.error("fontTools is not installed (uv run --extra fonts ...)")
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        md = root / "doc.md"
+        md.write_text(document(args.sections, args.variant), encoding="utf-8")
+        # next to the document, where xhtml2pdf may read them
+        faces = [root / f"face{i}{font.suffix}" for i, font in enumerate(args.font[: len(FACES)])]
+        for face, font in zip(faces, args.font):
+            shutil.copyfile(font, face)
+        html = su.inject_css(conv.convert_markdown_to_html(md, title="Fonts"), font_css(faces))
+        cache_dir = root / "cache"
+        subsets = cache_dir / assets.CACHE_SUBDIR / fonts.FONT_SUBDIR
+
+        whole = best(html, md, cache_dir, False, args.repeat)
+        cold = best(html, md, cache_dir, True, args.repeat, clear=subsets)
+        cached = best(html, md, cache_dir, True, args.repeat)
+        print(f"{len(fonts.document_chars(html))} characters, {sum(f.stat().st_size for f in args.font) / 1024:.0f} KiB of fonts")
+        print(f"{'fonts':<16} {'render':>9} {'speedup':>8} {'size':>10} {'saved':>7}")
+        for name, (wall, size) in (("whole", whole), ("subset (cold)", cold), ("subset (cached)", cached)):
+            print(
+                f"{name:<16} {wall:>8.3f}s {whole[0] / wall:>7.2f}x {size / 1024:>6.0f} KiB "
+                f"{1 - size / whole[1]:>6.0%}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
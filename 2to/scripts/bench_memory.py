@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench_pdf_engines import SAMPLE_SECTION
+
+# Run in a fresh interpreter per mode so peak RSS is not shared between them
+CHILD = """
+import json, resource, sys
+from pathlib import Path
+from from2to import convert as conv
+from from2to import style_utils as su
+
+mode, input_md, out_path = sys.argv[1], Path(sys.argv[2]), Path(sys.argv[3])
+css_text, _ = su.resolve_style(su.DEFAULT_STYLE)
+if mode == "string":
+    html = conv.convert_markdown_to_html(input_md, title="bench")
+    out_path.write_text(su.inject_css(html, css_text), encoding="utf-8")
+else:
+    conv.stream_markdown_to_html(input_md, out_path, title="bench", head=su.style_tag(css_text))
+scale = 1 if sys.platform == "darwin" else 1024
+print(json.dumps({
+    "python": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+    "pandoc": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+}))
+"""
+MODES = ("string", "stream")
+
+
+def generate(path: Path, size_mb: float) -> None:
+    target = int(size_mb * 1024 * 1024)
+    written = 0
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# Memory benchmark\n")
+        while written < target:
+            block = "".join(SAMPLE_SECTION.format(n=i) for i in range(n, n + 100))
+            f.write(block)
+            written += len(block.encode("utf-8"))
+            n += 100
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare peak memory of in-memory and streamed HTML output (Unix only).")
+    parser.add_argument("--size-mb", type=float, default=100, help="Size of the generated Markdown input (pandoc itself needs ~200x this in RAM)")
+    parser.add_argument("--mode", action="append", choices=MODES, help="Mode(s) to run (default: all)")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        input_md = Path(tmp) / "large.md"
+        generate(input_md, args.size_mb)
+        print(f"Input: {input_md.stat().st_size / 1024**2:.1f} MiB")
+        for mode in args.mode or MODES:
+            out_path = Path(tmp) / f"out-{mode}.html"
+            start = time.perf_counter()
+            proc = subprocess.run([sys.executable, "-c", CHILD, mode, str(input_md), str(out_path)], capture_output=True, text=True)
+            elapsed = time.perf_counter() - start
+            if proc.returncode != 0:
+                print(f"  {mode}: failed\n{proc.stderr}", file=sys.stderr)
+                return 1
+            peak = json.loads(proc.stdout.splitlines()[-1])
+            print(
+                f"  {mode:<7} python peak {peak['python'] / 1024**2:8.1f} MiB, pandoc peak {peak['pandoc'] / 1024**2:8.1f} MiB, "
+                f"{elapsed:6.1f}s, output {out_path.stat().st_size / 1024**2:.1f} MiB"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,74 @@
+"""Compare single-process and parallel (--render-jobs) xhtml2pdf rendering.
+
+    uv run scripts/bench_parallel_pdf.py --sections 300 --jobs 2 4
+
+Renders a generated book (``## Section`` chapters with tables, code and
+images, and a --toc) once per jobs value and reports the wall time, speedup,
+page count, bookmark count and file size. Parallel rendering only pays off
+with more than one CPU; every chunk starts a new page, so the page count may
+grow by up to jobs - 1.
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from bench_suite import VARIANTS, document, png_bytes
+from from2to import assets
+from from2to import convert as conv
+from from2to import pdf
+from from2to import pdf_parallel
+from from2to import style_utils as su
+
+
+def outline_count(items) -> int:
+    return sum(outline_count(item) if isinstance(item, list) else 1 for item in items)
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--sections", type=int, default=300, help="Chapters in the generated book (default: %(default)s)")
+    p.add_argument("--variant", choices=VARIANTS, default="mixed", help="Chapter content (default: %(default)s)")
+    p.add_argument("-s", "--style", default=su.DEFAULT_STYLE, help="Style to render with (default: %(default)s)")
+    p.add_argument("--jobs", type=int, nargs="+", default=[2, 4], help="Process counts to compare with 1 (default: 2 4)")
+    args = p.parse_args()
+
+    from pypdf import PdfReader
+
+    logging.disable(logging.WARNING)
+    print(f"{os.cpu_count()} CPU(s), {args.sections} sections ({args.variant})")
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        (root / "img").mkdir()
+        (root / "img" / "figure.png").write_bytes(png_bytes(1200, 600))
+        md = root / "book.md"
+        md.write_text(document(args.sections, args.variant), encoding="utf-8")
+        css_text, _ = su.resolve_style(args.style)
+        html = su.inject_css(conv.convert_markdown_to_html(md, title="Book", toc=True), css_text)
+
+        # resolve images like 2pdf does, relative to the book
+        resolver = assets.AssetResolver(root)
+        resolver.prefetch(assets.references(html))
+        pdf.html_to_pdf_bytes("<p>warm-up</p>", base_path=md, resolver=resolver)
+        single = None
+        print(f"{'jobs':>4} {'wall':>9} {'speedup':>8} {'pages':>6} {'bookmarks':>9} {'size':>10}")
+        for jobs in [1] + [j for j in args.jobs if j > 1]:
+            start = time.perf_counter()
+            data = pdf_parallel.html_to_pdf_bytes_parallel(html, base_path=md, resolver=resolver, jobs=jobs)
+            wall = time.perf_counter() - start
+            single = single or wall
+            reader = PdfReader(io.BytesIO(data))
+            print(
+                f"{jobs:>4} {wall:>8.2f}s {single / wall:>7.2f}x {len(reader.pages):>6} "
+                f"{outline_count(reader.outline):>9} {len(data) / 1024:>7.0f} KiB"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
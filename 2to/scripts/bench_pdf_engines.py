@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from from2to import convert as conv
+from from2to import pdf
+from from2to import style_utils as su
+
+
+SAMPLE_SECTION = """
+## Section {n}
+
+Some *emphasis*, some **strong text** and `inline code`. Lorem ipsum dolor sit
+amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt ut labore.
+
+- first item
+- second item with a [link](https://example.com)
+
+| Column A | Column B |
+| -------- | -------- |
+| {n}      | value    |
+
+```python
+def section_{n}():
+    return {n}
+```
+"""
+
+
+def generate_sample(path: Path, sections: int) -> None:
+    body = "".join(SAMPLE_SECTION.format(n=n) for n in range(sections))
+    path.write_text(f"# Benchmark document\n{body}", encoding="utf-8")
+
+
+def render_xhtml2pdf(input_md: Path, css_text: str, out_path: Path) -> None:
+    html = conv.convert_markdown_to_html(input_md, title=input_md.stem)
+    html = su.inject_css(html, css_text)
+    out_path.write_bytes(pdf.html_to_pdf_bytes(html, base_path=input_md.resolve()))
+
+
+def render_pandoc(input_md: Path, css_text: str, out_path: Path) -> None:
+    conv.convert_markdown_to_pdf(input_md, title=input_md.stem, outputfile=str(out_path))
+
+
+ENGINES = {
+    "xhtml2pdf": render_xhtml2pdf,
+    "pandoc": render_pandoc,
+}
+
+
+def bench(render: Callable[[Path, str, Path], None], input_md: Path, css_text: str, out_path: Path, repeat: int) -> Optional[List[float]]:
+    times: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            render(input_md, css_text, out_path)
+        except Exception as exc:
+            print(f"    unavailable: {str(exc).splitlines()[0]}")
+            return None
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare the 2pdf rendering engines.")
+    parser.add_argument("inputs", nargs="*", help="Markdown files to render (default: a generated document)")
+    parser.add_argument("--sections", type=int, default=50, help="Sections in the generated document")
+    parser.add_argument("--repeat", type=int, default=3, help="Renders per engine and input")
+    parser.add_argument("-s", "--style", default=su.DEFAULT_STYLE, help="Style used for the xhtml2pdf engine")
+    parser.add_argument("--engine", action="append", choices=sorted(ENGINES), help="Engine(s) to run (default: all)")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    css_text, _ = su.resolve_style(args.style)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        inputs = [Path(p) for p in args.inputs]
+        if not inputs:
+            sample = tmp_dir / "sample.md"
+            generate_sample(sample, args.sections)
+            inputs = [sample]
+
+        for input_md in inputs:
+            print(f"{input_md} ({input_md.stat().st_size} bytes)")
+            for name in args.engine or ENGINES:
+                out_path = tmp_dir / f"out-{name}.pdf"
+                print(f"  {name}:")
+                times = bench(ENGINES[name], input_md, css_text, out_path, args.repeat)
+                if times is None:
+                    continue
+                print(
+                    f"    mean {statistics.mean(times):.3f}s, min {min(times):.3f}s, "
+                    f"output {out_path.stat().st_size} bytes"
+                )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
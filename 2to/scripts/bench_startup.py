@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+# Paths that should not pay for pandoc, xhtml2pdf or other heavy imports
+COMMANDS: Dict[str, List[str]] = {
+    "2pdf --list-styles": ["-c", "from _2pdf.cli import main; raise SystemExit(main())", "--list-styles"],
+    "2html --list-styles": ["-c", "from _2html.cli import main; raise SystemExit(main())", "--list-styles"],
+    "2pdf --help": ["-c", "from _2pdf.cli import main; raise SystemExit(main())", "--help"],
+    "2html --help": ["-c", "from _2html.cli import main; raise SystemExit(main())", "--help"],
+    "pandoc probe": ["-c", "from from2to import pandoc_probe; pandoc_probe.pandoc_version()"],
+}
+IMPORT_MODULES = ("_2pdf.cli", "_2html.cli")
+
+
+def time_command(argv: List[str], repeat: int) -> List[float]:
+    times: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *argv], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def slowest_imports(module: str, top: int) -> List[Tuple[int, str]]:
+    """Return the ``top`` largest cumulative import times (us) from ``python -X importtime``."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+        check=False,
+    )
+    rows: List[Tuple[int, str]] = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        rows.append((int(fields[1]), fields[2].rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure CLI startup time and fail on regressions.")
+    parser.add_argument("--repeat", type=int, default=7, help="Runs per command")
+    parser.add_argument("--max-ms", type=float, default=100.0, help="Fail when a median exceeds this many ms")
+    parser.add_argument("--imports", type=int, default=10, help="Show the N slowest imports per CLI module (0: skip)")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    failures = 0
+    for name, argv in COMMANDS.items():
+        times = time_command(argv, args.repeat)
+        median = statistics.median(times)
+        over = median > args.max_ms
+        failures += over
+        print(f"{name:<22} median {median:7.1f} ms  min {min(times):7.1f} ms{'  REGRESSION' if over else ''}")
+
+    if args.imports:
+        for module in IMPORT_MODULES:
+            print(f"\nSlowest imports for {module} (cumulative us):")
+            for cumulative, name in slowest_imports(module, args.imports):
+                print(f"  {cumulative:>8}  {name}")
+
+    if failures:
+        print(f"\n{failures} command(s) slower than {args.max_ms:.0f} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,264 @@
+"""Benchmark every conversion stage over a generated corpus and compare runs.
+
+    uv run scripts/bench_suite.py run -o results.json
+    uv run scripts/bench_suite.py run -o new.json --baseline results.json
+    uv run scripts/bench_suite.py compare results.json new.json
+
+Stages are timed separately: CLI startup, style resolution, pandoc
+(Markdown -> HTML), CSS injection and the xhtml2pdf render. The corpus is
+generated deterministically, so results of different checkouts are comparable
+as long as the sizes and variants match.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import platform
+import statistics
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from bench_startup import COMMANDS, time_command
+from from2to import convert as conv
+from from2to import pandoc_probe
+from from2to import pdf
+from from2to import style_utils as su
+
+RESULTS_VERSION = 1
+STAGES = ("startup", "resolve_style", "pandoc", "inject_css", "pdf")
+# Sections per generated document
+SIZES = {"small": 3, "medium": 30, "huge": 600}
+VARIANTS = ("plain", "tables", "code", "images", "mixed")
+DEFAULT_STYLES = ("new", "github", "latex", "bulma")
+DEFAULT_THRESHOLD = 0.10
+# Differences below this are noise, whatever the relative change
+DEFAULT_MIN_DELTA_MS = 5.0
+
+PARAGRAPH = (
+    "Section {n} opens with *emphasis*, **strong text**, `inline code` and a "
+    "[link](https://example.com/{n}). Lorem ipsum dolor sit amet, consectetur "
+    "adipiscing elit, sed do eiusmod tempor incididunt ut labore et dolore magna aliqua.\n\n"
+    "- first item\n- second item\n  - nested item {n}\n"
+)
+TABLE = "\n| Name | Count | Share | Note |\n| ---- | ----: | ----: | ---- |\n" + "".join(
+    f"| row {i} | {i * 17} | {i * 3.5:.1f}% | cell {i} |\n" for i in range(8)
+)
+CODE = '\n```python\ndef section_{n}(items):\n    """Return the running total."""\n    total = 0\n    for item in items:\n        total += item * {n}\n    return total\n```\n'
+IMAGE = "\n![Figure {n}](img/figure.png)\n"
+
+
+def png_bytes(width: int, height: int) -> bytes:
+    """A deterministic RGB gradient PNG (no imaging library needed)."""
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    rows = b"".join(
+        b"\x00" + bytes(c for x in range(width) for c in (x * 255 // width, y * 255 // height, 128)) for y in range(height)
+    )
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows, 9)) + chunk(b"IEND", b"")
+
+
+def document(sections: int, variant: str) -> str:
+    parts = ["# Benchmark document\n"]
+    for n in range(sections):
+        parts.append(f"\n## Section {n}\n\n" + PARAGRAPH.format(n=n))
+        if variant in ("tables", "mixed"):
+            parts.append(TABLE)
+        if variant in ("code", "mixed"):
+            parts.append(CODE.format(n=n))
+        if variant in ("images", "mixed"):
+            parts.append(IMAGE.format(n=n))
+    return "".join(parts)
+
+
+def generate_corpus(root: Path, sizes: List[str], variants: List[str]) -> Dict[str, Path]:
+    """Write ``<size>-<variant>.md`` documents (and their image) under ``root``."""
+    (root / "img").mkdir(parents=True, exist_ok=True)
+    (root / "img" / "figure.png").write_bytes(png_bytes(1200, 600))
+    docs: Dict[str, Path] = {}
+    for size in sizes:
+        for variant in variants:
+            path = root / f"{size}-{variant}.md"
+            path.write_text(document(SIZES[size], variant), encoding="utf-8")
+            docs[path.stem] = path
+    return docs
+
+
+def measure(fn: Callable[[], object], repeat: int) -> Dict[str, object]:
+    runs: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": statistics.median(runs), "min_ms": min(runs), "runs_ms": [round(r, 3) for r in runs]}
+
+
+def environment() -> Dict[str, Optional[str]]:
+    from importlib.metadata import PackageNotFoundError, version
+
+    def dist_version(name: str) -> Optional[str]:
+        try:
+            return version(name)
+        except PackageNotFoundError:
+            return None
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "2to": dist_version("2to"),
+        "xhtml2pdf": dist_version("xhtml2pdf"),
+        "pandoc": pandoc_probe.pandoc_version(),
+    }
+
+
+def run(args: argparse.Namespace) -> int:
+    # xhtml2pdf warns about every unsupported declaration of the raw styles
+    logging.disable(logging.WARNING)
+    stages = args.stage or list(STAGES)
+    if "pdf" in stages:
+        try:
+            import xhtml2pdf  # noqa: F401
+        except ImportError:
+            print("xhtml2pdf is not installed; skipping the pdf stage", file=sys.stderr)
+            stages.remove("pdf")
+        else:
+            # keep the one-time import and font setup out of the first measurement
+            pdf.html_to_pdf_bytes("<p>warm-up</p>", base_path=Path.cwd())
+    pdf_sizes = list(SIZES)[: list(SIZES).index(args.pdf_max_size) + 1]
+    results: Dict[str, Dict[str, object]] = {}
+
+    def record(key: str, fn: Callable[[], object], repeat: int = args.repeat) -> None:
+        results[key] = measure(fn, repeat)
+        print(f"{key:<44} median {results[key]['median_ms']:10.3f} ms  min {results[key]['min_ms']:10.3f} ms", flush=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = Path(args.corpus_dir) if args.corpus_dir else Path(tmp)
+        docs = generate_corpus(corpus_dir, args.size, args.variant)
+        corpus = {name: {"bytes": p.stat().st_size, "sha256": hashlib.sha256(p.read_bytes()).hexdigest()} for name, p in docs.items()}
+
+        if "startup" in stages:
+            for name, argv in COMMANDS.items():
+                times = time_command(argv, args.repeat)
+                results[f"startup/{name}"] = {"median_ms": statistics.median(times), "min_ms": min(times), "runs_ms": [round(t, 3) for t in times]}
+                print(f"{'startup/' + name:<44} median {statistics.median(times):10.3f} ms  min {min(times):10.3f} ms", flush=True)
+
+        styles = {style: su.resolve_style(style)[0] for style in args.style}
+        if "resolve_style" in stages:
+            for style in args.style:
+                # a fresh registry re-reads the directory and the file, like a new CLI process
+                record(f"resolve_style/{style}", lambda style=style: su.StyleRegistry().resolve(style))
+
+        for name, path in docs.items():
+            html = conv.convert_markdown_to_html(path, title=path.stem)
+            if "pandoc" in stages:
+                record(f"pandoc/{name}", lambda path=path: conv.convert_markdown_to_html(path, title=path.stem))
+            for style, css_text in styles.items():
+                if "inject_css" in stages:
+                    record(f"inject_css/{name}/{style}", lambda css_text=css_text: su.inject_css(html, css_text))
+                if "pdf" in stages and name.split("-", 1)[0] in pdf_sizes:
+                    styled = su.inject_css(html, css_text)
+                    base_path = path.resolve()
+                    record(f"pdf/{name}/{style}", lambda styled=styled, base_path=base_path: pdf.html_to_pdf_bytes(styled, base_path=base_path), args.pdf_repeat)
+
+    data = {
+        "version": RESULTS_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": environment(),
+        "repeat": args.repeat,
+        "corpus": corpus,
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(data, indent=2) + "\n", encoding="utf-8")
+        print(f"\nWrote {len(results)} results to {args.output}")
+    if args.baseline:
+        return compare(load_results(args.baseline), data, args.threshold, args.min_delta_ms)
+    return 0
+
+
+def compare(baseline: Dict[str, object], current: Dict[str, object], threshold: float, min_delta_ms: float) -> int:
+    """Print per-key changes of the medians; return 1 when any key regressed."""
+    base_results: Dict[str, Dict[str, float]] = baseline["results"]  # type: ignore[assignment]
+    cur_results: Dict[str, Dict[str, float]] = current["results"]  # type: ignore[assignment]
+    base_corpus, cur_corpus = baseline.get("corpus", {}), current.get("corpus", {})
+    changed = [name for name in cur_corpus if name in base_corpus and base_corpus[name] != cur_corpus[name]]  # type: ignore[operator]
+    if changed:
+        print(f"warning: generated documents differ from the baseline: {', '.join(changed)}", file=sys.stderr)
+
+    regressions = 0
+    print(f"\n{'key':<44} {'baseline':>11} {'current':>11} {'change':>8}")
+    for key, cur in cur_results.items():
+        base = base_results.get(key)
+        if base is None:
+            print(f"{key:<44} {'-':>11} {cur['median_ms']:>8.2f} ms {'new':>8}")
+            continue
+        delta = cur["median_ms"] - base["median_ms"]
+        ratio = delta / base["median_ms"] if base["median_ms"] else 0.0
+        regressed = ratio > threshold and delta > min_delta_ms
+        regressions += regressed
+        print(
+            f"{key:<44} {base['median_ms']:>8.2f} ms {cur['median_ms']:>8.2f} ms {ratio:>+7.1%}"
+            f"{'  REGRESSION' if regressed else ''}"
+        )
+    missing = [key for key in base_results if key not in cur_results]
+    if missing:
+        print(f"\n{len(missing)} baseline key(s) not measured in this run")
+    if regressions:
+        print(f"\n{regressions} regression(s) slower than the baseline by more than {threshold:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the conversion stages and compare against a baseline.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_p = sub.add_parser("run", help="Generate the corpus and time every stage")
+    run_p.add_argument("-o", "--output", help="Write the results as JSON to this file")
+    run_p.add_argument("--size", action="append", choices=list(SIZES), help=f"Document size(s) (default: all; sections: {SIZES})")
+    run_p.add_argument("--variant", action="append", choices=VARIANTS, help="Document content variant(s) (default: all)")
+    run_p.add_argument("-s", "--style", action="append", help=f"Style(s) to sweep (default: {', '.join(DEFAULT_STYLES)})")
+    run_p.add_argument("--stage", action="append", choices=STAGES, help="Stage(s) to time (default: all)")
+    run_p.add_argument("--repeat", type=int, default=5, help="Runs per measurement; the median is compared")
+    run_p.add_argument("--pdf-repeat", type=int, default=3, help="Runs per PDF render")
+    run_p.add_argument("--pdf-max-size", choices=list(SIZES), default="medium", help="Largest document size rendered to PDF (default: medium)")
+    run_p.add_argument("--corpus-dir", help="Keep the generated corpus in this directory")
+    run_p.add_argument("--baseline", help="Compare against this results file after the run")
+
+    cmp_p = sub.add_parser("compare", help="Compare two results files")
+    cmp_p.add_argument("baseline")
+    cmp_p.add_argument("current")
+
+    for p in (run_p, cmp_p):
+        p.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help=f"Relative slowdown reported as a regression (default: {DEFAULT_THRESHOLD})")
+        p.add_argument("--min-delta-ms", type=float, default=DEFAULT_MIN_DELTA_MS, help=f"Ignore slowdowns smaller than this (default: {DEFAULT_MIN_DELTA_MS})")
+    args = parser.parse_args()
+    if args.command == "run":
+        args.size = args.size or list(SIZES)
+        args.variant = args.variant or list(VARIANTS)
+        args.style = args.style or list(DEFAULT_STYLES)
+    return args
+
+
+def load_results(path: str) -> Dict[str, object]:
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+def main() -> int:
+    args = parse_args()
+    if args.command == "compare":
+        return compare(load_results(args.baseline), load_results(args.current), args.threshold, args.min_delta_ms)
+    return run(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
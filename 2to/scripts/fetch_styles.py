@@ -1,15 +1,35 @@
+"""Fetch the bundled CSS styles into from2to/styles/included/.
+
+Updates are incremental. ``styles.lock.json`` next to ``included/`` records
+for every style and license:
+
+- the URL,
+- the sha256 and size,
+- the ETag / Last-Modified.
+
+Files that still match their lock entry are revalidated with conditional
+requests. Only changed files are rewritten, and every write is atomic.
+Styles and licenses share one pooled HTTP session. ``--verify`` checks the
+bundled files against the lock without network access.
+"""
 from __future__ import annotations
 
 import argparse
 import asyncio
+import hashlib
+import json
 import logging
 import re
-import shutil
 from pathlib import Path
-from typing import Dict, Iterable, List, Tuple
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from from2to import url_cache
 
-import aiohttp
+if TYPE_CHECKING:
+    import aiohttp
 
+MANIFEST_NAME = "styles.lock.json"
+MANIFEST_VERSION = 1
 
 # Download a wide selection of CSS styles into from2to/styles/included/
 STYLES: dict[str, List[Tuple[str, str]]] = {
@@ -108,100 +128,206 @@ def get_styles_dir() -> Path:
     return styles_dir
 
 
-async def fetch_one(
+def get_manifest_path(styles_dir: Path) -> Path:
+    return styles_dir.parent / MANIFEST_NAME
+
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def atomic_write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    url_cache.atomic_write(path, data)
+
+
+def load_manifest(path: Path) -> Dict[str, Any]:
+    try:
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        manifest = {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        manifest = {"version": MANIFEST_VERSION, "styles": {}, "licenses": {}}
+    return manifest
+
+
+def save_manifest(path: Path, manifest: Dict[str, Any]) -> None:
+    atomic_write(path, (json.dumps(manifest, indent=2, sort_keys=True) + "\n").encode("utf-8"))
+
+
+def file_matches(path: Path, entry: Dict[str, Any]) -> bool:
+    """Whether ``path`` holds exactly the bytes recorded in its lock entry."""
+    try:
+        if path.stat().st_size != entry.get("size"):
+            return False
+        return sha256_hex(path.read_bytes()) == entry.get("sha256")
+    except OSError:
+        return False
+
+
+class Reply(NamedTuple):
+    data: Optional[bytes]  # None: not modified (304)
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+async def fetch_conditional(
     session: aiohttp.ClientSession,
-    name: str,
     url: str,
-    out_dir: Path,
+    entry: Optional[Dict[str, Any]],
     *,
     retries: int,
     retry_delay: float,
     timeout_seconds: float,
-) -> bool:
-    dest = out_dir / f"{name}.css"
+) -> Optional[Reply]:
+    """GET ``url``, revalidating with the validators of ``entry``; None after ``retries`` failures."""
+    import aiohttp
+
+    headers = {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
     attempt = 0
     while attempt < retries:
         attempt += 1
         try:
-            async with session.get(url, timeout=timeout_seconds) as resp:
+            async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout_seconds)) as resp:
+                etag = resp.headers.get("ETag")
+                last_modified = resp.headers.get("Last-Modified")
+                if resp.status == 304:
+                    if entry is None:
+                        raise RuntimeError("304 Not Modified for an unconditional request")
+                    return Reply(None, etag or entry.get("etag"), last_modified or entry.get("last_modified"))
                 resp.raise_for_status()
-                data = await resp.read()
-            dest.write_bytes(data)
-            logging.info("Downloaded %s -> %s", name, dest)
-            return True
+                return Reply(await resp.read(), etag, last_modified)
         except Exception as exc:
-            logging.warning("Attempt %s/%s failed for %s: %s", attempt, retries, name, exc)
+            logging.warning("Attempt %s/%s failed for %s: %s", attempt, retries, url, exc)
             if attempt < retries:
                 await asyncio.sleep(retry_delay)
-    logging.error("Failed to download %s after %s attempts", name, retries)
-    return False
+    logging.error("Failed to download %s after %s attempts", url, retries)
+    return None
 
 
-async def fetch_all(
-    selected: Iterable[Tuple[str, str, str]],
+async def update_style(
+    session: aiohttp.ClientSession,
+    name: str,
+    url: str,
+    license_url: str,
+    out_dir: Path,
+    manifest: Dict[str, Any],
     *,
-    concurrency: int,
-    retries: int,
-    retry_delay: float,
-    timeout_seconds: float,
-) -> int:
-    out_dir = get_styles_dir()
-    if out_dir.exists():
-        shutil.rmtree(out_dir)
-    out_dir.mkdir(parents=True, exist_ok=True)
-
-    sem = asyncio.Semaphore(concurrency)
-
-    async with aiohttp.ClientSession() as session:
-        async def runner(name: str, url: str) -> bool:
-            async with sem:
-                return await fetch_one(
-                    session,
-                    name,
-                    url,
-                    out_dir,
-                    retries=retries,
-                    retry_delay=retry_delay,
-                    timeout_seconds=timeout_seconds,
-                )
-
-        tasks = [runner(name, url) for name, url, _license_url in selected]
-        results = await asyncio.gather(*tasks)
-
-    failures = len([r for r in results if not r])
-    return failures
-
-
-async def fetch_license_text(
+    force: bool,
+    **fetch_options: Any,
+) -> str:
+    """Bring ``name`` up to date; returns "updated", "unchanged" or "failed"."""
+    dest = out_dir / f"{name}.css"
+    entry = manifest["styles"].get(name)
+    # only revalidate what is really on disk
+    valid = entry is not None and entry.get("url") == url and file_matches(dest, entry)
+    reply = await fetch_conditional(session, url, entry if valid and not force else None, **fetch_options)
+    if reply is None:
+        return "failed"
+    changed = reply.data is not None and not (valid and sha256_hex(reply.data) == entry["sha256"])
+    if changed:
+        atomic_write(dest, reply.data)
+        logging.info("Updated %s -> %s", name, dest)
+    else:
+        logging.debug("Unchanged %s", name)
+    data = reply.data if reply.data is not None else dest.read_bytes()
+    manifest["styles"][name] = {
+        "url": url,
+        "license_url": license_url,
+        "sha256": sha256_hex(data),
+        "size": len(data),
+        "etag": reply.etag,
+        "last_modified": reply.last_modified,
+    }
+    return "updated" if changed else "unchanged"
+
+
+async def update_license(
     session: aiohttp.ClientSession,
     license_url: str,
+    manifest: Dict[str, Any],
+    *,
+    force: bool,
+    **fetch_options: Any,
+) -> str:
+    """Bring the license text of ``license_url`` up to date; returns "updated", "unchanged" or "failed"."""
+    entry = manifest["licenses"].get(license_url)
+    valid = entry is not None and sha256_hex(entry.get("text", "").encode("utf-8")) == entry.get("sha256")
+    reply = await fetch_conditional(session, license_url, entry if valid and not force else None, **fetch_options)
+    if reply is None:
+        return "failed"
+    text = reply.data.decode("utf-8", errors="replace") if reply.data is not None else entry["text"]
+    changed = not (valid and text == entry["text"])
+    manifest["licenses"][license_url] = {
+        "sha256": sha256_hex(text.encode("utf-8")),
+        "etag": reply.etag,
+        "last_modified": reply.last_modified,
+        "text": text,
+    }
+    if changed:
+        logging.info("Updated license %s", license_url)
+    return "updated" if changed else "unchanged"
+
+
+async def fetch_all(
+    selected: Iterable[Tuple[str, str, str]],
+    out_dir: Path,
+    manifest: Dict[str, Any],
     *,
+    concurrency: int,
+    force: bool = False,
     retries: int,
     retry_delay: float,
     timeout_seconds: float,
-) -> str | None:
-    attempt = 0
-    while attempt < retries:
-        attempt += 1
-        try:
-            async with session.get(license_url, timeout=timeout_seconds) as resp:
-                resp.raise_for_status()
-                text = await resp.text()
-            logging.info("Downloaded license %s", license_url)
-            return text
-        except Exception as exc:
-            logging.warning(
-                "Attempt %s/%s failed for license %s: %s", attempt, retries, license_url, exc
-            )
-            if attempt < retries:
-                await asyncio.sleep(retry_delay)
-    logging.error("Failed to download license %s after %s attempts", license_url, retries)
-    return None
+) -> Dict[str, int]:
+    """Update the ``(name, css_url, license_url)`` styles and their licenses in ``manifest``.
+
+    Returns the number of updated, unchanged and failed files.
+    """
+    import aiohttp
+
+    selected = list(selected)
+    options = dict(force=force, retries=retries, retry_delay=retry_delay, timeout_seconds=timeout_seconds)
+    license_urls = list(dict.fromkeys(license_url for _name, _url, license_url in selected))
+    # one pooled session; the connection limit bounds the concurrency
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        results = await asyncio.gather(
+            *(update_style(session, name, url, license_url, out_dir, manifest, **options) for name, url, license_url in selected),
+            *(update_license(session, license_url, manifest, **options) for license_url in license_urls),
+        )
+    return {status: results.count(status) for status in ("updated", "unchanged", "failed")}
+
+
+def prune_removed(out_dir: Path, manifest: Dict[str, Any]) -> List[str]:
+    """Delete the locked styles (and licenses) that are no longer in STYLES."""
+    known = build_style_index()
+    removed = [name for name in manifest["styles"] if name not in known]
+    for name in removed:
+        (out_dir / f"{name}.css").unlink(missing_ok=True)
+        del manifest["styles"][name]
+        logging.info("Removed %s", name)
+    used = {license_url for _css_url, license_url in known.values()}
+    for license_url in [url for url in manifest["licenses"] if url not in used]:
+        del manifest["licenses"][license_url]
+    return removed
+
+
+def license_groups(manifest: Dict[str, Any]) -> Dict[str, List[str]]:
+    """License URL -> style names of the locked styles, in STYLES order."""
+    license_styles: Dict[str, List[str]] = {}
+    for name, (_css_url, license_url) in build_style_index().items():
+        if name in manifest["styles"]:
+            license_styles.setdefault(license_url, []).append(name)
+    return license_styles
 
 
-def write_license_file(license_texts: Dict[str, str], license_styles: Dict[str, List[str]]) -> None:
-    styles_dir = get_styles_dir()
-    dest = styles_dir.parent / "LICENSE.md"
+def render_license_file(license_texts: Dict[str, str], license_styles: Dict[str, List[str]]) -> str:
     parts: List[str] = []
     summary_rows: List[str] = []
 
@@ -221,22 +347,62 @@ def write_license_file(license_texts: Dict[str, str], license_styles: Dict[str,
         parts.append(f"# [{heading_styles}]({license_url})\n{license_text}\n")
 
     summary_table = "\n".join(["| Styles | License |", "| --- | --- |"] + summary_rows)
-    content = "\n".join(["# Summary", "", summary_table, ""]) + "\n---\n\n" + "\n---\n\n".join(parts).rstrip("\n") + "\n"
-    dest.write_text(content, encoding="utf-8")
+    return "\n".join(["# Summary", "", summary_table, ""]) + "\n---\n\n" + "\n---\n\n".join(parts).rstrip("\n") + "\n"
+
+
+def write_license_file(out_dir: Path, manifest: Dict[str, Any]) -> None:
+    dest = out_dir.parent / "LICENSE.md"
+    texts = {url: entry["text"] for url, entry in manifest["licenses"].items()}
+    content = render_license_file(texts, license_groups(manifest))
+    if dest.is_file() and dest.read_text(encoding="utf-8") == content:
+        return
+    atomic_write(dest, content.encode("utf-8"))
     logging.info("Wrote %s", dest)
 
 
+def verify(out_dir: Path, manifest: Dict[str, Any]) -> List[str]:
+    """Compare the bundled files with the lock, offline; returns the problems found."""
+    problems: List[str] = []
+    index = build_style_index()
+    for name, (css_url, _license_url) in index.items():
+        entry = manifest["styles"].get(name)
+        if entry is None:
+            problems.append(f"{name}: not in {MANIFEST_NAME}")
+        elif entry.get("url") != css_url:
+            problems.append(f"{name}: locked URL {entry.get('url')} differs from {css_url}")
+        elif not (out_dir / f"{name}.css").is_file():
+            problems.append(f"{name}: {name}.css is missing")
+        elif not file_matches(out_dir / f"{name}.css", entry):
+            problems.append(f"{name}: {name}.css does not match its sha256")
+    for path in sorted(out_dir.glob("*.css")):
+        if path.stem not in index:
+            problems.append(f"{path.name}: not in STYLES")
+    groups = license_groups(manifest)
+    for license_url in groups:
+        entry = manifest["licenses"].get(license_url)
+        if entry is None or sha256_hex(entry.get("text", "").encode("utf-8")) != entry.get("sha256"):
+            problems.append(f"license {license_url}: missing or corrupt in {MANIFEST_NAME}")
+    texts = {url: entry.get("text", "") for url, entry in manifest["licenses"].items()}
+    license_file = out_dir.parent / "LICENSE.md"
+    if not license_file.is_file() or license_file.read_text(encoding="utf-8") != render_license_file(texts, groups):
+        problems.append(f"{license_file.name}: out of date")
+    return problems
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Fetch bundled CSS styles asynchronously.")
     parser.add_argument(
         "styles",
         nargs="*",
-        help="Optional style names to fetch (default: all)",
+        help="Optional style names to fetch (default: all, removing styles no longer listed)",
     )
     parser.add_argument("--concurrency", type=int, default=8, help="Number of concurrent downloads")
     parser.add_argument("--retries", type=int, default=1, help="Download attempts per file")
     parser.add_argument("--retry-delay", type=float, default=2.0, help="Seconds to wait between retries")
     parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument("--force", action="store_true", help="Download without conditional requests (files are still only rewritten when changed)")
+    parser.add_argument("--verify", action="store_true", help=f"Check the bundled styles against {MANIFEST_NAME} without network access")
+    parser.add_argument("--styles-dir", type=Path, default=None, help="Directory of the style files (default: from2to/styles/included)")
     parser.add_argument("--verbose", action="store_true", help="Enable verbose logging")
     return parser.parse_args()
 
@@ -263,49 +429,46 @@ def filter_styles(names: Iterable[str]) -> Tuple[Tuple[str, str, str], ...]:
 def main() -> int:
     args = parse_args()
     logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(message)s")
+    out_dir = args.styles_dir or get_styles_dir()
+    manifest_path = get_manifest_path(out_dir)
+    manifest = load_manifest(manifest_path)
+
+    if args.verify:
+        if not manifest_path.is_file():
+            logging.error("%s does not exist yet; run an update to create it", manifest_path)
+            return 1
+        problems = verify(out_dir, manifest)
+        for problem in problems:
+            logging.error("%s", problem)
+        if problems:
+            return 1
+        logging.info("All %s styles match %s", len(manifest["styles"]), manifest_path)
+        return 0
+
     selected = filter_styles(args.styles)
-    logging.info("Downloading %s style(s) into %s", len(selected), get_styles_dir())
-    style_failures = asyncio.run(
+    logging.info("Updating %s style(s) in %s", len(selected), out_dir)
+    counts = asyncio.run(
         fetch_all(
             selected,
+            out_dir,
+            manifest,
             concurrency=args.concurrency,
+            force=args.force,
             retries=args.retries,
             retry_delay=args.retry_delay,
             timeout_seconds=args.timeout,
         )
     )
-
-    license_styles: Dict[str, List[str]] = {}
-    for name, _css_url, license_url in selected:
-        license_styles.setdefault(license_url, []).append(name)
-
-    async def fetch_licenses() -> Dict[str, str]:
-        async with aiohttp.ClientSession() as session:
-            tasks = {
-                license_url: fetch_license_text(
-                    session,
-                    license_url,
-                    retries=args.retries,
-                    retry_delay=args.retry_delay,
-                    timeout_seconds=args.timeout,
-                )
-                for license_url in license_styles
-            }
-            results = await asyncio.gather(*tasks.values())
-        return {lic: text for lic, text in zip(tasks.keys(), results) if text is not None}
-
-    license_texts = asyncio.run(fetch_licenses())
-
-    missing_licenses = set(license_styles) - set(license_texts)
-    if missing_licenses:
-        logging.error("Failed to download %s license(s)", len(missing_licenses))
-    write_license_file(license_texts, license_styles)
-
-    total_failures = style_failures + len(missing_licenses)
-    if total_failures:
-        logging.error("Completed with %s failure(s)", total_failures)
+    if not args.styles:
+        prune_removed(out_dir, manifest)
+    # the lock only records what was fetched successfully, so save it either way
+    save_manifest(manifest_path, manifest)
+    write_license_file(out_dir, manifest)
+
+    logging.info("%s updated, %s unchanged, %s failed", counts["updated"], counts["unchanged"], counts["failed"])
+    if counts["failed"]:
+        logging.error("Completed with %s failure(s)", counts["failed"])
         return 1
-    logging.info("Done. Downloaded styles into %s", get_styles_dir())
     return 0
 
 
@@ -0,0 +1,138 @@
+"""Batch conversion: input expansion, output planning, exit statuses and the process pool."""
+from __future__ import annotations
+
+import argparse
+import os
+from pathlib import Path
+from typing import List, Optional
+
+import pytest
+
+from from2to import batch
+from from2to.conversion_cache import ConversionCache
+
+
+@pytest.fixture
+def tree(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.chdir(tmp_path)
+    for name in ("docs/a.md", "docs/sub/b.markdown", "docs/sub/c.txt", "docs/sub/deep/d.MD"):
+        Path(name).parent.mkdir(parents=True, exist_ok=True)
+        Path(name).write_text(f"# {Path(name).stem}\n", encoding="utf-8")
+    return tmp_path
+
+
+def names(specs: List[batch.InputSpec]) -> List[str]:
+    return [f"{path.as_posix()} @ {base.as_posix()}" for path, base in specs]
+
+
+def test_directories_are_searched_recursively_for_markdown(tree: Path) -> None:
+    assert names(batch.expand_inputs(["docs"])) == ["docs/a.md @ docs", "docs/sub/b.markdown @ docs", "docs/sub/deep/d.MD @ docs"]
+
+
+def test_globs_keep_their_root_and_duplicates_are_dropped(tree: Path) -> None:
+    specs = batch.expand_inputs(["docs/sub/**/[bd].*", "docs/sub/b.markdown", "missing.md"])
+    assert names(specs) == ["docs/sub/b.markdown @ docs/sub", "docs/sub/deep/d.MD @ docs/sub", "missing.md @ ."]
+
+
+@pytest.mark.parametrize(
+    "output, force_dir, expected",
+    [
+        (None, False, ["docs/a.md -> docs/a.html"]),
+        ("out.html", False, ["docs/a.md -> out.html"]),
+        ("out/", False, ["docs/a.md -> out/a.html"]),
+        ("out.html", True, ["docs/a.md -> out.html/a.html"]),
+    ],
+)
+def test_plan_a_single_input(tree: Path, output: Optional[str], force_dir: bool, expected: List[str]) -> None:
+    tasks = batch.plan_tasks(batch.expand_inputs(["docs/a.md"]), output, ".html", force_dir=force_dir)
+    assert [f"{i.as_posix()} -> {o.as_posix()}" for i, o in tasks if o is not None] == expected
+
+
+def test_plan_mirrors_the_tree_under_the_output_directory(tree: Path) -> None:
+    tasks = batch.plan_tasks(batch.expand_inputs(["docs"]), "out", ".html")
+    assert [o.as_posix() for _, o in tasks if o is not None] == ["out/a.html", "out/sub/b.html", "out/sub/deep/d.html"]
+    assert [o.as_posix() for _, o in batch.plan_tasks(batch.expand_inputs(["docs"]), None, ".pdf") if o is not None] == [
+        "docs/a.pdf",
+        "docs/sub/b.pdf",
+        "docs/sub/deep/d.pdf",
+    ]
+
+
+def write_pid(input_md: Path, out_path: Optional[Path], args: argparse.Namespace, css_text: str) -> None:
+    # module level, so that the process pool can pickle it
+    assert out_path is not None
+    if "fail" in input_md.name:
+        raise ValueError("boom")
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(str(os.getpid()), encoding="utf-8")
+
+
+def make_tasks(*stems: str) -> List[batch.Task]:
+    tasks: List[batch.Task] = []
+    for stem in stems:
+        md = Path(f"{stem}.md")
+        if stem != "missing":
+            md.write_text(f"# {stem}\n", encoding="utf-8")
+        tasks.append((md, Path("out") / f"{stem}.html"))
+    return tasks
+
+
+@pytest.mark.parametrize(
+    "stems, status",
+    [
+        (["a", "b"], 0),
+        (["a", "fail"], 1),
+        (["a", "missing"], 2),
+        (["fail", "missing", "a"], 2),
+    ],
+)
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_exit_status_is_the_worst_per_file_status(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture, stems: List[str], status: int, jobs: int
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    assert batch.run_batch(make_tasks(*stems), write_pid, argparse.Namespace(), "", jobs=jobs) == status
+    out, err = capsys.readouterr()
+    ok = [s for s in stems if s not in ("fail", "missing")]
+    assert sorted(line for line in out.splitlines() if line.startswith("Wrote:")) == [f"Wrote: {Path('out') / f'{s}.html'}" for s in ok]
+    assert ("Error converting fail.md: boom" in err) == ("fail" in stems)
+    assert ("Input file not found: missing.md" in err) == ("missing" in stems)
+
+
+def test_jobs_fan_out_to_worker_processes(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    tasks = make_tasks(*"abcdef")
+    results: List[int] = []
+    assert batch.run_batch(tasks, write_pid, argparse.Namespace(), "", jobs=3, on_result=lambda task, s: results.append(s)) == 0
+    assert results == [0] * len(tasks)
+    pids = {int(out.read_text(encoding="utf-8")) for _, out in tasks if out is not None}
+    assert os.getpid() not in pids and 1 <= len(pids) <= 3
+
+    batch.run_batch(tasks[:1], write_pid, argparse.Namespace(), "", jobs=3)
+    assert tasks[0][1] is not None and int(tasks[0][1].read_text(encoding="utf-8")) == os.getpid()
+
+
+def test_resolve_jobs() -> None:
+    assert batch.resolve_jobs(3) == 3
+    assert batch.resolve_jobs(0) == batch.resolve_jobs(None) == (os.cpu_count() or 1)
+
+
+def test_cached_outputs_are_reused(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture) -> None:
+    monkeypatch.chdir(tmp_path)
+    tasks = make_tasks("a", "b")
+    cache = ConversionCache(tmp_path / "cache")
+    args = argparse.Namespace(toc=False, pandoc_arg=None)
+    assert batch.run_batch(tasks, write_pid, args, "", cache=cache) == 0
+    assert "0 hits, 2 misses" in capsys.readouterr().err
+
+    assert batch.run_batch(tasks, write_pid, args, "", cache=cache) == 0
+    out, err = capsys.readouterr()
+    assert "2 hits, 0 misses" in err
+    assert [line for line in out.splitlines() if not line.startswith("Converted")] == [
+        f"Unchanged: {Path('out') / 'a.html'}",
+        f"Unchanged: {Path('out') / 'b.html'}",
+    ]
+
+    Path("a.md").write_text("# changed\n", encoding="utf-8")
+    batch.run_batch(tasks, write_pid, args, "", cache=cache)
+    assert "1 hits, 1 misses" in capsys.readouterr().err
@@ -0,0 +1,70 @@
+"""Cache index: size parsing and eviction."""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pytest
+
+from from2to import cache_index
+from from2to import url_cache
+
+
+@pytest.mark.parametrize(
+    "text, size",
+    [
+        ("1024", 1024),
+        ("1024B", 1024),
+        ("500K", 500 * 1024),
+        ("500M", 500 * 1024**2),
+        ("500MB", 500 * 1024**2),
+        ("500MiB", 500 * 1024**2),
+        ("500 mib", 500 * 1024**2),
+        ("1.5GiB", int(1.5 * 1024**3)),
+        ("2kib", 2048),
+    ],
+)
+def test_parse_size(text: str, size: int) -> None:
+    assert cache_index.parse_size(text) == size
+
+
+@pytest.mark.parametrize("text", ["", "M", "5iB", "5X", "1.2.3M", "5 MiBs"])
+def test_parse_size_rejects_garbage(text: str) -> None:
+    with pytest.raises(ValueError):
+        cache_index.parse_size(text)
+
+
+def style(cache_dir: Path, name: str, mtime: float) -> Path:
+    entry = cache_dir / name
+    entry.write_bytes(b"x" * 100)
+    url_cache.meta_path(entry).write_text("{}", encoding="utf-8")
+    entry.with_name(entry.name + url_cache.LOCK_SUFFIX).touch()
+    for p in (entry, url_cache.meta_path(entry)):
+        os.utime(p, (mtime, mtime))
+    return entry
+
+
+def test_prune_removes_the_locks_of_evicted_and_deleted_downloads(tmp_path: Path) -> None:
+    old = style(tmp_path, "old-0123456789abcdef.css", 1)
+    new = style(tmp_path, "new-0123456789abcdef.css", 2)
+    assets = tmp_path / cache_index.ASSET_CACHE_SUBDIR
+    assets.mkdir()
+    orphan = assets / f"gone.png{url_cache.LOCK_SUFFIX}"
+    orphan.touch()
+
+    assert cache_index.prune(tmp_path, max_size=150) == {"removed": 1, "freed": 102}
+    assert sorted(p.name for p in tmp_path.glob("*.css*")) == sorted(
+        [new.name, new.name + url_cache.META_SUFFIX, new.name + url_cache.LOCK_SUFFIX]
+    )
+    assert not old.with_name(old.name + url_cache.LOCK_SUFFIX).exists()
+    assert not orphan.exists()
+
+
+@pytest.mark.skipif(os.name == "nt", reason="flock")
+def test_prune_keeps_a_lock_in_use(tmp_path: Path) -> None:
+    lock = tmp_path / f"fetching-0123456789abcdef.css{url_cache.LOCK_SUFFIX}"
+    with url_cache.file_lock(lock):
+        cache_index.prune(tmp_path, max_size=0)
+        assert lock.exists()
+    cache_index.prune(tmp_path, max_size=0)
+    assert not lock.exists()
@@ -0,0 +1,77 @@
+"""Conversion cache keys: what invalidates an entry and what does not."""
+from __future__ import annotations
+
+import argparse
+import os
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from from2to.conversion_cache import ConversionCache
+
+
+@pytest.fixture
+def doc(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.chdir(tmp_path)
+    md = tmp_path / "doc.md"
+    md.write_text("# Title\n", encoding="utf-8")
+    return md
+
+
+def key(cache: ConversionCache, md: Path, css: str = "", **options: object) -> str:
+    args = argparse.Namespace(output=None, toc=False, pandoc_arg=None, **options)
+    return cache.key(md, args, css, ".html", md.with_suffix(".html"))
+
+
+def test_key_is_stable_and_ignores_output_location(doc: Path, tmp_path: Path) -> None:
+    cache = ConversionCache(tmp_path / "c")
+    assert key(cache, doc) == key(cache, doc)
+    args = argparse.Namespace(output="elsewhere.html", jobs=4, toc=False, pandoc_arg=None)
+    assert cache.key(doc, args, "", ".html") == key(cache, doc)
+
+
+def test_markdown_css_and_options_change_the_key(doc: Path, tmp_path: Path) -> None:
+    cache = ConversionCache(tmp_path / "c")
+    before = key(cache, doc)
+    assert key(cache, doc, css="p { color: red; }") != before
+    assert cache.key(doc, argparse.Namespace(toc=True, pandoc_arg=None), "", ".html") != before
+    doc.write_text("# Other title\n", encoding="utf-8")
+    assert key(cache, doc) != before
+
+
+@pytest.mark.parametrize("spelling", [["--template", "page.html"], ["--template=page.html"], ["-Hpage.html"]])
+def test_files_named_by_pandoc_args_are_part_of_the_key(doc: Path, tmp_path: Path, spelling: List[str]) -> None:
+    cache = ConversionCache(tmp_path / "c")
+    template = tmp_path / "page.html"
+    template.write_text("$body$", encoding="utf-8")
+    args = argparse.Namespace(toc=False, pandoc_arg=[spelling])
+    before = cache.key(doc, args, "", ".html")
+    template.write_text("<main>$body$</main>", encoding="utf-8")
+    assert cache.key(doc, args, "", ".html") != before
+
+
+def test_lookup_store_and_place(doc: Path, tmp_path: Path) -> None:
+    cache = ConversionCache(tmp_path / "c")
+    k = key(cache, doc)
+    assert cache.lookup(k, ".html") is None
+    out = tmp_path / "doc.html"
+    out.write_text("<p>x</p>", encoding="utf-8")
+    entry = cache.store(k, ".html", out)
+    assert cache.lookup(k, ".html") == entry
+    assert not ConversionCache.place(entry, out)
+    dest = tmp_path / "copy" / "doc.html"
+    assert ConversionCache.place(entry, dest)
+    assert dest.read_bytes() == entry.read_bytes()
+    assert dest.stat().st_ino != entry.stat().st_ino
+
+
+def test_prune_evicts_least_recently_used(doc: Path, tmp_path: Path) -> None:
+    cache = ConversionCache(tmp_path / "c")
+    out = tmp_path / "doc.html"
+    out.write_bytes(b"x" * 100)
+    old = cache.store("aa" + "0" * 62, ".html", out)
+    new = cache.store("bb" + "0" * 62, ".html", out)
+    os.utime(old, (1, 1))
+    assert cache.prune(150) == 1
+    assert not old.exists() and new.exists()
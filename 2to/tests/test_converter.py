@@ -0,0 +1,35 @@
+"""Converter: the library entry point shared across threads."""
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from from2to import pdf
+from from2to.converter import Converter
+
+
+def test_pdf_renders_are_serialized_across_instances(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    active = []
+    overlap = threading.Event()
+    lock = threading.Lock()
+
+    def render(html: str, base_path: Path, resolver: object = None) -> bytes:
+        with lock:
+            active.append(1)
+            if len(active) > 1:
+                overlap.set()
+        time.sleep(0.05)
+        with lock:
+            active.pop()
+        return b"%PDF"
+
+    monkeypatch.setattr(pdf, "html_to_pdf_bytes", render)
+    converters = [Converter(cache_dir=tmp_path) for _ in range(4)]
+    with ThreadPoolExecutor(max_workers=4) as threads:
+        results = list(threads.map(lambda c: c.to_pdf("# Hi", base_dir=tmp_path), converters))
+    assert results == [b"%PDF"] * 4
+    assert not overlap.is_set()
@@ -0,0 +1,173 @@
+"""scripts/fetch_styles.py against a local HTTP server standing in for the CDNs."""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Set
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+import fetch_styles as fs  # noqa: E402
+
+from from2to import url_cache  # noqa: E402
+
+
+class Upstream:
+    """Serves ``files`` by path with content-hash ETags; paths in ``failing`` answer 503."""
+
+    def __init__(self) -> None:
+        self.files: Dict[str, bytes] = {
+            "/a.css": b"body { color: black; }\n",
+            "/b.css": b"p { margin: 0; }\n",
+            "/LICENSE": b"# MIT License\n\nCopyright (c) Someone\n",
+        }
+        self.failing: Set[str] = set()
+        self.requests: List[Dict[str, str]] = []
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                upstream.requests.append({"path": self.path, **{k.lower(): v for k, v in self.headers.items()}})
+                data = upstream.files.get(self.path)
+                if self.path in upstream.failing or data is None:
+                    self.send_error(503 if data is not None else 404)
+                    return
+                etag = '"' + hashlib.sha256(data).hexdigest()[:16] + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args: object) -> None:
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}{path}"
+
+    def conditional(self, path: str) -> List[bool]:
+        """Whether each request for ``path`` was conditional."""
+        return ["if-none-match" in r for r in self.requests if r["path"] == path]
+
+
+@pytest.fixture
+def upstream(monkeypatch: pytest.MonkeyPatch) -> Iterator[Upstream]:
+    pytest.importorskip("aiohttp")
+    u = Upstream()
+    u.thread.start()
+    monkeypatch.setattr(fs, "STYLES", {u.url("/LICENSE"): [("a", u.url("/a.css")), ("b", u.url("/b.css"))]})
+    try:
+        yield u
+    finally:
+        u.httpd.shutdown()
+        u.httpd.server_close()
+
+
+@pytest.fixture
+def styles_dir(tmp_path: Path) -> Path:
+    return tmp_path / "styles" / "included"
+
+
+def update(styles_dir: Path) -> Dict[str, int]:
+    """One full run of the script, like ``main`` without arguments."""
+    manifest_path = fs.get_manifest_path(styles_dir)
+    manifest = fs.load_manifest(manifest_path)
+    counts = asyncio.run(
+        fs.fetch_all(
+            fs.filter_styles([]), styles_dir, manifest, concurrency=2, retries=1, retry_delay=0, timeout_seconds=10
+        )
+    )
+    fs.prune_removed(styles_dir, manifest)
+    fs.save_manifest(manifest_path, manifest)
+    fs.write_license_file(styles_dir, manifest)
+    return counts
+
+
+def problems(styles_dir: Path) -> List[str]:
+    return fs.verify(styles_dir, fs.load_manifest(fs.get_manifest_path(styles_dir)))
+
+
+def test_first_fetch_writes_styles_lock_and_license(upstream: Upstream, styles_dir: Path) -> None:
+    assert update(styles_dir) == {"updated": 3, "unchanged": 0, "failed": 0}
+    assert (styles_dir / "a.css").read_bytes() == upstream.files["/a.css"]
+    assert (styles_dir / "b.css").read_bytes() == upstream.files["/b.css"]
+    assert "Copyright (c) Someone" in (styles_dir.parent / "LICENSE.md").read_text(encoding="utf-8")
+    for path in (styles_dir / "a.css", styles_dir.parent / "LICENSE.md", fs.get_manifest_path(styles_dir)):
+        assert path.stat().st_mode & 0o777 == url_cache.file_mode()
+    assert problems(styles_dir) == []
+
+
+def test_unchanged_upstream_is_revalidated_with_304(upstream: Upstream, styles_dir: Path) -> None:
+    update(styles_dir)
+    before = (styles_dir / "a.css").stat()
+    assert update(styles_dir) == {"updated": 0, "unchanged": 3, "failed": 0}
+    assert upstream.conditional("/a.css") == [False, True]
+    assert upstream.conditional("/LICENSE") == [False, True]
+    after = (styles_dir / "a.css").stat()
+    assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)
+    assert problems(styles_dir) == []
+
+
+def test_changed_upstream_rewrites_only_that_style(upstream: Upstream, styles_dir: Path) -> None:
+    update(styles_dir)
+    untouched = (styles_dir / "b.css").stat().st_mtime_ns
+    upstream.files["/a.css"] = b"body { color: navy; }\n"
+    assert update(styles_dir) == {"updated": 1, "unchanged": 2, "failed": 0}
+    assert (styles_dir / "a.css").read_bytes() == upstream.files["/a.css"]
+    assert (styles_dir / "b.css").stat().st_mtime_ns == untouched
+    assert problems(styles_dir) == []
+
+
+def test_failed_download_keeps_the_locked_file(upstream: Upstream, styles_dir: Path) -> None:
+    update(styles_dir)
+    upstream.files["/a.css"] = b"body { color: red; }\n"
+    upstream.failing.add("/a.css")
+    assert update(styles_dir)["failed"] == 1
+    assert (styles_dir / "a.css").read_bytes() == b"body { color: black; }\n"
+    assert problems(styles_dir) == []
+
+
+def test_failed_first_fetch_is_not_locked(upstream: Upstream, styles_dir: Path) -> None:
+    upstream.failing.add("/b.css")
+    assert update(styles_dir)["failed"] == 1
+    assert not (styles_dir / "b.css").exists()
+    assert problems(styles_dir) == ["b: not in styles.lock.json"]
+
+
+def test_verify_detects_tampering(upstream: Upstream, styles_dir: Path) -> None:
+    update(styles_dir)
+    (styles_dir / "a.css").write_bytes(b"body { color: red; }\n")
+    (styles_dir / "extra.css").write_bytes(b"")
+    (styles_dir / "b.css").unlink()
+    assert problems(styles_dir) == [
+        "a: a.css does not match its sha256",
+        "b: b.css is missing",
+        "extra.css: not in STYLES",
+    ]
+
+
+def test_verify_detects_stale_license_file(upstream: Upstream, styles_dir: Path) -> None:
+    update(styles_dir)
+    license_file = styles_dir.parent / "LICENSE.md"
+    license_file.write_text(license_file.read_text(encoding="utf-8") + "edited\n", encoding="utf-8")
+    assert problems(styles_dir) == ["LICENSE.md: out of date"]
+
+
+def test_bundled_styles_match_the_committed_lock() -> None:
+    styles_dir = fs.get_styles_dir()
+    assert fs.get_manifest_path(styles_dir).is_file()
+    assert fs.verify(styles_dir, fs.load_manifest(fs.get_manifest_path(styles_dir))) == []
@@ -0,0 +1,65 @@
+"""Font subsets for --subset-fonts, one per character set."""
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from from2to import fonts
+
+
+def make_font(path: Path, chars: str) -> None:
+    """A TrueType font named ``Test-Regular`` with a square glyph for each of ``chars``."""
+    from fontTools.fontBuilder import FontBuilder
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+
+    def square() -> object:
+        pen = TTGlyphPen(None)
+        pen.moveTo((100, 0))
+        pen.lineTo((100, 500))
+        pen.lineTo((400, 500))
+        pen.lineTo((400, 0))
+        pen.closePath()
+        return pen.glyph()
+
+    chars = "".join(dict.fromkeys(chars))
+    names = [".notdef"] + [f"uni{ord(c):04X}" for c in chars]
+    fb = FontBuilder(1000, isTTF=True)
+    fb.setupGlyphOrder(names)
+    fb.setupCharacterMap({ord(c): name for c, name in zip(chars, names[1:])})
+    fb.setupGlyf({name: square() for name in names})
+    fb.setupHorizontalMetrics({name: (500, 100) for name in names})
+    fb.setupHorizontalHeader(ascent=800, descent=-200)
+    fb.setupNameTable({"familyName": "Test", "styleName": "Regular", "psName": "Test-Regular"})
+    fb.setupOS2()
+    fb.setupPost()
+    fb.save(str(path))
+
+
+def ps_name(path: Path) -> str:
+    from fontTools.ttLib import TTFont
+
+    with TTFont(str(path)) as font:
+        return str(font["name"].getDebugName(6))
+
+
+def test_font_faces_get_a_name_per_character_set() -> None:
+    css = "@font-face { font-family: 'Lato', serif; src: url(a.ttf) }\np { font-family: Lato }"
+    a = fonts.name_faces(css, frozenset("ab"))
+    b = fonts.name_faces(css, frozenset("Łódź"))
+    tag = fonts.face_tag(frozenset("ab"))
+    assert f"font-family: 'lato-{tag}', 'lato';" in a
+    assert a != b
+    assert a.endswith("p { font-family: Lato }")
+
+
+def test_documents_with_other_characters_get_their_own_subset(tmp_path: Path) -> None:
+    pytest.importorskip("fontTools")
+    font = tmp_path / "Test.ttf"
+    make_font(font, fonts.BASE_CHARS + "Łódź Ærø")
+    first = fonts.subset_font(font, frozenset(fonts.BASE_CHARS), tmp_path / "cache")
+    second = fonts.subset_font(font, frozenset(fonts.BASE_CHARS + "Łódź"), tmp_path / "cache")
+    assert first != second != font
+    assert ps_name(first) != ps_name(second)
+    assert ps_name(second) == f"Test-Regular-{fonts.face_tag(frozenset(fonts.BASE_CHARS + 'Łódź'))}"
+    assert fonts.subset_font(font, frozenset(fonts.BASE_CHARS), tmp_path / "cache") == first
@@ -0,0 +1,43 @@
+"""The warm pandoc worker: a hung worker is killed and the request falls back."""
+from __future__ import annotations
+
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from from2to import pandoc_worker as pw
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="uses a shell script as pandoc")
+
+
+@pytest.fixture
+def hanging_pandoc(tmp_path: Path) -> str:
+    # reads the request and never answers
+    script = tmp_path / "pandoc"
+    script.write_text("#!/bin/sh\nread line\nexec sleep 60\n", encoding="utf-8")
+    script.chmod(0o755)
+    return str(script)
+
+
+def test_request_times_out_and_kills_the_worker(hanging_pandoc: str) -> None:
+    worker = pw.PandocWorker(hanging_pandoc, timeout=0.2)
+    worker.start()
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        worker.request({"text": "# Hi", "to": "html"})
+    assert time.monotonic() - started < 5
+    assert not worker.alive
+    worker.close()
+
+
+def test_convert_text_drops_a_hung_worker(hanging_pandoc: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    worker = pw.PandocWorker(hanging_pandoc, timeout=0.2)
+    worker.start()
+    monkeypatch.setattr(pw, "_worker", worker)
+    monkeypatch.setattr(pw, "get_worker", lambda: pw._worker)
+    # None makes the caller run a regular pandoc subprocess
+    assert pw.convert_text("# Hi", to="html") is None
+    assert pw._worker is None
+    assert not worker.alive
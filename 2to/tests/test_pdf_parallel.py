@@ -0,0 +1,97 @@
+"""Parallel PDF rendering: splitting at top-level sections and merging the chunks."""
+from __future__ import annotations
+
+import io
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from from2to import pdf_parallel
+
+
+def document(sections: int, toc: bool = False, extra: str = "") -> str:
+    body = ["<h1>Book</h1>"]
+    if toc:
+        body.append("<ul>" + "".join(f'<li><a href="#s{i}">Part {i}</a></li>' for i in range(1, sections + 1)) + "</ul>")
+    for i in range(1, sections + 1):
+        body.append(f'<h2 id="s{i}">Part {i}</h2>' + "".join(f"<p>Paragraph {i}.{n}</p>" for n in range(20)))
+    return f"<html><head><title>Book</title></head><body>{extra}{''.join(body)}</body></html>"
+
+
+def test_layout_splits_at_the_repeated_heading_level() -> None:
+    html = document(4)
+    page = pdf_parallel.layout(html)
+    assert page is not None
+    assert [html[offset : offset + 12] for offset in page.sections] == ['<h2 id="s1">', '<h2 id="s2">', '<h2 id="s3">', '<h2 id="s4">']
+    assert [h.text for h in page.headings] == ["Book", "Part 1", "Part 2", "Part 3", "Part 4"]
+
+
+@pytest.mark.parametrize(
+    "html",
+    [
+        "<html><body><h2>Only</h2><p>one</p></body></html>",
+        "<html><body><h2>A</h2><div><h2>B</h2></body></html>",
+        "<p>no body</p>",
+    ],
+)
+def test_layout_refuses_documents_it_cannot_split(html: str) -> None:
+    assert pdf_parallel.layout(html) is None
+
+
+@pytest.mark.parametrize("chunks", [1, 2, 3, 4, 8])
+def test_plan_chunks_covers_the_body_in_order(chunks: int) -> None:
+    page = pdf_parallel.layout(document(4))
+    assert page is not None
+    ranges = pdf_parallel.plan_chunks(page, chunks)
+    assert 1 <= len(ranges) <= min(chunks, 4)
+    assert ranges[0][0] == page.body_start and ranges[-1][1] == page.body_end
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    assert all(start in page.sections for start, _ in ranges[1:])
+
+
+def test_documents_with_page_numbers_render_in_one_piece(monkeypatch: pytest.MonkeyPatch) -> None:
+    rendered: List[str] = []
+
+    def render(html: str, base_path: Path, resolver: object) -> bytes:
+        rendered.append(html)
+        return b"%PDF"
+
+    monkeypatch.setattr(pdf_parallel, "_render", render)
+    html = document(4, extra="<div>Page <pdf:pagenumber></div>")
+    assert pdf_parallel.html_to_pdf_bytes_parallel(html, Path("_"), jobs=4) == b"%PDF"
+    assert rendered == [html]
+
+
+def test_merged_pdf_keeps_bookmarks_and_links_across_chunks(tmp_path: Path) -> None:
+    pytest.importorskip("xhtml2pdf")
+    pypdf = pytest.importorskip("pypdf")
+
+    html = document(4, toc=True)
+    data = pdf_parallel.html_to_pdf_bytes_parallel(html, tmp_path / "_", jobs=2)
+    reader = pypdf.PdfReader(io.BytesIO(data))
+
+    outline = []
+
+    def walk(items: list, depth: int) -> None:
+        for item in items:
+            if isinstance(item, list):
+                walk(item, depth + 1)
+            else:
+                outline.append((depth, item.title, reader.get_destination_page_number(item)))
+
+    walk(reader.outline, 0)
+    assert [(depth, title) for depth, title, _ in outline] == [(0, "Book")] + [(1, f"Part {i}") for i in range(1, 5)]
+    pages = {title: number for _, title, number in outline}
+    # the second chunk starts on a new page
+    assert pages["Part 3"] > pages["Part 2"]
+
+    # the table of contents links into the second chunk point at its pages
+    targets = []
+    for ref in reader.pages[0].get("/Annots") or []:
+        annot = ref.get_object()
+        action = annot.get("/A")
+        assert action is None or not str(action.get("/URI", "")).startswith(pdf_parallel.LINK_SCHEME)
+        if "/Dest" in annot:
+            targets.append(reader.get_page_number(annot["/Dest"][0].get_object()))
+    assert targets[-2:] == [pages["Part 3"], pages["Part 4"]]
@@ -0,0 +1,43 @@
+"""--style a,b: one output per style and an index page linking them."""
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from from2to import targets
+
+cli = pytest.importorskip("_2html.cli")
+
+
+@pytest.fixture
+def doc(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.chdir(tmp_path)
+    md = tmp_path / "doc.md"
+    md.write_text("# Title\n\nSome text.\n", encoding="utf-8")
+    return md
+
+
+def test_index_links_only_the_outputs_written(doc: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture) -> None:
+    def fail(html: str, input_md: Path, out_path: Path, *args: object) -> None:
+        raise RuntimeError("render failed")
+
+    monkeypatch.setattr(targets, "write_pdf", fail)
+    status = cli.main([str(doc), "-s", "new,water", "--to", "html,pdf", "-o", "prev/doc.html", "--cache-dir", "cache"])
+    assert status == 1
+    out = capsys.readouterr().out.splitlines()
+    # the index comes last, after every output
+    assert out[-1] == f"Wrote: {Path('prev/doc.styles.html')}"
+    index = Path("prev/doc.styles.html").read_text(encoding="utf-8")
+    assert 'href="doc.new.html"' in index and 'href="doc.water.html"' in index
+    assert ".pdf" not in index
+    assert not list(Path("prev").glob("*.pdf"))
+
+
+@pytest.mark.parametrize("output", ["prev/", "prev"])
+def test_output_directory_for_a_single_input(doc: Path, output: str, capsys: pytest.CaptureFixture) -> None:
+    if output == "prev":
+        Path("prev").mkdir()
+    assert cli.main([str(doc), "-s", "new,water", "-o", output, "--cache-dir", "cache"]) == 0
+    assert sorted(p.name for p in Path("prev").iterdir()) == ["doc.new.html", "doc.styles.html", "doc.water.html"]
+    assert not list(Path(".").glob("*.html"))
@@ -0,0 +1,179 @@
+"""2to-serve: asset confinement for untrusted documents, request validation and the wait queue."""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+import pytest
+
+from from2to import assets
+from from2to import serve
+from from2to import timings
+
+
+@pytest.fixture
+def roots(tmp_path: Path) -> Path:
+    root = tmp_path / "assets"
+    (root / "img").mkdir(parents=True)
+    (root / "img" / "a.png").write_bytes(b"png")
+    (tmp_path / "secret.png").write_bytes(b"secret")
+    return root
+
+
+def test_references_inside_the_roots_resolve(roots: Path) -> None:
+    resolver = assets.AssetResolver(roots, roots=[roots])
+    assert resolver.resolve("img/a.png") == str(roots / "img" / "a.png")
+    assert resolver.resolve(str(roots / "img" / "a.png")) == str(roots / "img" / "a.png")
+    assert resolver.resolve("data:image/png;base64,AAAA") == "data:image/png;base64,AAAA"
+
+
+@pytest.mark.parametrize(
+    "uri",
+    [
+        "../secret.png",
+        "img/../../secret.png",
+        "{tmp}/secret.png",
+        "file://{tmp}/secret.png",
+        "/etc/passwd",
+        "https://example.com/a.png",
+        "missing.png",
+    ],
+)
+def test_references_outside_the_roots_are_blocked(roots: Path, uri: str) -> None:
+    resolver = assets.AssetResolver(roots, roots=[roots])
+    assert resolver.resolve(uri.format(tmp=roots.parent)) == assets.BLOCKED
+
+
+@pytest.mark.skipif(os.name == "nt", reason="symlinks need privileges")
+def test_symlinks_out_of_the_roots_are_blocked(roots: Path) -> None:
+    (roots / "link.png").symlink_to(roots.parent / "secret.png")
+    resolver = assets.AssetResolver(roots, roots=[roots])
+    assert resolver.resolve("link.png") == assets.BLOCKED
+
+
+class FakePool:
+    """Stands in for ``WorkerPool``: records jobs and answers or raises ``error``."""
+
+    size = 1
+    waiting = 0
+    busy = 0
+    queue_depth = 0
+    timeout = 1.0
+
+    def __init__(self) -> None:
+        self.jobs: List[serve.Job] = []
+        self.error: Any = None
+
+    async def run(self, job: serve.Job) -> bytes:
+        self.jobs.append(job)
+        if self.error is not None:
+            raise self.error
+        return b"<p>ok</p>"
+
+
+@pytest.fixture
+def server() -> Iterator[serve.Server]:
+    s = serve.Server(FakePool(), "github", ["github.css", "water.css"], max_body=1024)  # type: ignore[arg-type]
+    try:
+        yield s
+    finally:
+        timings.remove_hook(s.metrics.observe_stage)
+
+
+def exchange(server: serve.Server, raw: bytes) -> Tuple[int, Dict[str, str], bytes]:
+    async def go() -> bytes:
+        srv = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        async with srv:
+            reader, writer = await asyncio.open_connection(*srv.sockets[0].getsockname()[:2])
+            writer.write(raw)
+            await writer.drain()
+            reply = await reader.read()
+            writer.close()
+            return reply
+
+    head, _, body = asyncio.run(go()).partition(b"\r\n\r\n")
+    status_line, *lines = head.decode("latin-1").split("\r\n")
+    headers = {name.lower(): value.strip() for name, _, value in (line.partition(":") for line in lines)}
+    return int(status_line.split(" ")[1]), headers, body
+
+
+def post(path: str, body: bytes = b"# Hi") -> bytes:
+    return f"POST {path} HTTP/1.1\r\nHost: x\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+
+
+def test_known_style_is_converted(server: serve.Server) -> None:
+    status, headers, body = exchange(server, post("/html?style=water&toc=1"))
+    assert (status, body) == (200, b"<p>ok</p>")
+    assert headers["content-type"] == serve.CONTENT_TYPES["html"]
+    assert server.pool.jobs == [("html", "# Hi", "water", None, True)]  # type: ignore[attr-defined]
+
+
+@pytest.mark.parametrize("style", ["../../etc/passwd", "/etc/passwd", "https://example.com/evil.css", "nope"])
+def test_styles_other_than_known_names_are_rejected(server: serve.Server, style: str) -> None:
+    status, _, body = exchange(server, post(f"/pdf?style={style}"))
+    assert status == 400 and b"Unknown style" in body
+    assert server.pool.jobs == []  # type: ignore[attr-defined]
+
+
+@pytest.mark.parametrize(
+    "raw, status",
+    [
+        (post("/html", b"\xff\xfe"), 400),
+        (b"garbage\r\n\r\n", 400),
+        (b"POST /html HTTP/1.1\r\nContent-Length: x\r\n\r\n", 400),
+        (b"POST /html HTTP/1.1\r\n\r\n", 411),
+        (post("/html", b"x" * 2048), 413),
+        (b"GET /html HTTP/1.1\r\n\r\n", 405),
+        (post("/docx"), 404),
+    ],
+)
+def test_bad_requests(server: serve.Server, raw: bytes, status: int) -> None:
+    assert exchange(server, raw)[0] == status
+    assert server.pool.jobs == []  # type: ignore[attr-defined]
+
+
+def test_full_queue_answers_429(server: serve.Server) -> None:
+    server.pool.error = serve.QueueFull()  # type: ignore[attr-defined]
+    status, headers, _ = exchange(server, post("/html"))
+    assert status == 429 and headers["retry-after"] == "1"
+
+
+class BlockingWorker:
+    """Stands in for ``_Worker``: every call waits for ``release``."""
+
+    release = threading.Event()
+
+    def __init__(self, ctx: Any, options: Dict[str, Any], style: str) -> None:
+        pass
+
+    def call(self, job: serve.Job) -> Tuple[bool, Any, List[timings.StageTiming]]:
+        self.release.wait(5)
+        return True, job[1].encode("utf-8"), []
+
+    def kill(self) -> None:
+        pass
+
+
+def test_pool_queues_up_to_its_depth(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(serve, "_Worker", BlockingWorker)
+    BlockingWorker.release.clear()
+
+    async def go() -> List[Any]:
+        pool = serve.WorkerPool(1, {}, "github", queue_depth=1, timeout=5)
+        try:
+            running = asyncio.ensure_future(pool.run(("html", "a", "github", None, False)))
+            await asyncio.sleep(0.05)
+            waiting = asyncio.ensure_future(pool.run(("html", "b", "github", None, False)))
+            await asyncio.sleep(0.05)
+            assert (pool.busy, pool.waiting) == (1, 1)
+            with pytest.raises(serve.QueueFull):
+                await pool.run(("html", "c", "github", None, False))
+            BlockingWorker.release.set()
+            return list(await asyncio.gather(running, waiting))
+        finally:
+            pool.close()
+
+    assert asyncio.run(go()) == [b"a", b"b"]
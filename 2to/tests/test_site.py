@@ -0,0 +1,93 @@
+"""Incremental site builds (``2html --site SRC DST``)."""
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from from2to import site
+
+cli = pytest.importorskip("_2html.cli")
+
+
+@pytest.fixture
+def tree(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.chdir(tmp_path)
+    src = tmp_path / "docs"
+    (src / "guide").mkdir(parents=True)
+    (src / "index.md").write_text("# Home\n", encoding="utf-8")
+    (src / "guide" / "start.md").write_text("# Start\n", encoding="utf-8")
+    return src
+
+
+def test_site_flag_builds_the_tree(tree: Path) -> None:
+    assert cli.main(["--site", "docs", "site", "--cache-dir", "cache"]) == 0
+    assert (Path("site") / "index.html").is_file()
+    assert (Path("site") / "guide" / "start.html").is_file()
+    assert (Path("site") / site.DB_NAME).is_file()
+
+
+def test_a_directory_named_build_is_converted_not_built(tree: Path) -> None:
+    build = Path("build")
+    build.mkdir()
+    (build / "notes.md").write_text("# Notes\n", encoding="utf-8")
+    assert cli.main(["build", "-o", "out/", "--cache-dir", "cache"]) == 0
+    assert (Path("out") / "notes.html").is_file()
+    assert not (Path("out") / site.DB_NAME).exists()
+
+
+def build(capsys: pytest.CaptureFixture, *extra: str) -> str:
+    """Build docs/ into site/ and return the summary line."""
+    assert cli.main(["--site", "docs", "site", "--cache-dir", "cache", *extra]) == 0
+    return capsys.readouterr().out.splitlines()[-1]
+
+
+def test_unchanged_tree_rebuilds_nothing(tree: Path, capsys: pytest.CaptureFixture) -> None:
+    assert build(capsys) == "2 pages rebuilt, 0 up to date, 0 removed"
+    assert build(capsys) == "0 pages rebuilt, 2 up to date, 0 removed"
+
+
+def test_only_changed_pages_are_rebuilt(tree: Path, capsys: pytest.CaptureFixture) -> None:
+    build(capsys)
+    page = tree / "guide" / "start.md"
+    page.touch()
+    assert build(capsys) == "0 pages rebuilt, 2 up to date, 0 removed"
+    page.write_text("# Start again\n", encoding="utf-8")
+    assert build(capsys) == "1 pages rebuilt, 1 up to date, 0 removed"
+    assert "Start again" in (Path("site") / "guide" / "start.html").read_text(encoding="utf-8")
+
+
+def test_images_are_dependencies_and_copied(tree: Path, capsys: pytest.CaptureFixture) -> None:
+    (tree / "index.md").write_text("# Home\n\n![logo](logo.png)\n", encoding="utf-8")
+    (tree / "logo.png").write_bytes(b"v1")
+    build(capsys)
+    assert (Path("site") / "logo.png").read_bytes() == b"v1"
+    (tree / "logo.png").write_bytes(b"v2")
+    assert build(capsys) == "1 pages rebuilt, 1 up to date, 0 removed"
+    assert (Path("site") / "logo.png").read_bytes() == b"v2"
+
+
+def test_pandoc_includes_and_the_style_rebuild_every_page(tree: Path, capsys: pytest.CaptureFixture) -> None:
+    header = Path("header.html")
+    include = "--pandoc-arg=--include-in-header=header.html"
+    header.write_text("<meta name='v' content='1'>", encoding="utf-8")
+    build(capsys, include)
+    header.write_text("<meta name='v' content='2'>", encoding="utf-8")
+    assert build(capsys, include) == "2 pages rebuilt, 0 up to date, 0 removed"
+    assert "content='2'" in (Path("site") / "index.html").read_text(encoding="utf-8")
+    assert build(capsys, include, "-s", "water") == "2 pages rebuilt, 0 up to date, 0 removed"
+
+
+def test_deleted_sources_are_removed_from_the_site(tree: Path, capsys: pytest.CaptureFixture) -> None:
+    build(capsys)
+    (tree / "guide" / "start.md").unlink()
+    assert build(capsys) == "0 pages rebuilt, 1 up to date, 1 removed"
+    assert not (Path("site") / "guide" / "start.html").exists()
+    assert (Path("site") / "index.html").is_file()
+
+
+def test_a_missing_output_is_rebuilt(tree: Path, capsys: pytest.CaptureFixture) -> None:
+    build(capsys)
+    (Path("site") / "index.html").unlink()
+    assert build(capsys) == "1 pages rebuilt, 1 up to date, 0 removed"
+    assert (Path("site") / "index.html").is_file()
@@ -0,0 +1,34 @@
+"""The no-op CLI paths must not import pandoc, CSS, PDF or cache code (see scripts/bench_startup.py)."""
+from __future__ import annotations
+
+import importlib.util
+import subprocess
+import sys
+from typing import List
+
+import pytest
+
+# from2to modules the CLIs may import to parse their arguments
+LIGHT = {"from2to", "from2to.cli_common", "from2to.constants", "from2to.style_utils", "from2to.url_cache"}
+HEAVY_PREFIXES = ("pypandoc", "xhtml2pdf", "reportlab", "fontTools", "rich.console")
+
+
+def imported_after(code: str) -> List[str]:
+    script = f"""
+import sys
+{code}
+print("\\n".join(sorted(sys.modules)))
+"""
+    proc = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    return proc.stdout.split()
+
+
+@pytest.mark.parametrize("module", ["_2pdf.cli", "_2html.cli"])
+@pytest.mark.parametrize("argv", [[], ["--list-styles"]])
+def test_cli_paths_import_no_heavy_modules(module: str, argv: List[str]) -> None:
+    if importlib.util.find_spec(module.split(".")[0]) is None:
+        pytest.skip(f"{module} is not installed")
+    code = f"import {module}" if not argv else f"from {module} import main\nmain({argv!r})"
+    modules = imported_after(code)
+    assert [m for m in modules if m.startswith("from2to") and m not in LIGHT] == []
+    assert [m for m in modules if m.startswith(HEAVY_PREFIXES)] == []
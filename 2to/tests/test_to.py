@@ -0,0 +1,44 @@
+"""--to: several formats from one parse, reported under the names they are written to."""
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+cli = pytest.importorskip("_2html.cli")
+
+
+@pytest.fixture
+def doc(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.chdir(tmp_path)
+    md = tmp_path / "doc.md"
+    md.write_text("# Title\n\nSome text.\n", encoding="utf-8")
+    return md
+
+
+def run(capsys: pytest.CaptureFixture, *argv: str) -> str:
+    assert cli.main([*argv, "--cache-dir", "cache"]) == 0
+    return capsys.readouterr().out
+
+
+def test_single_input_reports_the_file_written(doc: Path, capsys: pytest.CaptureFixture) -> None:
+    pytest.importorskip("xhtml2pdf")
+    out = run(capsys, str(doc), "--to", "pdf", "-o", "x/out.html")
+    assert out.splitlines() == [f"Wrote: {Path('x/out.pdf')}"]
+    assert Path("x/out.pdf").read_bytes().startswith(b"%PDF")
+    assert not Path("x/out.html").exists()
+
+
+def test_every_format_is_reported(doc: Path, capsys: pytest.CaptureFixture) -> None:
+    pytest.importorskip("xhtml2pdf")
+    out = run(capsys, str(doc), "--to", "html,pdf", "-o", "x/out.html")
+    assert out.splitlines() == [f"Wrote: {Path('x/out.html')}", f"Wrote: {Path('x/out.pdf')}"]
+    assert "<h1" in Path("x/out.html").read_text(encoding="utf-8")
+    assert Path("x/out.pdf").read_bytes().startswith(b"%PDF")
+
+
+def test_html_only_matches_a_plain_run(doc: Path, capsys: pytest.CaptureFixture) -> None:
+    run(capsys, str(doc), "-o", "plain.html")
+    out = run(capsys, str(doc), "--to", "html", "-o", "to.html")
+    assert out.splitlines() == ["Wrote: to.html"]
+    assert Path("to.html").read_text(encoding="utf-8") == Path("plain.html").read_text(encoding="utf-8")
@@ -0,0 +1,168 @@
+"""URL style cache against a local HTTP server standing in for the style host."""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import pytest
+
+from from2to import style_utils as su
+from from2to import url_cache
+
+
+class StyleServer:
+    """Serves ``body`` under any path with an ETag, answering 304 to a matching If-None-Match."""
+
+    def __init__(self) -> None:
+        self.body = b"body { color: black; }\n"
+        self.etag: Optional[str] = '"v1"'
+        self.status: Optional[int] = None  # forced status, e.g. 500
+        self.requests: List[Dict[str, str]] = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                server.requests.append({k.lower(): v for k, v in self.headers.items()})
+                if server.status is not None:
+                    self.send_error(server.status)
+                    return
+                if server.etag is not None and self.headers.get("If-None-Match") == server.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                if server.etag is not None:
+                    self.send_header("ETag", server.etag)
+                self.send_header("Content-Length", str(len(server.body)))
+                self.end_headers()
+                self.wfile.write(server.body)
+
+            def log_message(self, *args: object) -> None:
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, path: str = "/styles/paper.css") -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}{path}"
+
+
+@pytest.fixture
+def server() -> Iterator[StyleServer]:
+    s = StyleServer()
+    s.thread.start()
+    try:
+        yield s
+    finally:
+        s.httpd.shutdown()
+        s.httpd.server_close()
+
+
+def test_first_fetch_writes_entry_and_sidecar(server: StyleServer, tmp_path: Path) -> None:
+    entry = url_cache.fetch(server.url(), tmp_path)
+    assert entry.parent == tmp_path
+    assert entry.name.startswith("paper-") and entry.suffix == ".css"
+    assert entry.read_bytes() == server.body
+    meta = json.loads(url_cache.meta_path(entry).read_text(encoding="utf-8"))
+    assert meta["url"] == server.url()
+    assert meta["etag"] == '"v1"'
+    assert len(server.requests) == 1
+
+
+def test_urls_with_the_same_file_name_get_separate_entries(server: StyleServer, tmp_path: Path) -> None:
+    a = url_cache.fetch(server.url("/a/paper.css"), tmp_path)
+    server.body = b"p { margin: 0; }\n"
+    b = url_cache.fetch(server.url("/b/paper.css"), tmp_path)
+    assert a != b
+    assert a.read_bytes() != b.read_bytes()
+
+
+def test_fresh_entry_is_reused_without_a_request(server: StyleServer, tmp_path: Path) -> None:
+    first = url_cache.fetch(server.url(), tmp_path)
+    server.body = b"changed"
+    assert url_cache.fetch(server.url(), tmp_path) == first
+    assert first.read_bytes() != b"changed"
+    assert len(server.requests) == 1
+
+
+def test_stale_entry_is_revalidated_with_its_etag(server: StyleServer, tmp_path: Path) -> None:
+    entry = url_cache.fetch(server.url(), tmp_path)
+    before = url_cache.read_meta(entry)["fetched_at"]
+    assert url_cache.fetch(server.url(), tmp_path, ttl=0) == entry
+    assert server.requests[-1]["if-none-match"] == '"v1"'
+    assert entry.read_bytes() == server.body
+    assert url_cache.read_meta(entry)["fetched_at"] >= before
+
+
+def test_changed_upstream_replaces_the_entry(server: StyleServer, tmp_path: Path) -> None:
+    entry = url_cache.fetch(server.url(), tmp_path)
+    server.body, server.etag = b"body { color: navy; }\n", '"v2"'
+    assert url_cache.fetch(server.url(), tmp_path, ttl=0) == entry
+    assert entry.read_bytes() == server.body
+    assert url_cache.read_meta(entry)["etag"] == '"v2"'
+
+
+def test_stale_entry_is_kept_when_the_server_fails(server: StyleServer, tmp_path: Path) -> None:
+    entry = url_cache.fetch(server.url(), tmp_path)
+    body = entry.read_bytes()
+    server.status = 500
+    assert url_cache.fetch(server.url(), tmp_path, ttl=0) == entry
+    assert entry.read_bytes() == body
+
+
+def test_failed_first_fetch_raises_and_leaves_nothing(server: StyleServer, tmp_path: Path) -> None:
+    server.status = 404
+    with pytest.raises(OSError):
+        url_cache.fetch(server.url(), tmp_path)
+    assert not list(tmp_path.glob("*.css"))
+
+
+def test_atomic_write_mode_and_no_temp_files(tmp_path: Path) -> None:
+    target = tmp_path / "style.css"
+    url_cache.atomic_write(target, b"a")
+    url_cache.atomic_write(target, b"b")
+    assert target.read_bytes() == b"b"
+    assert target.stat().st_mode & 0o777 == url_cache.file_mode()
+    assert [p.name for p in tmp_path.iterdir()] == ["style.css"]
+
+
+def test_interrupted_atomic_write_keeps_the_old_file(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    target = tmp_path / "style.css"
+    target.write_bytes(b"old")
+
+    def fail(src: str, dst: str) -> None:
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        url_cache.atomic_write(target, b"new")
+    assert target.read_bytes() == b"old"
+    assert [p.name for p in tmp_path.iterdir()] == ["style.css"]
+
+
+def test_cached_styles_are_listed_and_found_by_display_name(server: StyleServer, tmp_path: Path) -> None:
+    entry = url_cache.fetch(server.url(), tmp_path)
+    registry = su.StyleRegistry(tmp_path)
+    assert [info.name for info in registry.styles("cached")] == ["paper.css"]
+    for name in ("paper", "paper.css", entry.name):
+        info = registry.find(name)
+        assert info is not None and info.path == entry
+
+
+def test_style_placed_by_hand_survives_a_fetch_and_shadows_the_entry(server: StyleServer, tmp_path: Path) -> None:
+    own = tmp_path / "paper.css"
+    own.write_bytes(b"mine")
+    entry = url_cache.fetch(server.url(), tmp_path)
+    assert own.read_bytes() == b"mine"
+
+    registry = su.StyleRegistry(tmp_path)
+    assert sorted(info.name for info in registry.styles("cached")) == sorted(["paper.css", entry.name])
+    info = registry.find("paper")
+    assert info is not None and info.path == own
+    info = registry.find(entry.name)
+    assert info is not None and info.path == entry
+    assert url_cache.fetch(server.url(), tmp_path) == entry